@@ -28,16 +28,21 @@ from aiapy.calibrate.util import get_correction_table
 from sunpy.time import parse_time
 
 # Pointing correction
-def Pointing_correction(aia_map):
+def Pointing_correction(aia_map, tables=None):
     """
     We consider the satellite's attitude changes and movements to adjust the positioning of AIA images.
+    With `tables` (CalibrationTables) the pointing table is taken from the local cache.
     """
-    ref_date = parse_time(aia_map.date.isot)
-    # select a lmsal or jsoc
-    pointing_tbl = get_pointing_table(
-        "jsoc", 
-        time_range=(ref_date - 6*u.hour, ref_date + 6*u.hour)
-    )
+    # update_pointing selects the row by T_OBS (reference_date), not DATE-OBS
+    if tables is not None:
+        pointing_tbl = tables.pointing_table(aia_map.reference_date.isot)
+    else:
+        ref_date = parse_time(aia_map.reference_date.isot)
+        # select a lmsal or jsoc
+        pointing_tbl = get_pointing_table(
+            "jsoc", 
+            time_range=(ref_date - 6*u.hour, ref_date + 6*u.hour)
+        )
     if aia_map.meta.get("SAT_ROT") is None:
         aia_map.meta["SAT_ROT"] = 0.0
     
@@ -59,12 +64,13 @@ def Registration(aia_map):
     return aia_map_reg
 
 # Degradation correction 
-def Degradation_correction(aia_map):
+def Degradation_correction(aia_map, tables=None):
     """
     We calibrate the degradation of AIA data to ensure 
     that the physical brightness is consistent across different channels.
+    With `tables` (CalibrationTables) the correction table is loaded once per process.
     """
-    corr_tbl = get_correction_table("SSW")
+    corr_tbl = tables.correction_table() if tables is not None else get_correction_table("SSW")
     aia_map_cal = aiapy.calibrate.correct_degradation(
         aia_map, 
         correction_table=corr_tbl
@@ -83,13 +89,15 @@ def Exposure_normalization(aia_map):
     return aia_map_norm
 
 # Main function to convert level 1 to level 1.5
-def convert_to_level1_5(aia_map):
+def convert_to_level1_5(aia_map, tables=None):
     """
     Convert SDO/AIA data from level 1 to level 1.5.
+    `tables`: optional CalibrationTables (table_cache.py) to avoid per-image downloads.
     """
-    aia_map = Pointing_correction(aia_map)      # Step 1: Pointing correction
-    aia_map = Registration(aia_map)             # Step 4: Registration
-    aia_map = Degradation_correction(aia_map)   # Step 5: Degradation correction
+    aia_map = Pointing_correction(aia_map, tables)      # Step 1: Pointing correction
+    aia_map = Registration(aia_map)                     # Step 4: Registration
+    aia_map = Degradation_correction(aia_map, tables)   # Step 5: Degradation correction
     aia_map = Exposure_normalization(aia_map)   # Step 6: Exposure normalization
 
-    return aia_map
\ No newline at end of file
+    return aia_map
+
@@ -0,0 +1,188 @@
+"""
+SQLite manifest of completed level 1 -> level 1.5 conversions.
+
+Re-running `run_convert_to_level1_5.py` used to `strptime` every file name and
+`stat` every output file before the first conversion.  The manifest records
+each converted input (size, mtime of the input, output file) when its future
+completes, so the work list of a directory is
+
+    {level 1 files in the date range} - {inputs in the manifest}
+
+from one directory listing and one query.  Dates are compared as strings
+('2016-12-31T235959Z' sorts like the time it stands for), nothing is parsed.
+
+Directories converted before the manifest existed are adopted once from a
+listing of their output directory.  `verify` compares the recorded size and
+mtime with the directory listing and checks that the recorded output is still
+a whole FITS file; inputs which changed or lost their output are forgotten,
+so they are converted again.
+
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+
+
+TS_FMT = '%Y-%m-%dT%H%M%SZ'           # time stamp in the file names
+FITS_BLOCK = 2880                     # a complete FITS file is a multiple of this size
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS converted (
+    input       TEXT PRIMARY KEY,
+    source_dir  TEXT NOT NULL,
+    size        INTEGER,
+    mtime_ns    INTEGER,
+    output      TEXT,
+    converted   TEXT
+);
+CREATE INDEX IF NOT EXISTS converted_dir ON converted (source_dir);
+CREATE TABLE IF NOT EXISTS adopted (
+    source_dir  TEXT PRIMARY KEY
+);
+"""
+
+
+def output_name(name: str) -> str:
+    """
+    Level 1.5 file name of a level 1 file name.
+
+    """
+    return name.replace("lev1", "lev1_5")
+
+
+def output_complete(path) -> bool:
+    """
+    True if the output file exists and is not truncated (whole FITS blocks).
+
+    """
+    try:
+        size = os.stat(path).st_size
+    except (FileNotFoundError, TypeError):
+        return False
+    return size > 0 and size % FITS_BLOCK == 0
+
+
+def list_inputs(source_dir: Path, start: datetime, end: datetime):
+    """
+    Level 1 FITS files of `source_dir` whose time stamp lies in [start, end].
+
+    반환: dict {file name: os.DirEntry}
+    """
+    lo, hi = start.strftime(TS_FMT), end.strftime(TS_FMT)
+    try:
+        entries = os.scandir(source_dir)
+    except FileNotFoundError:
+        return {}
+    with entries:
+        inputs = {}
+        for entry in entries:
+            parts = entry.name.split(".")
+            # 'aia.lev1_euv_12s.2016-12-31T235959Z.211.image_lev1.fits'
+            if len(parts) < 4 or parts[-1] != "fits" or len(parts[2]) != len(lo):
+                continue
+            if lo <= parts[2] <= hi:
+                inputs[entry.name] = entry
+        return inputs
+
+
+class ConversionManifest:
+    """
+    Completed conversions, keyed by the input path.
+
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def done(self, source_dir: Path):
+        """
+        File names of the converted inputs of `source_dir`.
+
+        """
+        rows = self.conn.execute("SELECT input FROM converted WHERE source_dir = ?",
+                                 (str(source_dir),))
+        return {Path(p).name for p, in rows}
+
+    def record(self, input_path, output_path, size=None, mtime_ns=None):
+        """
+        Mark one input as converted (one transaction, safe against interruption).
+
+        """
+        input_path = Path(input_path)
+        if size is None or mtime_ns is None:
+            st = input_path.stat()
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO converted VALUES (?, ?, ?, ?, ?, ?)",
+                (str(input_path), str(input_path.parent), int(size), int(mtime_ns),
+                 str(output_path), datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def adopt(self, source_dir: Path, destination_dir: Path, inputs):
+        """
+        Record the inputs whose output already exists, once per directory
+        (outputs written before the manifest existed).
+
+        """
+        row = self.conn.execute("SELECT 1 FROM adopted WHERE source_dir = ?",
+                                (str(source_dir),)).fetchone()
+        if row is not None:
+            return 0
+        try:
+            with os.scandir(destination_dir) as entries:
+                outputs = {entry.name for entry in entries}
+        except FileNotFoundError:
+            outputs = set()
+
+        rows = []
+        for name, entry in inputs.items():
+            out = output_name(name)
+            if out in outputs:
+                st = entry.stat()
+                rows.append((str(source_dir / name), str(source_dir), st.st_size,
+                             st.st_mtime_ns, str(destination_dir / out), None))
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO converted VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT INTO adopted VALUES (?)", (str(source_dir),))
+        return len(rows)
+
+    def verify(self, source_dir: Path, inputs):
+        """
+        Forget the converted inputs whose size or mtime changed since conversion,
+        or whose output file was deleted or truncated.
+
+        반환: number of inputs to convert again
+        """
+        recorded = self.conn.execute(
+            "SELECT input, size, mtime_ns, output FROM converted WHERE source_dir = ?",
+            (str(source_dir),)
+        ).fetchall()
+
+        changed = []
+        for path, size, mtime_ns, output in recorded:
+            entry = inputs.get(Path(path).name)
+            if entry is None:
+                continue                    # outside the date range or removed
+            st = entry.stat()
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns) or not output_complete(output):
+                changed.append((path,))
+        with self.conn:
+            self.conn.executemany("DELETE FROM converted WHERE input = ?", changed)
+        return len(changed)
+
+    def todo(self, source_dir: Path, inputs):
+        """
+        Sorted file names of `inputs` not converted yet (one set difference).
+
+        """
+        return sorted(set(inputs) - self.done(source_dir))
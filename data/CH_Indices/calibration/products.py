@@ -0,0 +1,141 @@
+"""
+Reduced level 1.5 output products for CH index extraction.
+
+A full level 1.5 image is a 4096² float64 array (~128 MB), but the CH
+indices only use the central meridian band of the disk.  A product can be
+
+  binned      n x n superpixels (mean, so the values stay in DN/s)
+  float32     half the size of float64
+  compressed  RICE_1 tile compression (lossy quantization of float data)
+  cropped     columns |Tx| <= R_sun sin(crop_lon) (+ margin), rows of the disk
+
+The settings are written to the FITS header (PRODBIN, PRODCROP, PRODTYPE) so
+that `processing.extract_indices` knows which product it reads, and to a
+`product.json` file in the output directory for the whole run (also for the
+default full resolution float64 product).
+
+Binning is not exact for P_CH: P_CH = sum(1/pixel), and a binned product
+gives sum(1/mean) x bin², which is lower wherever a superpixel mixes bright
+and dark pixels (1/x is convex).  RICE quantization can turn dark pixels
+into tiny values, so `processing.compute_P_CH` leaves out pixels below
+`processing.RICE_MIN_DN` in compressed products.
+
+"""
+
+import json
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import astropy.units as u
+from astropy.io import fits
+from astropy.coordinates import SkyCoord
+
+import aiapy
+
+
+CROP_MARGIN = 8     # pixels kept on each side of the band
+
+
+def bin_map(aia_map, factor):
+    """
+    Average `factor` x `factor` pixel blocks.
+
+    """
+    if factor == 1:
+        return aia_map
+    return aia_map.superpixel((factor, factor) * u.pixel, func=np.mean)
+
+
+def crop_band(aia_map, crop_lon):
+    """
+    Crop to the central meridian band |lon| <= crop_lon and the rows of the disk.
+
+    A point (lon, lat) of the disk has Tx = R cos(lat) sin(lon) for any B0,
+    so every pixel of the band lies within |Tx| <= R sin(crop_lon).
+    """
+    rsun = aia_map.rsun_obs
+    margin = CROP_MARGIN * u.pixel * aia_map.scale.axis1
+    half_x = rsun * np.sin(np.deg2rad(crop_lon)) + margin
+    half_y = rsun + margin
+
+    bottom_left = SkyCoord(-half_x, -half_y, frame=aia_map.coordinate_frame)
+    top_right = SkyCoord(half_x, half_y, frame=aia_map.coordinate_frame)
+    return aia_map.submap(bottom_left, top_right=top_right)
+
+
+def make_product(aia_map, bin=1, dtype=None, crop_lon=None, compress=None):
+    """
+    Reduce a level 1.5 map and record the settings in its header.
+
+    """
+    aia_map = bin_map(aia_map, bin)
+    if crop_lon is not None:
+        aia_map = crop_band(aia_map, crop_lon)
+
+    meta = aia_map.meta.copy()
+    data = aia_map.data
+    if dtype is not None:
+        data = data.astype(dtype)
+        meta['bitpix'] = -32 if np.dtype(dtype) == np.float32 else -64
+
+    meta['prodbin'] = int(bin)
+    meta['prodcrop'] = float(crop_lon) if crop_lon is not None else 0.0     # 0: full disk
+    meta['prodtype'] = f"{np.dtype(data.dtype).name}/{compress or 'none'}"
+    return aia_map._new_instance(data, meta, plot_settings=aia_map.plot_settings)
+
+
+def save_product(aia_map, outfile, compress=None):
+    """
+    Save a (reduced) map, RICE compressed if `compress == 'rice'`.
+
+    """
+    if compress == 'rice':
+        aia_map.save(outfile, hdu_type=fits.CompImageHDU(compression_type='RICE_1'),
+                     overwrite=True)
+    else:
+        aia_map.save(outfile, overwrite=True)
+
+
+def product_settings(bin=1, dtype=None, crop_lon=None, compress=None):
+    return {
+        "level": 1.5,
+        "bin": int(bin),
+        "dtype": np.dtype(dtype).name if dtype is not None else "float64",
+        "compress": compress or "none",
+        "crop_lon": crop_lon,
+        "aiapy": aiapy.__version__,
+    }
+
+
+def read_provenance(save_dir):
+    """
+    Settings of the `product.json` of a directory, None if there is none.
+
+    """
+    path = Path(save_dir) / "product.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def write_provenance(save_dir, settings):
+    """
+    Write (or check) `product.json` of an output directory.
+
+    Mixing products in one directory would make the index values
+    inconsistent, so a different existing product is an error.
+    """
+    path = Path(save_dir) / "product.json"
+    if path.exists():
+        existing = json.loads(path.read_text())
+        same = {k: v for k, v in existing.items() if k not in ("created", "aiapy")}
+        new = {k: v for k, v in settings.items() if k not in ("created", "aiapy")}
+        if same != new:
+            raise ValueError(f"{path} describes a different product: {existing}")
+        return existing
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    settings = {**settings, "created": datetime.now().isoformat(timespec='seconds')}
+    path.write_text(json.dumps(settings, indent=2))
+    return settings
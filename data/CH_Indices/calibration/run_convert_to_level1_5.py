@@ -12,20 +12,60 @@ from tqdm import tqdm
 
 import sunpy
 from sunpy.time import parse_time
-from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from convert_to_level1_5 import convert_to_level1_5
+from table_cache import CalibrationTables
+from products import make_product, save_product, product_settings, write_provenance
+from manifest import ConversionManifest, list_inputs, output_name
+from scheduler import MemoryAwareScheduler
 import warnings
 
+# Calibration tables and output product settings of this worker process
+_TABLES = None
+_PRODUCT = None
+
+def init_worker(tables, product=None):
+    global _TABLES, _PRODUCT
+    _TABLES = tables
+    _PRODUCT = product
+
+def save_level1_5(aia_map, outfile: str):
+    """
+    Save a level 1.5 map as the requested product (full resolution float64 by default)
+    """
+    product = _PRODUCT or {}
+    # may replace an unrecorded file of an interrupted run
+    save_product(make_product(aia_map, **product), outfile, compress=product.get("compress"))
+
 def process_and_save(infile: str, outfile: str):
     """
     Save a FITS file after converting to level 1.5
     """
     aia_map = sunpy.map.Map(infile)
-    aia_map_new = convert_to_level1_5(aia_map)
+    aia_map_new = convert_to_level1_5(aia_map, _TABLES)
     
-    aia_map_new.save(outfile)
+    save_level1_5(aia_map_new, outfile)
+
+def process_single(pairs):
+    """
+    Scheduler task of one file: [(infile, outfile)]
+    """
+    (infile, outfile), = pairs
+    process_and_save(infile, outfile)
+    return []
+
+def process_and_save_batch(pairs):
+    """
+    Convert and save a batch of (infile, outfile), one file after another.
+    반환: list of (infile, error message), empty if all files were saved
+    """
+    errors = []
+    for inp, outp in pairs:
+        try:
+            process_and_save(inp, outp)
+        except Exception as e:
+            errors.append((inp, str(e)))
+    return errors
 
 def main():
     parser = argparse.ArgumentParser(
@@ -43,7 +83,38 @@ def main():
                         help="directory to save a level 1.5 FITS files (e.g, D:\Data\EUV)")
     parser.add_argument("--cores", type=int, default=4,
                         help="number of cores to use for processing")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="files converted one after another in one task, with one "
+                             "memory measurement and log line per task (1 = one file per task)")
+    parser.add_argument("--table_cache", type=str, default=None,
+                        help="directory of cached pointing/correction tables (see table_cache.py)")
+    parser.add_argument("--offline", action="store_true",
+                        help="use only the cached tables, never download")
+    parser.add_argument("--bin", type=int, default=1, choices=[1, 2, 4],
+                        help="save n x n binned images (mean of the pixels)")
+    parser.add_argument("--dtype", type=str, default=None, choices=["float32", "float64"],
+                        help="data type of the saved images (default: float64)")
+    parser.add_argument("--compress", type=str, default=None, choices=["rice"],
+                        help="RICE_1 tile compression (lossy for float data)")
+    parser.add_argument("--crop_lon", type=float, default=None,
+                        help="keep only the central meridian band |lon| <= crop_lon (deg); "
+                             "must cover the largest index longitude (e.g, 15)")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="SQLite manifest of converted files (default: <save_directory>/conversion_manifest.sqlite)")
+    parser.add_argument("--verify", action="store_true",
+                        help="re-convert inputs whose size or mtime changed since their conversion, "
+                             "or whose output is missing or truncated")
+    parser.add_argument("--mem_fraction", type=float, default=0.8,
+                        help="fraction of the available memory the running tasks may use")
+    parser.add_argument("--task_gb", type=float, default=None,
+                        help="initial peak memory estimate per task in GB (default: measure one task first)")
+    parser.add_argument("--max_tasks_per_child", type=int, default=None,
+                        help="replace a worker process after this many tasks")
+    parser.add_argument("--log_file", type=str, default=None,
+                        help="CSV log of task time and memory (default: <save_directory>/conversion_log.csv)")
     args = parser.parse_args()
+    if args.offline and args.table_cache is None:
+        parser.error("--offline needs --table_cache (the tables are downloaded without it)")
 
     parent_dir = Path(args.file_directory)
     save_dir   = Path(args.save_directory)
@@ -54,46 +125,78 @@ def main():
     channels = [chan.strip() for chan in args.channel.split(',')]   # e.g., [193,211]
     years = range(start_dt.year, end_dt.year + 1)
 
-    for chan in channels:
-        for year in years:
-            source_dir = parent_dir / str(chan) / str(year)
-            destination_dir = save_dir / str(chan)/ str(year)
-            destination_dir.mkdir(parents=True, exist_ok=True)
-
-            destination_files = []
-            for file in sorted(source_dir.glob("*.fits")):
-                try:
-                    file_dt = datetime.strptime(file.stem.split(".")[2],
-                                                "%Y-%m-%dT%H%M%SZ")
-                except Exception:
-                    continue
-                if not (start_dt <= file_dt <= end_dt):
-                    continue
-
-                outpath = destination_dir / file.name.replace("lev1", "lev1_5")
-                if outpath.exists():
-                    continue
-
-                destination_files.append((str(file), str(outpath)))
-
-            if not destination_files:
-                continue
-
-            with ProcessPoolExecutor(max_workers=args.cores) as executor:
-                futures = {
-                    executor.submit(process_and_save, inp, outp): (inp, outp)
-                    for inp, outp in destination_files
-                }
-
-                for future in tqdm(as_completed(futures),
-                                   total=len(futures),
-                                   desc=f"EUV {chan} | year={year}",
-                                   unit="file"):
-                    inp, outp = futures[future]
-                    try:
-                        future.result()
-                    except Exception as e:
-                        tqdm.write(f"[ERROR] {Path(inp).name} -> {e}")
+    # product.json is written (or checked) for every run, the default product included
+    product = dict(bin=args.bin, dtype=args.dtype, crop_lon=args.crop_lon,
+                   compress=args.compress)
+    write_provenance(save_dir, product_settings(**product))
+
+    tables = None
+    if args.table_cache is not None:
+        tables = CalibrationTables(args.table_cache, offline=args.offline)
+        if not args.offline:
+            # one download per block instead of one per image
+            tables.prefetch_pointing(start_dt, end_dt)
+            tables.correction_table()
+
+    manifest = ConversionManifest(Path(args.manifest) if args.manifest
+                                  else save_dir / "conversion_manifest.sqlite")
+
+    try:
+        task_fn = process_and_save_batch if args.batch_size > 1 else process_single
+        scheduler = MemoryAwareScheduler(args.cores,
+                                         mem_fraction=args.mem_fraction,
+                                         task_gb=args.task_gb,
+                                         max_tasks_per_child=args.max_tasks_per_child,
+                                         log_file=Path(args.log_file) if args.log_file
+                                                  else save_dir / "conversion_log.csv",
+                                         initializer=init_worker,
+                                         initargs=(tables, product))
+        with scheduler:
+            for chan in channels:
+                for year in years:
+                    source_dir = parent_dir / str(chan) / str(year)
+                    destination_dir = save_dir / str(chan)/ str(year)
+                    destination_dir.mkdir(parents=True, exist_ok=True)
+
+                    # one listing per directory, the rest is a set difference
+                    inputs = list_inputs(source_dir, start_dt, end_dt)
+                    manifest.adopt(source_dir, destination_dir, inputs)
+                    if args.verify:
+                        n_changed = manifest.verify(source_dir, inputs)
+                        if n_changed:
+                            print(f"EUV {chan} | year={year}: {n_changed} changed inputs")
+
+                    destination_files = [(str(source_dir / name), str(destination_dir / output_name(name)))
+                                         for name in manifest.todo(source_dir, inputs)]
+
+                    if not destination_files:
+                        continue
+
+                    step = max(args.batch_size, 1)
+                    batches = [destination_files[i:i + step]
+                               for i in range(0, len(destination_files), step)]
+
+                    with tqdm(total=len(destination_files),
+                              desc=f"EUV {chan} | year={year}",
+                              unit="file") as pbar:
+                        # at most K tasks in flight, K from the measured memory per task
+                        for batch, result, error in scheduler.run(task_fn, batches,
+                                                                  name=lambda b: Path(b[0][0]).name,
+                                                                  size=len):
+                            errors = dict(result or [])
+                            if error is not None:
+                                errors = {inp: error for inp, _ in batch}
+                            for inp, err in errors.items():
+                                tqdm.write(f"[ERROR] {Path(inp).name} -> {err}")
+
+                            # record the converted inputs as soon as they are saved
+                            for inp, outp in batch:
+                                if inp not in errors:
+                                    st = inputs[Path(inp).name].stat()
+                                    manifest.record(inp, outp, st.st_size, st.st_mtime_ns)
+                            pbar.update(len(batch))
+    finally:
+        manifest.close()
 
     print("All conversions finished.")
 
@@ -105,4 +208,4 @@ if __name__ == '__main__':
 
 # conda activate venv
 # cd Research\SR_SWspeed\data\CH_Indices\calibration
-# python run_convert_to_level1_5.py --channel "193,211" --start "2012-01-01" --end "2024-12-31" --file_directory "E:\Research\SR\input\CH_Indices\EUV_level1" --save_directory "D:\Research_data\EUV"
\ No newline at end of file
+# python run_convert_to_level1_5.py --channel "193,211" --start "2012-01-01" --end "2024-12-31" --file_directory "E:\Research\SR\input\CH_Indices\EUV_level1" --save_directory "D:\Research_data\EUV" --table_cache "D:\Research_data\EUV\calibration_tables" --batch_size 16
\ No newline at end of file
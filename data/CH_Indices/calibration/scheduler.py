@@ -0,0 +1,289 @@
+"""
+Memory-aware bounded submission for `ProcessPoolExecutor` conversion jobs.
+
+Submitting a whole year of files at once keeps every pending future in
+memory, and `--cores` alone does not bound the memory of the workers: one
+bicubic registration of a 4096² float64 map peaks at several GB.
+`MemoryAwareScheduler` keeps at most K tasks in flight, where
+
+    K = min(max_workers, cap, in flight + free memory // peak RSS per task)
+
+The peak RSS is measured in the workers for every task (and starts from one
+probe task unless `task_gb` is given).  The free memory is a fraction of the
+memory available now (re-read whenever K is computed) minus what the tasks
+in flight have yet to allocate (their estimate minus the current RSS of the
+workers).  Workers are replaced after `max_tasks_per_child` tasks to limit
+heap fragmentation.
+
+If a worker dies (e.g. killed by the OOM killer) the pool is broken: every
+task in flight is reported as failed, a new pool takes the remaining tasks
+and the cap drops to one less than the tasks which were in flight.  The cap
+goes up by one again after every `max_workers` tasks finished without error.
+
+Each task is logged (CSV) with its duration, peak RSS and status.
+
+"""
+
+import os
+import sys
+import csv
+import time
+import itertools
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import psutil
+except ImportError:     # optional, /proc or resource are used without it
+    psutil = None
+
+
+LOG_FIELDS = ("task", "n_files", "pid", "started", "duration_s", "peak_rss_mb", "status", "error")
+
+
+def available_memory():
+    """
+    Memory available to new processes in bytes (None if unknown).
+
+    """
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def process_rss(pid):
+    """
+    Current resident memory of process `pid` in bytes (0 if unknown).
+
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            pass
+    return 0
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak RSS of this process where the OS allows it (Linux).
+
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process in bytes (since the last reset on Linux).
+
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)        # Windows: peak working set
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_measured(fn, args):
+    """
+    Worker side: run `fn(*args)` and measure its duration and peak RSS.
+
+    반환: (result, error message or None, pid, started, duration, peak RSS)
+    """
+    _reset_peak_rss()
+    started = datetime.now().isoformat(timespec='seconds')
+    t0 = time.perf_counter()
+    try:
+        result, error = fn(*args), None
+    except Exception as e:
+        result, error = None, f"{type(e).__name__}: {e}"
+    return result, error, os.getpid(), started, time.perf_counter() - t0, peak_rss()
+
+
+class MemoryAwareScheduler:
+    """
+    Bounded submission of tasks to one `ProcessPoolExecutor`.
+
+    max_workers:         worker processes (upper bound of K)
+    mem_fraction:        fraction of the available memory the tasks may use
+    task_gb:             initial peak memory estimate per task; None -> probe one task first
+    max_tasks_per_child: recycle a worker after this many tasks (Python >= 3.11)
+    log_file:            CSV log of every task
+
+    """
+
+    def __init__(self, max_workers, mem_fraction=0.8, task_gb=None, max_tasks_per_child=None,
+                 log_file=None, initializer=None, initargs=()):
+        self.max_workers = max_workers
+        self.mem_fraction = mem_fraction
+        self.task_bytes = task_gb * 1024**3 if task_gb else None
+        self.log_file = Path(log_file) if log_file is not None else None
+        self.in_flight = 0
+        self.cap = max_workers          # lowered after a broken pool, raised again by successes
+        self._successes = 0
+
+        self._kwargs = dict(initializer=initializer, initargs=initargs)
+        if max_tasks_per_child is not None:
+            self._kwargs["max_tasks_per_child"] = max_tasks_per_child
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, **self._kwargs)
+
+        if self.log_file is not None and not self.log_file.exists():
+            self.log_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_file, "w", newline="") as f:
+                csv.writer(f).writerow(LOG_FIELDS)
+
+    def workers_rss(self):
+        """
+        Current resident memory of the worker processes in bytes.
+
+        """
+        processes = getattr(self.executor, "_processes", None) or {}
+        return sum(process_rss(pid) for pid in list(processes))
+
+    @property
+    def budget(self):
+        """
+        Memory new tasks may use: a fraction of the memory available now,
+        minus what the tasks in flight have not allocated yet.
+
+        """
+        available = available_memory()
+        if available is None:
+            return None
+        growth = max(0, self.in_flight * (self.task_bytes or 0) - self.workers_rss())
+        return self.mem_fraction * available - growth
+
+    @property
+    def limit(self):
+        """
+        Current number of tasks allowed in flight (K).
+
+        """
+        if self.task_bytes is None:
+            return 1                                    # probe the first task
+        bound = min(self.max_workers, self.cap)
+        budget = self.budget
+        if budget is None:
+            return bound
+        return int(max(1, min(bound, self.in_flight + budget // self.task_bytes)))
+
+    def _restart(self, n_lost):
+        """
+        Replace a broken pool; the cap drops below the number of tasks lost with it.
+
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if n_lost:
+            self.cap = max(1, min(self.cap, n_lost) - 1)
+        self._successes = 0
+        print(f"worker pool broken ({n_lost} tasks lost), restarting with "
+              f"at most {self.cap} tasks in flight")
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, **self._kwargs)
+
+    def _finish(self, future, task, name, size):
+        """
+        Result of a finished future, logged and folded into the memory estimate.
+
+        """
+        try:
+            result, error, pid, started, duration, peak = future.result()
+        except Exception as e:                  # worker died (e.g. out of memory)
+            result, error, pid, started, duration, peak = (
+                None, f"{type(e).__name__}: {e}", "", "", 0.0, 0)
+        if peak:
+            self.task_bytes = max(self.task_bytes or 0, peak)
+        if error is None and self.cap < self.max_workers:
+            self._successes += 1
+            if self._successes >= self.max_workers:         # recover one slot at a time
+                self.cap, self._successes = self.cap + 1, 0
+        self._log(name(task), size(task), (pid, started, duration, peak), error)
+        return task, result, error
+
+    def _log(self, name, n_files, stats, error):
+        if self.log_file is None:
+            return
+        pid, started, duration, peak = stats
+        with open(self.log_file, "a", newline="") as f:
+            csv.writer(f).writerow((name, n_files, pid, started, round(duration, 3),
+                                    round(peak / 1024**2, 1), "error" if error else "ok",
+                                    error or ""))
+
+    def run(self, fn, tasks, name=str, size=lambda task: 1):
+        """
+        Run `fn(task)` for every task with at most `limit` tasks in flight.
+
+        name: label of a task in the log,  size: number of files of a task
+
+        반환: generator of (task, result, error message or None) in completion order
+        """
+        tasks = iter(tasks)
+        pending = {}
+        exhausted = False
+        while True:
+            broken = False
+            while not exhausted and len(pending) < self.limit:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                try:
+                    future = self.executor.submit(run_measured, fn, (task,))
+                except BrokenProcessPool:
+                    tasks = itertools.chain([task], tasks)      # submitted again to the new pool
+                    broken = True
+                    break
+                pending[future] = task
+                self.in_flight = len(pending)
+            if not pending and not broken:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            if broken or any(isinstance(f.exception(), BrokenProcessPool) for f in done):
+                # a broken pool fails every task in flight
+                done, _ = wait(pending)
+                self._restart(len(pending))
+            for future in done:
+                task = pending.pop(future)
+                self.in_flight = len(pending)
+                yield self._finish(future, task, name, size)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
@@ -0,0 +1,203 @@
+"""
+Local cache of the calibration tables used by the level 1.5 conversion.
+
+`Pointing_correction` used to download a ±6 h pointing table from the JSOC
+for every image, and `Degradation_correction` the SSW correction table for
+every image in every worker.  `CalibrationTables` instead
+
+1. fetches the pointing table in large blocks (default 30 days) and stores
+   each block as ECSV in `cache_dir`,
+2. picks the 3 h pointing interval of each image from the cached block,
+3. loads the correction table once per process (from `cache_dir` if cached).
+
+With `offline=True` nothing is downloaded; a missing table raises
+`CalibrationCacheMiss`.
+
+Usage (prefetch):
+  python table_cache.py \
+    --start "2012-01-01" \
+    --end "2024-12-31" \
+    --cache_dir "D:/Data/EUV/calibration_tables"
+
+"""
+
+import os
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import numpy as np
+import astropy.units as u
+from astropy.table import QTable
+from astropy.time import Time
+from aiapy.calibrate.util import get_pointing_table
+from aiapy.calibrate.util import get_correction_table
+from tqdm import tqdm
+
+from sunpy.time import parse_time
+
+
+BLOCK_EPOCH = datetime(2010, 1, 1)      # SDO/AIA first light is 2010
+
+
+class CalibrationCacheMiss(LookupError):
+    """
+    Raised in offline mode when a table is not in the cache.
+
+    """
+
+
+def _write_ecsv(table, path: Path):
+    tmp = path.with_name(path.name + ".tmp")
+    table.write(tmp, format="ascii.ecsv", overwrite=True)
+    os.replace(tmp, path)
+
+
+class CalibrationTables:
+    """
+    Pointing and degradation-correction tables backed by a local cache.
+
+    Only paths and settings are pickled, so an instance can be passed to
+    `ProcessPoolExecutor` workers; each process keeps its own loaded tables.
+
+    """
+
+    def __init__(self, cache_dir, pointing_source="jsoc", correction_source="SSW",
+                 block_days=30, offline=False):
+        self.cache_dir = Path(cache_dir)
+        self.pointing_source = pointing_source
+        self.correction_source = correction_source
+        self.block_days = block_days
+        self.offline = offline
+
+        self._pointing = {}             # block start -> QTable
+        self._correction = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_pointing={}, _correction=None)
+        return state
+
+    # Pointing table
+    def _block(self, date: datetime):
+        n = (date - BLOCK_EPOCH) // timedelta(days=self.block_days)
+        start = BLOCK_EPOCH + n * timedelta(days=self.block_days)
+        return start, start + timedelta(days=self.block_days)
+
+    def _pointing_path(self, start: datetime, end: datetime) -> Path:
+        return self.cache_dir / (f"pointing_{self.pointing_source}_"
+                                 f"{start:%Y%m%d}_{end:%Y%m%d}.ecsv")
+
+    def pointing_block(self, date):
+        """
+        Cached pointing table of the block containing `date`
+        (padded by 6 h on both sides, as the per-image query was).
+
+        """
+        date = parse_time(date).to_datetime()
+        start, end = self._block(date)
+        if start in self._pointing:
+            return self._pointing[start]
+
+        path = self._pointing_path(start, end)
+        if path.exists():
+            table = QTable.read(path, format="ascii.ecsv")
+        elif self.offline:
+            raise CalibrationCacheMiss(f"pointing table {path.name} is not cached")
+        else:
+            table = get_pointing_table(
+                self.pointing_source,
+                time_range=(Time(start) - 6*u.hour, Time(end) + 6*u.hour)
+            )
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            _write_ecsv(table, path)
+
+        self._pointing[start] = table
+        return table
+
+    def pointing_table(self, date):
+        """
+        Pointing table rows around `date`: the 3 h interval containing it and
+        its neighbours.
+
+        `update_pointing` picks the row of T_OBS (`aia_map.reference_date`),
+        which can lie in the next interval when DATE-OBS is just before a
+        boundary, so the choice of the row is left to it.
+        """
+        table = self.pointing_block(date)
+        t = Time(parse_time(date))
+        near = (table["T_START"] <= t + 3*u.hour) & (t - 3*u.hour < table["T_STOP"])
+        if not np.any(near):
+            # let `update_pointing` report the gap with the whole block
+            return table
+        return table[near]
+
+    def prefetch_pointing(self, start, end):
+        """
+        Download (or check) every pointing block between `start` and `end`.
+
+        """
+        current, _ = self._block(parse_time(start).to_datetime())
+        end = parse_time(end).to_datetime()
+
+        blocks = []
+        while current <= end:
+            blocks.append(current)
+            current += timedelta(days=self.block_days)
+        for block_start in tqdm(blocks, desc="pointing tables", unit="block"):
+            self.pointing_block(block_start)
+            self._pointing.clear()
+
+    # Degradation correction table
+    def correction_table(self):
+        """
+        Correction table, loaded once per process.
+
+        """
+        if self._correction is not None:
+            return self._correction
+
+        path = self.cache_dir / f"correction_{self.correction_source}.ecsv"
+        if path.exists():
+            table = QTable.read(path, format="ascii.ecsv")
+        elif self.offline:
+            raise CalibrationCacheMiss(f"correction table {path.name} is not cached")
+        else:
+            table = get_correction_table(self.correction_source)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            _write_ecsv(table, path)
+
+        self._correction = table
+        return table
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Prefetch the AIA pointing and correction tables into a local cache."
+    )
+    parser.add_argument("--start", type=str, required=True,
+                        help="start date (e.g, 2012-01-01)")
+    parser.add_argument("--end", type=str, required=True,
+                        help="end date (e.g, 2024-12-31)")
+    parser.add_argument("--cache_dir", type=str, required=True,
+                        help="directory of the cached tables")
+    parser.add_argument("--block_days", type=int, default=30,
+                        help="days of pointing table per download")
+    args = parser.parse_args()
+
+    tables = CalibrationTables(args.cache_dir, block_days=args.block_days)
+    tables.prefetch_pointing(args.start, args.end)
+    tables.correction_table()
+
+    print("All tables cached.")
+
+
+if __name__ == '__main__':
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\data\CH_Indices\calibration
+# python table_cache.py --start "2012-01-01" --end "2024-12-31" --cache_dir "D:\Data\EUV\calibration_tables"
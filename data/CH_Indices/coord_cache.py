@@ -0,0 +1,193 @@
+"""
+Disk cache of pixel -> helioprojective / heliographic coordinate grids.
+
+After level 1.5 registration every AIA frame has (almost) the same WCS, so the
+dense `pixel_to_world` + `transform_to(HeliographicStonyhurst)` of the image
+grid is the same computation repeated for every FITS file.
+This module keys that grid on the observer geometry that actually matters:
+
+    CRPIX, CDELT, RSUN_OBS, DSUN_OBS, HGLT_OBS (B0), HGLN_OBS, image shape
+
+quantized to a tolerance, and stores Tx, Ty and the Stonyhurst longitude and
+latitude as one float32 `.npy` stack per key.  Files are opened with
+`mmap_mode='r'`, so all `Pool` workers share the same pages through the OS
+page cache.
+
+The cache directory is bounded in size: the least recently used grids
+(by file mtime, refreshed on every hit) are removed first.
+
+"""
+
+import os
+import uuid
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import astropy.units as u
+
+from sunpy.coordinates import frames        # 천체 좌표계
+
+
+# Quantization step of each geometry parameter.
+# Frames whose parameters round to the same steps share one grid.
+DEFAULT_TOLERANCE = {
+    "crpix": 0.05,      # pixel
+    "cdelt": 1e-4,      # arcsec / pixel
+    "rsun": 0.5,        # arcsec
+    "dsun": 1e6,        # km
+    "b0": 0.05,         # deg
+    "l0": 0.05,         # deg
+}
+
+# Names of the layers in a cached grid stack
+GRID_LAYERS = ("Tx", "Ty", "lon", "lat")
+
+
+def geometry_params(aia_map):
+    """
+    Collect the WCS / observer parameters which determine the coordinate grid.
+
+    """
+    observer = aia_map.observer_coordinate
+    ny, nx = aia_map.data.shape
+    return {
+        "shape": (int(ny), int(nx)),
+        "crpix": (aia_map.reference_pixel.x.to_value(u.pixel),
+                  aia_map.reference_pixel.y.to_value(u.pixel)),
+        "cdelt": (aia_map.scale.axis1.to_value(u.arcsec / u.pixel),
+                  aia_map.scale.axis2.to_value(u.arcsec / u.pixel)),
+        "rsun": aia_map.rsun_obs.to_value(u.arcsec),
+        "dsun": aia_map.dsun.to_value(u.km),
+        "b0": observer.lat.to_value(u.deg),
+        "l0": observer.lon.to_value(u.deg),
+    }
+
+
+def geometry_key(aia_map, tolerance=None, window=None):
+    """
+    Return a hashable key of the quantized observer geometry.
+
+    `window` = (y0, y1, x0, x1) restricts the grid to a sub-array of the image.
+
+    """
+    tol = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+    params = geometry_params(aia_map)
+
+    key = [("shape",) + params["shape"]]
+    for name in ("crpix", "cdelt", "rsun", "dsun", "b0", "l0"):
+        values = np.atleast_1d(params[name])
+        key.append((name,) + tuple(int(np.round(v / tol[name])) for v in values))
+    if window is not None:
+        key.append(("window",) + tuple(int(v) for v in window))
+    return tuple(key)
+
+
+def compute_grids(aia_map, window=None):
+    """
+    Transform the pixel grid of `aia_map` to (Tx, Ty, Stonyhurst lon, lat).
+
+    반환: float32 array of shape (4, ny, nx), off-disk lon/lat are NaN.
+
+    """
+    ny, nx = aia_map.data.shape
+    y0, y1, x0, x1 = window if window is not None else (0, ny, 0, nx)
+    y_idx, x_idx = np.mgrid[y0:y1, x0:x1]
+
+    # Convert pixel coordinates to world coordinates
+    hpc_coords = aia_map.pixel_to_world(x_idx * u.pixel, y_idx * u.pixel)
+
+    # Convert world coordinates to heliographic coordinates
+    hgs_coords = hpc_coords.transform_to(frames.HeliographicStonyhurst)
+
+    grids = np.empty((len(GRID_LAYERS), y1 - y0, x1 - x0), dtype=np.float32)
+    grids[0] = hpc_coords.Tx.to_value(u.arcsec)
+    grids[1] = hpc_coords.Ty.to_value(u.arcsec)
+    grids[2] = hgs_coords.lon.to_value(u.deg)
+    grids[3] = hgs_coords.lat.to_value(u.deg)
+    return grids
+
+
+class CoordGridCache:
+    """
+    LRU cache of coordinate grids stored as memory-mapped `.npy` files.
+
+    The object only holds the directory and settings, so it can be passed
+    to `Pool` workers; the grids themselves are shared through the files.
+
+    """
+
+    def __init__(self, cache_dir, max_bytes=8 * 1024**3, tolerance=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self.tolerance = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr((GRID_LAYERS, key)).encode()).hexdigest()[:20]
+        return self.cache_dir / f"grid_{digest}.npy"
+
+    def get(self, aia_map, window=None):
+        """
+        Return the grid stack for `aia_map` (read-only memmap).
+        Compute and store it on a miss.
+
+        """
+        path = self._path(geometry_key(aia_map, self.tolerance, window))
+        try:
+            grids = np.load(path, mmap_mode='r')
+            os.utime(path)                          # refresh LRU position
+            return grids
+        except (FileNotFoundError, ValueError, OSError):
+            pass
+
+        grids = compute_grids(aia_map, window)
+
+        # Write to a private temp file first, then rename atomically so that
+        # concurrent workers never see a partially written grid.
+        tmp = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, 'wb') as f:
+                np.save(f, grids)
+            os.replace(tmp, path)
+        except OSError:
+            return grids
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+        self.evict(keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def size(self):
+        """
+        Total size of cached grids in bytes.
+
+        """
+        return sum(f.stat().st_size for f in self.cache_dir.glob("grid_*.npy"))
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used grids until the cache fits in `max_bytes`.
+
+        """
+        entries = []
+        for f in self.cache_dir.glob("grid_*.npy"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, f in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and f == keep:
+                continue
+            try:
+                f.unlink()
+                total -= size
+            except OSError:
+                # still mapped by another process (Windows) or already removed
+                continue
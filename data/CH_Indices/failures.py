@@ -0,0 +1,125 @@
+"""
+Structured failure records of CH index extraction.
+
+Every failed timestamp is written to a sidecar table
+`CH_Indics_<chan>.failures.csv` with a reason code, whether the failure is
+worth retrying, the processing time and the file.  A successful retry appends
+a `resolved` record, so the latest record of a timestamp is its state.
+
+Reason codes:
+    file_missing        no FITS file within the matching tolerance
+    file_read           I/O error while reading the file           (retryable)
+    file_invalid        file could not be parsed as a map
+    hek_error           HEK search / store lookup failed           (retryable)
+    hek_cache_miss      offline run and window not prefetched      (retryable)
+    degenerate_polygon  CH polygons unusable or empty slice
+    product_mismatch    reduced level 1.5 image cropped narrower than the index
+    calibration_error   level 1 -> 1.5 conversion failed (fused run)   (retryable)
+    compute_error       any other exception
+    resolved            a later retry succeeded
+
+"""
+
+import csv
+from pathlib import Path
+from datetime import datetime
+from collections import namedtuple
+
+from processing import CHIndexError
+from hek_cache import HEKCacheMiss
+
+
+TIME_FMT = '%Y-%m-%dT%H:%M:%S'
+
+FIELDS = ("datetime", "channel", "reason", "retryable", "duration_s", "file", "message")
+
+FailureRecord = namedtuple("FailureRecord", FIELDS)
+
+
+def classify(exc):
+    """
+    Map an exception to (reason, retryable).
+
+    """
+    if isinstance(exc, CHIndexError):
+        return exc.reason, exc.retryable
+    if isinstance(exc, HEKCacheMiss):
+        return "hek_cache_miss", True
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return "hek_error", True
+    return "compute_error", False
+
+
+def describe_failure(duration, exc=None, reason=None):
+    """
+    (reason, retryable, duration, message) of a failed extraction, from an
+    exception or an explicit reason code; plain values so that it pickles.
+
+    """
+    if exc is not None:
+        reason, retryable = classify(exc)
+        return reason, retryable, round(duration, 3), f"{type(exc).__name__}: {exc}"
+    return reason, False, round(duration, 3), ""
+
+
+def failure_record(dt, chan, fpath, failure):
+    """
+    Build a `FailureRecord` from the output of `describe_failure`.
+
+    """
+    reason, retryable, duration, message = failure
+    return FailureRecord(dt.strftime(TIME_FMT), str(chan), reason, retryable,
+                         duration, str(fpath), message)
+
+
+class FailureLog:
+    """
+    Append-only failure table of one channel.
+
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w', newline='') as f:
+                csv.writer(f).writerow(FIELDS)
+
+    def record(self, rec: FailureRecord):
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerow(rec)
+
+    def resolve(self, dt: datetime, chan, fpath=""):
+        """
+        Mark a previously failed timestamp as successfully re-processed.
+
+        """
+        self.record(FailureRecord(dt.strftime(TIME_FMT), str(chan), "resolved",
+                                  False, 0.0, str(fpath), ""))
+
+    def latest(self):
+        """
+        Latest record of every timestamp.
+
+        """
+        latest = {}
+        with open(self.path, newline='') as f:
+            for row in csv.DictReader(f):
+                latest[row["datetime"]] = row
+        return latest
+
+    def failed(self):
+        """
+        Timestamps whose latest record is an unresolved failure.
+
+        """
+        return {t for t, row in self.latest().items() if row["reason"] != "resolved"}
+
+    def retryable(self):
+        """
+        Datetimes whose latest record is a retryable failure.
+
+        """
+        return sorted(datetime.strptime(t, TIME_FMT)
+                      for t, row in self.latest().items()
+                      if row["reason"] != "resolved" and row["retryable"] == "True")
@@ -0,0 +1,170 @@
+"""
+Persistent per-directory index of AIA FITS file timestamps.
+
+`process_dt` used to glob the whole year directory and `strptime` every file
+name for every requested datetime.  A `FileIndex` lists the directory once,
+keeps the sorted file times as an int64 array (seconds since 1970) and finds
+the nearest file of many datetimes at once with `np.searchsorted`.
+
+The index is saved as `<index_dir>/<chan>_<year>.npz` together with the
+directory mtime; it is re-listed only when the directory changed, and then
+only the new file names are parsed.
+
+"""
+
+import os
+import fnmatch
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+TS_FMT = '%Y-%m-%dT%H%M%SZ'           # '2016-12-31T235959Z'
+EPOCH = datetime(1970, 1, 1)
+
+
+class FileIndex:
+    """
+    Sorted timestamps of the files `<prefix>.<timestamp>.<chan>.<suffix>.fits`
+    in one directory.
+
+    """
+
+    def __init__(self, source_dir, chan, index_file=None,
+                 prefix='aia.lev1_5_euv_12s', suffix='image_lev1_5'):
+        self.source_dir = Path(source_dir)
+        self.chan = str(chan)
+        self.index_file = Path(index_file) if index_file is not None else None
+        self.prefix = prefix
+        self.suffix = suffix
+        self.pattern = f"{prefix}.*Z.{self.chan}.{suffix}.fits"
+
+        self.times = np.empty(0, dtype=np.int64)    # sorted, seconds since epoch
+        self.extra = {}                             # time -> non-canonical file name
+        self.dir_mtime = None
+
+    def name(self, t) -> str:
+        """
+        Canonical file name of a timestamp in seconds.
+
+        """
+        ts = (EPOCH + timedelta(seconds=int(t))).strftime(TS_FMT)
+        return f"{self.prefix}.{ts}.{self.chan}.{self.suffix}.fits"
+
+    def _names(self):
+        return {self.name(t) for t in self.times} | set(self.extra.values())
+
+    def load(self):
+        """
+        Read the saved index (if any) and bring it up to date.
+
+        """
+        if self.index_file is not None and self.index_file.exists():
+            with np.load(self.index_file, allow_pickle=False) as saved:
+                if str(saved["source_dir"]) == str(self.source_dir):
+                    self.times = saved["times"]
+                    self.extra = dict(zip(saved["extra_times"].tolist(),
+                                          saved["extra_names"].tolist()))
+                    self.dir_mtime = int(saved["dir_mtime"])
+        self.refresh()
+        return self
+
+    def save(self):
+        if self.index_file is None:
+            return
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_name(self.index_file.name + ".tmp")
+        with open(tmp, 'wb') as f:
+            np.savez(f,
+                     source_dir=str(self.source_dir),
+                     times=self.times,
+                     extra_times=np.array(list(self.extra.keys()), dtype=np.int64),
+                     extra_names=np.array(list(self.extra.values()), dtype=str),
+                     dir_mtime=np.int64(self.dir_mtime or 0))
+        os.replace(tmp, self.index_file)
+
+    def refresh(self):
+        """
+        Re-list the directory if its mtime changed and parse only new names.
+
+        """
+        try:
+            mtime = os.stat(self.source_dir).st_mtime_ns
+        except FileNotFoundError:
+            self.times = np.empty(0, dtype=np.int64)
+            self.extra = {}
+            self.dir_mtime = None
+            return self
+        if mtime == self.dir_mtime:
+            return self
+
+        names = {e.name for e in os.scandir(self.source_dir)
+                 if fnmatch.fnmatch(e.name, self.pattern)}
+        known = self._names()
+
+        # drop removed files
+        keep = np.array([self.name(t) in names for t in self.times], dtype=bool)
+        times = self.times[keep] if self.times.size else self.times
+        extra = {t: n for t, n in self.extra.items() if n in names}
+
+        # parse new files
+        new_times = []
+        for name in names - known:
+            try:
+                # 'aia.lev1_5_euv_12s.2016-12-31T235959Z.211.image_lev1_5.fits'
+                ts_str = name.split('.')[2]                 # '2016-12-31T235959Z'
+                file_dt = datetime.strptime(ts_str, TS_FMT)
+            except Exception:
+                continue
+            t = int((file_dt - EPOCH).total_seconds())
+            if name == self.name(t):
+                new_times.append(t)
+            else:
+                extra[t] = name
+
+        self.times = np.unique(np.concatenate([times, np.array(new_times, dtype=np.int64)]))
+        self.extra = extra
+        self.dir_mtime = mtime
+        self.save()
+        return self
+
+    def match(self, dts, tolerance=60):
+        """
+        Nearest file of each datetime in `dts` within `tolerance` seconds.
+
+        반환: list of Path, a 'filenotfound' path where no file is close enough
+        """
+        missing = self.source_dir / f'{self.prefix}.filenotfound.fits'
+        extra_times = np.array(sorted(self.extra), dtype=np.int64)
+        times = np.union1d(self.times, extra_times)
+        if len(dts) == 0:
+            return []
+        if times.size == 0:
+            return [missing] * len(dts)
+
+        t = np.array([(dt - EPOCH).total_seconds() for dt in dts])
+        right = np.clip(np.searchsorted(times, t), 0, times.size - 1)
+        left = np.clip(right - 1, 0, times.size - 1)
+
+        d_left = np.abs(times[left] - t)
+        d_right = np.abs(times[right] - t)
+        best = np.where(d_right < d_left, right, left)      # ties -> earlier file
+        diff = np.minimum(d_left, d_right)
+
+        # canonical names are preferred when a time also has an extra name
+        if self.times.size:
+            pos = np.minimum(np.searchsorted(self.times, times[best]), self.times.size - 1)
+            canonical = (self.times[pos] == times[best])
+        else:
+            canonical = np.zeros(best.size, dtype=bool)
+
+        paths = []
+        for i, d, is_canonical in zip(best, diff, canonical):
+            if d > tolerance:                               # if a difference > 1-min -> none
+                paths.append(missing)
+                continue
+            t_best = int(times[i])
+            name = self.name(t_best) if is_canonical else self.extra[t_best]
+            paths.append(self.source_dir / name)
+        return paths
@@ -9,13 +9,30 @@ Usage:
     --cadence 12 \
     --base_dir "D:/Data/EUV" \
     --save_dir "D:/Data/EUV" \
-    --cores 4
+    --cores 4 \
+    --grid_cache "D:/Data/EUV/grid_cache" \
+    --indices "A_CH,P_CH30,P_CH90,THETA" \
+    --hek_cache "D:/Data/EUV/hek_cache.sqlite"
+
+Add --offline to replay a run entirely from the HEK cache
+(prefetch it first with hek_cache.py).
+
+The CSV columns follow `--indices` (see `processing.parse_index`).
+Completed timestamps are checkpointed in `CH_Indics_<chan>.csv.done`,
+so an interrupted run resumes exactly where it stopped.
+Failed timestamps are recorded with a reason code in
+`CH_Indics_<chan>.failures.csv`; --retry-failed re-runs only the retryable ones.
+
+With --level1_dir the indices are computed straight from level 1 files:
+each file is converted to level 1.5 in memory (calibration/convert_to_level1_5.py)
+and only saved if --save_level1_5 is given.
 
 """
 
-import os
+import time
 import numpy as np
 import pandas as pd
+from collections import Counter, namedtuple
 
 import argparse
 from pathlib import Path
@@ -26,109 +43,127 @@ from datetime import datetime, timedelta
 
 import multiprocessing as mp
 from multiprocessing import Pool
-from functools import partial
 
-from processing import get_A_CH, get_P_CH
+from processing import extract_indices, parse_index, open_map, CalibrationError, DEFAULT_INDICES
+from coord_cache import CoordGridCache
+from hek_cache import HEKStore
+from file_index import FileIndex
+from writer import ResultWriter
+from failures import FailureLog, describe_failure, failure_record
+from calibration.convert_to_level1_5 import convert_to_level1_5
+from calibration.table_cache import CalibrationTables
+from calibration.products import make_product, save_product, product_settings, \
+    read_provenance, write_provenance
 
 
-def get_last_processed(save_file: Path, fmt: str = '%Y-%m-%dT%H:%M:%S'):
-    """
-    Read the last line in `save_file` and parse its datetime.
+# Fused level 1 run: calibration tables and optional folder for the level 1.5 images
+Level1Options = namedtuple("Level1Options", ["tables", "save_dir"])
+
+LEVEL1_PREFIX, LEVEL1_SUFFIX = 'aia.lev1_euv_12s', 'image_lev1'
 
-    """
-    if not save_file.exists() or save_file.stat().st_size == 0:
-        return None
-    with open(save_file, 'rb') as f:
-        try:
-            # Seek from end to find start of last line
-            f.seek(-2, os.SEEK_END)
-            while f.read(1) != b'\n':
-                f.seek(-2, os.SEEK_CUR)
-        except OSError:
-            # File too small, rewind to start
-            f.seek(0)
-        # Read and decode the last line
-        last_line = f.readline().decode().strip()
-
-    if not last_line:
-        return None     # No valid line found
-    
-    # The timestamp is the first CSV field
-    last_dt_str = last_line.split(',')[0]
-    try:
-        return datetime.strptime(last_dt_str, fmt)
-    except ValueError:
-        # Format mismatch or parse error
-        return None
-    
 
-def process_dt(dt: datetime, chan: str, source_dir: Path):
+def process_dt(dt: datetime, chan: str, source_dir: Path,
+               indices=DEFAULT_INDICES, grid_cache=None, hek_store=None,
+               file_index=None):
     """
     For a given datetime `dt` and channel name, find the corresponding FITS file
     and extract CH indices.
 
+    The nearest file within 60 s is looked up in `file_index`
+    (a `file_index.FileIndex` of `source_dir`, built on the fly if not given).
+
     """
-    #prefix = dt.strftime('%Y-%m-%dT%H')
-    #pattern = f"aia.lev1_5_euv_12s.{prefix}*Z.{chan}.image_lev1_5.fits"
-    #matches = list(source_dir.glob(pattern))
-    #fpath = matches[0] if matches else source_dir / 'aia.lev1_5_euv_12s.filenotfound.fits'
-
-    pattern = f"aia.lev1_5_euv_12s.*Z.{chan}.image_lev1_5.fits"
-    matches = list(source_dir.glob(pattern))
-
-    best_file = None
-    min_diff = float('inf')
-
-    for f in matches:
-        try:
-            # 'aia.lev1_5_euv_12s.2016-12-31T235959Z.211.image_lev1_5.fits'
-            ts_str = f.name.split('.')[2]               # '2016-12-31T235959Z'
-            file_dt = datetime.strptime(ts_str, '%Y-%m-%dT%H%M%SZ')
-        except Exception:
-            continue
-        diff = abs((file_dt - dt).total_seconds())
-        if diff < min_diff:
-            min_diff = diff
-            best_file = f
-
-    if best_file is None or min_diff > 60:  # if a difference > 1-min -> none
-        fpath = source_dir / 'aia.lev1_5_euv_12s.filenotfound.fits'
-    else:
-        fpath = best_file
+    if file_index is None:
+        file_index = FileIndex(source_dir, chan).refresh()
+    fpath, = file_index.match([dt], tolerance=60)
 
-    return dt, fpath, *get_parameter(fpath)
+    return process_file((dt, fpath), indices, grid_cache, hek_store)
 
 
-def get_parameter(file: Path):
+# Per-process state, set once by `init_worker`
+_WORKER = {}
+
+
+def init_worker(indices=DEFAULT_INDICES, grid_cache=None, hek_store=None, warm_file=None,
+                reuse_masks=False, level1=None, product=None):
     """
-    Call processing functions to compute CH indices for the given FITS file.
+    Pool initializer: keep the shared settings in the worker and optionally
+    warm its caches (imports, HEK store connection, coordinate grids) by
+    processing `warm_file` once.
 
     """
-    if file.exists():
-        try:
-            t_a, a_ch = get_A_CH(file)
-            t_p30, p_ch30 = get_P_CH(file, lon=10, lat=30)
-            t_p90, p_ch90 = get_P_CH(file, lon=10, lat=90)
-            return (t_a, a_ch), (t_p30, p_ch30), (t_p90, p_ch90)
-        except Exception:
-            return np.nan, np.nan, np.nan
-    else:
-        return np.nan, np.nan, np.nan
+    _WORKER.update(indices=indices, grid_cache=grid_cache, hek_store=hek_store,
+                   reuse_masks=reuse_masks, level1=level1, product=product)
+    if warm_file is not None:
+        get_parameter(Path(warm_file), indices, grid_cache, hek_store, reuse_masks,
+                      level1._replace(save_dir=None) if level1 is not None else None, product)
+
+
+def process_task(task):
+    """
+    Worker of the flat work queue: task = (channel, datetime, FITS path).
+
+    """
+    chan, dt, fpath = task
+    _, _, values, failure = process_file((dt, fpath), **_WORKER)
+    return chan, dt, fpath, values, failure
 
 
-def write_line(save_file: Path, dt: datetime, a_ch, p_ch30, p_ch90):
+def process_file(item, indices=DEFAULT_INDICES, grid_cache=None, hek_store=None,
+                 reuse_masks=False, level1=None, product=None):
     """
-    Append a CSV line for the given datetime and CH indices values.
-    Always uses `dt` as the timestamp for consistency.
+    Extract CH indices for an already resolved (datetime, FITS path) pair.
 
     """
-    time_str = dt.strftime('%Y-%m-%dT%H:%M:%S')
-    a_val = a_ch[1] if isinstance(a_ch, tuple) else a_ch
-    p30_val = p_ch30[1] if isinstance(p_ch30, tuple) else p_ch30
-    p90_val = p_ch90[1] if isinstance(p_ch90, tuple) else p_ch90
-    line = f"{time_str},{a_val},{p30_val},{p90_val}\n"
-    with open(save_file, 'a') as f:
-        f.write(line)
+    dt, fpath = item
+    return (dt, fpath, *get_parameter(fpath, indices, grid_cache, hek_store, reuse_masks,
+                                      level1, product))
+
+
+def load_level1_5(file: Path, level1: Level1Options):
+    """
+    Read a level 1 FITS file and convert it to level 1.5 in memory.
+    The level 1.5 image is saved only if `level1.save_dir` is set
+    (as <save_dir>/<chan>/<year>/<name with lev1 -> lev1_5>).
+
+    """
+    aia_map = open_map(file)
+    try:
+        aia_map = convert_to_level1_5(aia_map, level1.tables)
+    except Exception as e:
+        raise CalibrationError(f"level 1.5 conversion failed: {file.name} -> {e}") from e
+
+    if level1.save_dir is not None:
+        chan, year = file.parent.parent.name, file.parent.name
+        outpath = Path(level1.save_dir) / chan / year / file.name.replace("lev1", "lev1_5")
+        if not outpath.exists():
+            outpath.parent.mkdir(parents=True, exist_ok=True)
+            save_product(make_product(aia_map), outpath)
+    return aia_map
+
+
+def get_parameter(file: Path, indices=DEFAULT_INDICES, grid_cache=None, hek_store=None,
+                  reuse_masks=False, level1=None, product=None):
+    """
+    Compute the CH indices in `indices` for the given FITS file,
+    opening the file only once.
+    level1:  `Level1Options` if `file` is a level 1 file to be converted first.
+    product: `product.json` settings of the level 1.5 directory (checked against every image).
+
+    반환: (values, failure), failure is None on success, otherwise
+          (reason, retryable, duration, message) from `failures.describe_failure`
+    """
+    t0 = time.perf_counter()
+    if not file.exists():
+        return [np.nan] * len(indices), describe_failure(0.0, reason="file_missing")
+    try:
+        source = load_level1_5(file, level1) if level1 is not None else file
+        _, values = extract_indices(source, indices, grid_cache=grid_cache,
+                                    hek_store=hek_store, reuse_masks=reuse_masks,
+                                    product=product)
+        return values, None
+    except Exception as e:
+        return [np.nan] * len(indices), describe_failure(time.perf_counter() - t0, exc=e)
 
 
 def main():
@@ -149,68 +184,166 @@ def main():
                         help="folder to save results CSV")
     parser.add_argument("--cores", type=int, default=1,
                         help="number of cores to use for processing")
+    parser.add_argument("--grid_cache", type=str, default=None,
+                        help="folder to cache coordinate grids (disabled if not given)")
+    parser.add_argument("--grid_cache_gb", type=float, default=8.0,
+                        help="maximum disk size of the coordinate grid cache in GB")
+    parser.add_argument("--indices", type=str, default=",".join(DEFAULT_INDICES),
+                        help="CH indices to compute (e.g., 'A_CH,P_CH30,P_CH90,THETA,P_CH60_lon15')")
+    parser.add_argument("--hek_cache", type=str, default=None,
+                        help="SQLite store of HEK CH events (default: <save_dir>/hek_cache.sqlite)")
+    parser.add_argument("--offline", action="store_true",
+                        help="replay from the HEK cache (and --table_cache) only, without network access")
+    parser.add_argument("--index_dir", type=str, default=None,
+                        help="folder of the FITS file indices (default: <save_dir>/file_index)")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="number of results buffered before each (fsync'ed) write")
+    parser.add_argument("--parquet", action="store_true",
+                        help="also write the results as Parquet parts next to the CSV")
+    parser.add_argument("--chunksize", type=int, default=4,
+                        help="tasks sent to a worker at once")
+    parser.add_argument("--warmup", action="store_true",
+                        help="warm the caches of every worker on one file before the run")
+    parser.add_argument("--retry_failed", "--retry-failed", action="store_true",
+                        help="re-process only the timestamps with a retryable failure record")
+    parser.add_argument("--fail_fast", action="store_true",
+                        help="stop at the first unexpected (compute_error) failure")
+    parser.add_argument("--reuse_masks", action="store_true",
+                        help="reuse P_CH box masks across frames with the same observer geometry")
+    parser.add_argument("--level1_dir", type=str, default=None,
+                        help="parent folder with level 1 FITS files; converts them to level 1.5 "
+                             "in memory instead of reading level 1.5 files from --base_dir")
+    parser.add_argument("--table_cache", type=str, default=None,
+                        help="folder of cached pointing/correction tables (level 1 runs)")
+    parser.add_argument("--save_level1_5", type=str, default=None,
+                        help="also save the level 1.5 images to this folder (level 1 runs)")
     args = parser.parse_args()
+    if args.offline and args.level1_dir is not None and args.table_cache is None:
+        parser.error("--offline with --level1_dir needs --table_cache "
+                     "(the calibration tables are downloaded without it)")
 
     base_dir = Path(args.base_dir)
     save_dir = Path(args.save_dir)
+    grid_cache = (CoordGridCache(args.grid_cache, max_bytes=args.grid_cache_gb * 1024**3)
+                  if args.grid_cache else None)
+    hek_store = HEKStore(Path(args.hek_cache) if args.hek_cache else save_dir / "hek_cache.sqlite",
+                         offline=args.offline)
+    index_dir = Path(args.index_dir) if args.index_dir else save_dir / "file_index"
+
+    # Fused level 1 -> indices run
+    level1 = None
+    file_names = {}
+    if args.level1_dir is not None:
+        base_dir = Path(args.level1_dir)
+        tables = None
+        if args.table_cache is not None:
+            tables = CalibrationTables(args.table_cache, offline=args.offline)
+        level1 = Level1Options(tables, args.save_level1_5)
+        file_names = dict(prefix=LEVEL1_PREFIX, suffix=LEVEL1_SUFFIX)
+        if args.save_level1_5 is not None:
+            write_provenance(args.save_level1_5, product_settings())
+        product = None
+    else:
+        # every level 1.5 image is checked against the product.json of the folder
+        product = read_provenance(base_dir)
+        if product is None:
+            print(f"no product.json in {base_dir}: expecting full resolution float64 images")
+            product = product_settings()
     
     start_dt = parse_time(args.start).to_datetime()
     end_dt = parse_time(args.end).to_datetime()
 
     channels = [chan.strip() for chan in args.channel.split(',')]   # e.g., [193,211]
+    indices = [name.strip() for name in args.indices.split(',')]
+    for name in indices:
+        parse_index(name)                                           # fail early on typos
     years = range(start_dt.year, end_dt.year + 1)
-    fmt = '%Y-%m-%dT%H:%M:%S'
 
+    # One writer and failure table per channel, all open for the whole run
+    writers, failure_logs = {}, {}
     for chan in channels:
         save_file = save_dir / str(chan) / f"CH_Indics_{chan}.csv"
-        save_file.parent.mkdir(parents=True, exist_ok=True)
-        # Initialize file with header if empty or new
-        if not save_file.exists() or save_file.stat().st_size == 0:
-            save_file.write_text("datetime,A_CH,P_CH30,P_CH90\n")
+        parquet_dir = save_file.with_suffix(".parquet") if args.parquet else None
+        writers[chan] = ResultWriter(save_file, indices, batch_size=args.batch_size,
+                                     parquet_dir=parquet_dir)
+        failure_logs[chan] = FailureLog(save_file.with_name(f"CH_Indics_{chan}.failures.csv"))
 
+    # One flat work queue over every channel and year
+    tasks = []
+    for chan in channels:
+        completed = writers[chan].completed()
+        retry = failure_logs[chan].retryable() if args.retry_failed else None
         for year in years:
             source_dir = base_dir / str(chan) / str(year)
 
             # Define the processing window for this year
             year_start = max(start_dt, datetime(year, 1, 1, 0, 0, 0))
             year_end = min(end_dt, datetime(year, 12, 31, 23, 59, 59))
-            last_dt = get_last_processed(save_file, fmt)
 
-            # If we've already processed beyond the year start, pick up from there
-            if last_dt and last_dt + timedelta(hours=args.cadence) > year_start:
-                current = last_dt + timedelta(hours=args.cadence)
+            # Build list of datetimes at the specified cadence,
+            # skipping the ones already checkpointed
+            dt_list = []
+            if retry is not None:
+                dt_list = [dt for dt in retry if year_start <= dt <= year_end]
             else:
                 current = year_start
-
-            # Build list of datetimes at the specified cadence
-            dt_list = []
-            while current <= year_end:
-                dt_list.append(current)
-                current += timedelta(hours=args.cadence)
+                while current <= year_end:
+                    if current not in completed:
+                        dt_list.append(current)
+                    current += timedelta(hours=args.cadence)
 
             if not dt_list:
                 continue
 
-            desc = f"Wavelength {chan} Year {year}"
-            # Partially apply fixed arguments for worker function
-            worker = partial(process_dt, chan=chan, source_dir=source_dir)
-
-            # Parallel or serial processing based on core count
-            if args.cores > 1:
-                with Pool(args.cores) as pool:
-                    pbar = tqdm(pool.imap(worker, dt_list), total=len(dt_list), unit="step")
-                    for dt, fpath, a_ch, p_ch30, p_ch90 in pbar:
-                        pbar.set_description(f"{desc} | {fpath.name.split('.')[2]}")
-                        write_line(save_file, dt, a_ch, p_ch30, p_ch90)
-            else:
-                pbar = tqdm((process_dt(dt, chan, source_dir) for dt in dt_list),
-                            total=len(dt_list), unit="step")
-                for dt, fpath, a_ch, p_ch30, p_ch90 in pbar:
-                    pbar.set_description(f"{desc} | {fpath.name.split('.')[2]}")
-                    write_line(save_file, dt, a_ch, p_ch30, p_ch90)
-
-        print(f"Channel {chan} processing complete.")
+            # Nearest file of every datetime, from the persistent file index
+            index_name = f"{chan}_{year}_lev1.npz" if level1 is not None else f"{chan}_{year}.npz"
+            file_index = FileIndex(source_dir, chan, index_file=index_dir / index_name,
+                                   **file_names).load()
+            tasks.extend((chan, dt, fpath)
+                         for dt, fpath in zip(dt_list, file_index.match(dt_list, tolerance=60)))
+
+    # Warm up every worker on one existing file (imports, HEK store, grid cache)
+    warm_file = next((fpath for _, _, fpath in tasks if fpath.exists()), None) if args.warmup else None
+    initargs = (indices, grid_cache, hek_store, warm_file, args.reuse_masks, level1, product)
+
+    failed = {chan: failure_logs[chan].failed() for chan in channels}
+    counts = Counter()
+
+    def handle(pbar, result):
+        chan, dt, fpath, values, failure = result
+        pbar.set_description(f"Wavelength {chan} | {fpath.name.split('.')[2]}")
+        writers[chan].write(dt, values)
+        if failure is not None:
+            counts[(chan, failure[0])] += 1
+            failure_logs[chan].record(failure_record(dt, chan, fpath, failure))
+            if args.fail_fast and failure[0] == "compute_error":
+                raise RuntimeError(f"{fpath.name}: {failure[3]}")
+        else:
+            counts[(chan, "ok")] += 1
+            if dt.strftime('%Y-%m-%dT%H:%M:%S') in failed[chan]:
+                failure_logs[chan].resolve(dt, chan, fpath)
 
+    try:
+        # Parallel or serial processing based on core count
+        if args.cores > 1:
+            with Pool(args.cores, initializer=init_worker, initargs=initargs) as pool:
+                pbar = tqdm(pool.imap_unordered(process_task, tasks, chunksize=args.chunksize),
+                            total=len(tasks), unit="step")
+                for result in pbar:
+                    handle(pbar, result)
+        else:
+            init_worker(*initargs)
+            pbar = tqdm((process_task(task) for task in tasks),
+                        total=len(tasks), unit="step")
+            for result in pbar:
+                handle(pbar, result)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    # per-channel, per-reason accounting
+    for (chan, reason), n in sorted(counts.items()):
+        print(f"Channel {chan} | {reason}: {n}")
     print("All running finished.")
 
 
@@ -223,4 +356,7 @@ if __name__ == "__main__":
 
 # conda activate venv
 # cd Research\SR_SWspeed\data\CH_Indices
-# python get_parameters.py --channel "193,211" --start "2012-01-01" --end "2024-12-31" --cadence 12 --base_dir "D:\Data\EUV" --save_dir "D:\Data\EUV" --cores 4
\ No newline at end of file
+# python get_parameters.py --channel "193,211" --start "2012-01-01" --end "2024-12-31" --cadence 12 --base_dir "D:\Data\EUV" --save_dir "D:\Data\EUV" --cores 4
+
+# Fused run from level 1 files (no level 1.5 files written):
+# python get_parameters.py --channel "193,211" --start "2012-01-01" --end "2024-12-31" --cadence 12 --level1_dir "E:\Research\SR\input\CH_Indices\EUV_level1" --table_cache "D:\Data\EUV\calibration_tables" --save_dir "D:\Data\EUV" --cores 4
\ No newline at end of file
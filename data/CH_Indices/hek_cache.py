@@ -0,0 +1,272 @@
+"""
+Local SQLite store of HEK coronal-hole events with offline replay.
+
+`get_A_CH` needs the SPoCA CH polygons within ±2 h of every frame.
+Instead of one HEK query per frame (and per channel), the events are fetched
+once per time block and kept in a local database:
+
+    events   : raw HEK records (id, times, hgc_y, hpc_boundcc) and the
+               `buffer(0)`-repaired geometry as WKB
+    coverage : time intervals which have already been fetched
+    durations: longest stored event, bounds the start_time scan of a lookup
+
+Lookups of a ±2 h window go through the (frm_name, start_time) index.
+With `offline=True` the store never touches the network and raises
+`HEKCacheMiss` for windows which were not prefetched.
+
+Usage (prefetch):
+  python hek_cache.py \
+    --start "2012-01-01" \
+    --end "2024-12-31" \
+    --db "D:/Data/EUV/hek_cache.sqlite"
+
+"""
+
+import argparse
+import sqlite3
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import numpy as np
+from tqdm import tqdm
+
+from sunpy.time import parse_time
+from sunpy.net import attrs as a            # 검색 조건 정의
+from sunpy.net import hek                   # solar event 검색
+
+from shapely import wkt, wkb
+
+
+TIME_FMT = '%Y-%m-%dT%H:%M:%S'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id          TEXT PRIMARY KEY,
+    frm_name    TEXT NOT NULL,
+    start_time  TEXT NOT NULL,
+    end_time    TEXT NOT NULL,
+    hgc_y       REAL,
+    hpc_boundcc TEXT,
+    geom        BLOB
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (frm_name, start_time);
+CREATE TABLE IF NOT EXISTS coverage (
+    frm_name    TEXT NOT NULL,
+    start_time  TEXT NOT NULL,
+    end_time    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS coverage_time ON coverage (frm_name, start_time);
+CREATE TABLE IF NOT EXISTS durations (
+    frm_name    TEXT PRIMARY KEY,
+    max_days    REAL NOT NULL
+);
+"""
+
+# Longest event of a method, updated with every fetch (and for stores written before the table)
+_UPDATE_DURATION = """
+INSERT OR REPLACE INTO durations (frm_name, max_days)
+SELECT ?, COALESCE(MAX(julianday(end_time) - julianday(start_time)), 0)
+FROM events WHERE frm_name = ?
+"""
+
+
+class HEKCacheMiss(LookupError):
+    """
+    Raised in offline mode when a time window was never fetched.
+
+    """
+
+
+def _to_str(t) -> str:
+    """
+    Any sunpy-parsable time -> 'YYYY-MM-DDTHH:MM:SS'.
+
+    """
+    if isinstance(t, datetime):
+        return t.strftime(TIME_FMT)
+    return parse_time(t).to_datetime().strftime(TIME_FMT)
+
+
+def _repair(g):
+    """
+    Return a valid geometry, as `get_A_CH` did with `buffer(0)`.
+
+    """
+    if not g.is_valid:
+        g = g.buffer(0)
+    return g
+
+
+class HEKStore:
+    """
+    Time-indexed local copy of HEK CH events for one feature recognition method.
+
+    Only the database path and settings are pickled, so a store can be passed
+    to `Pool` workers; each process opens its own connection.
+
+    """
+
+    def __init__(self, db_path, offline=False, frm_name='SPoCA'):
+        self.db_path = Path(db_path)
+        self.offline = offline
+        self.frm_name = frm_name
+        self._conn = None
+        self._geoms = {}                # parsed geometries of this process
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_conn=None, _geoms={})
+        return state
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def covered(self, start, end) -> bool:
+        """
+        True if [start, end] lies inside one already fetched interval.
+
+        """
+        row = self.conn.execute(
+            "SELECT 1 FROM coverage WHERE frm_name = ? AND start_time <= ? AND end_time >= ? LIMIT 1",
+            (self.frm_name, _to_str(start), _to_str(end))
+        ).fetchone()
+        return row is not None
+
+    def fetch(self, start, end):
+        """
+        Query HEK for [start, end] and store every event and the interval.
+
+        """
+        if self.offline:
+            raise HEKCacheMiss(f"HEK window {_to_str(start)} - {_to_str(end)} is not cached")
+
+        hek_client = hek.HEKClient()
+        responses = hek_client.search(a.Time(_to_str(start), _to_str(end)),
+                                      a.hek.CH,
+                                      a.hek.FRM.Name == self.frm_name)
+
+        rows = []
+        for response in responses:
+            boundcc = response['hpc_boundcc']
+            geom = _repair(wkt.loads(boundcc)).wkb if boundcc else None
+            rows.append((str(response['kb_archivid']),
+                         self.frm_name,
+                         _to_str(response['event_starttime']),
+                         _to_str(response['event_endtime']),
+                         float(response['hgc_y']),
+                         boundcc,
+                         geom))
+
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT INTO coverage VALUES (?, ?, ?)",
+                              (self.frm_name, _to_str(start), _to_str(end)))
+            self.conn.execute(_UPDATE_DURATION, (self.frm_name, self.frm_name))
+        return len(rows)
+
+    def prefetch(self, start, end, block=timedelta(days=1), pad=timedelta(hours=2)):
+        """
+        Fetch [start, end] in blocks; each block is padded by `pad` on both
+        sides so that any ±pad window centred inside it is fully covered.
+
+        """
+        start = parse_time(start).to_datetime()
+        end = parse_time(end).to_datetime()
+
+        blocks = []
+        current = start
+        while current <= end:
+            blocks.append((current - pad, current + block + pad))
+            current += block
+
+        for b0, b1 in tqdm(blocks, desc=f"HEK {self.frm_name}", unit="block"):
+            if not self.covered(b0, b1):
+                self.fetch(b0, b1)
+
+    def _duration_bound(self) -> timedelta:
+        """
+        Longest stored event, used to bound the start_time index scan.
+
+        Read from the database on every lookup: other processes sharing the
+        store may have fetched longer events since.
+        """
+        row = self.conn.execute("SELECT max_days FROM durations WHERE frm_name = ?",
+                                (self.frm_name,)).fetchone()
+        if row is None:
+            with self.conn:
+                self.conn.execute(_UPDATE_DURATION, (self.frm_name, self.frm_name))
+            return self._duration_bound()
+        return timedelta(days=row[0]) + timedelta(seconds=1)
+
+    def events(self, start, end):
+        """
+        (id, hgc_y, geom WKB) of every event overlapping [start, end].
+        Missing windows are fetched first (or raise `HEKCacheMiss` offline).
+
+        """
+        if not self.covered(start, end):
+            self.fetch(start, end)
+
+        t0 = parse_time(start).to_datetime()
+        return self.conn.execute(
+            "SELECT id, hgc_y, geom FROM events "
+            "WHERE frm_name = ? AND start_time >= ? AND start_time <= ? AND end_time >= ? "
+            "ORDER BY start_time, id",
+            (self.frm_name, _to_str(t0 - self._duration_bound()), _to_str(end), _to_str(start))
+        ).fetchall()
+
+    def geometries(self, start, end, max_lat=80.0):
+        """
+        Repaired shapely geometries of the CH events overlapping [start, end],
+        skipping events with |hgc_y| > max_lat (as `get_A_CH` did).
+
+        """
+        geom_list = []
+        for event_id, hgc_y, geom in self.events(start, end):
+            if geom is None or np.abs(hgc_y) > max_lat:
+                continue
+            g = self._geoms.get(event_id)
+            if g is None:
+                g = self._geoms[event_id] = wkb.loads(geom)
+            geom_list.append(g)
+        return geom_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Prefetch HEK coronal hole events into a local SQLite store."
+    )
+    parser.add_argument("--start", type=str, required=True,
+                        help="start date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=str, required=True,
+                        help="end date (YYYY-MM-DD)")
+    parser.add_argument("--db", type=str, required=True,
+                        help="path of the SQLite store")
+    parser.add_argument("--frm", type=str, default="SPoCA",
+                        help="feature recognition method name")
+    parser.add_argument("--block_days", type=float, default=1,
+                        help="length of one HEK query in days")
+    args = parser.parse_args()
+
+    store = HEKStore(args.db, frm_name=args.frm)
+    store.prefetch(args.start, args.end, block=timedelta(days=args.block_days))
+
+    n_events = store.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    print(f"{n_events} events in {args.db}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\data\CH_Indices
+# python hek_cache.py --start "2012-01-01" --end "2024-12-31" --db "D:\Data\EUV\hek_cache.sqlite"
@@ -4,18 +4,22 @@ To get a CH_Indices such as A_CH, P_CH, theta(latitude).
 These are our function to calculate solar parameters:
 1. compute_A_CH
 2. compute_P_CH
-3. compute_theta
+3. compute_theta (get_theta)
 
 """
 
+import re
+import hashlib
+from os import PathLike
+from collections import OrderedDict
+
 import numpy as np
-from matplotlib.path import Path
 
 import astropy.units as u                   # 단위 처라
 from astropy.coordinates import SkyCoord    # 천체 좌표계
 from astropy.time import TimeDelta          # 시간 처리
 
-from sunpy.map import Map
+from sunpy.map import Map, GenericMap
 from sunpy.coordinates import frames        # 천체 좌표계
 from sunpy.net import attrs as a            # 검색 조건 정의
 from sunpy.net import hek                   # solar event 검색
@@ -24,168 +28,630 @@ import shapely.vectorized as sv             # numpy 배열 처리
 from shapely import wkt
 from shapely.ops import unary_union
 
+from coord_cache import compute_grids, geometry_key
+from hek_cache import HEKCacheMiss
 
-# A_CH parameter
-def get_A_CH(fits_file, lon=7.5):
+
+def central_band_window(aia_map, lon=7.5, margin=2):
     """
-    주어진 FITS 파일을 읽어 HEK 검색으로 CH 이벤트를 찾고, 
-    내부 픽셀 수 및 ±7.5° slice 영역을 이용해 A_CH 값을 계산합니다.
-    
-    반환: (aia_map.date, A_CH)
+    Pixel bounding box (y0, y1, x0, x1) of the central meridian band |lon| <= lon.
+
+    The ±lon meridians are projected into pixel space, as `get_P_CH` does for
+    its box.  At fixed latitude x grows monotonically with longitude on the
+    visible hemisphere, so the columns of the band lie between the two
+    projected meridians; the rows are bounded by the solar disk.
+    """
+    ny, nx = aia_map.data.shape
+
+    lat_vals = np.linspace(-90, 90, 721) * u.deg
+    edge_hgs = SkyCoord(lon=np.repeat([-lon, lon], lat_vals.size) * u.deg,
+                        lat=np.tile(lat_vals, 2),
+                        frame=frames.HeliographicStonyhurst,
+                        obstime=aia_map.date,
+                        observer='earth')
+    edge_pix = aia_map.world_to_pixel(edge_hgs.transform_to(aia_map.coordinate_frame))
+    xs = np.asarray(edge_pix.x)
+
+    # rows: solar disk centre ± radius in pixels
+    center_hpc = SkyCoord(0*u.arcsec, 0*u.arcsec, frame=aia_map.coordinate_frame)
+    yc = float(np.asarray(aia_map.world_to_pixel(center_hpc).y))
+    r_pix = (aia_map.rsun_obs / aia_map.scale.axis2).to_value(u.pixel)
+
+    x0 = max(int(np.floor(np.nanmin(xs))) - margin, 0)
+    x1 = min(int(np.ceil (np.nanmax(xs))) + margin + 1, nx)
+    y0 = max(int(np.floor(yc - r_pix)) - margin, 0)
+    y1 = min(int(np.ceil (yc + r_pix)) + margin + 1, ny)
+
+    return y0, y1, x0, x1
+
+
+class CHIndexError(Exception):
     """
+    Base class of CH index failures; `reason` is the failure code written to
+    the failure table and `retryable` marks failures worth a re-run.
+
+    """
+    reason = "compute_error"
+    retryable = False
+
+
+class FitsReadError(CHIndexError):
+    """I/O error while reading the FITS file (e.g. network mount)."""
+    reason = "file_read"
+    retryable = True
+
+
+class FitsFormatError(CHIndexError):
+    """The FITS file could be read but not parsed as a map."""
+    reason = "file_invalid"
+
+
+class HEKQueryError(CHIndexError):
+    """HEK search failed or timed out."""
+    reason = "hek_error"
+    retryable = True
+
+
+class DegenerateGeometryError(CHIndexError):
+    """CH polygons could not be merged, or the central slice is empty."""
+    reason = "degenerate_polygon"
+
+
+class CalibrationError(CHIndexError):
+    """Level 1 -> 1.5 conversion failed (fused pipeline, e.g. pointing table unavailable)."""
+    reason = "calibration_error"
+    retryable = True
+
+
+class ProductMismatchError(CHIndexError):
+    """The reduced level 1.5 product does not cover the requested index."""
+    reason = "product_mismatch"
+
+
+# Pixels of RICE compressed images with |value| below this (DN/s) are left out of P_CH
+RICE_MIN_DN = 1.0
+
+
+def _is_io_error(e):
+    """
+    True for real I/O failures (errno set, e.g. EIO / EACCES, or a timeout)
+    anywhere in the exception chain.  astropy and sunpy report corrupt or
+    unsupported files as a plain OSError without errno.
+    """
+    while e is not None:
+        if isinstance(e, (TimeoutError, ConnectionError)):
+            return True
+        if isinstance(e, OSError) and e.errno is not None:
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def open_map(fits_file):
+    """
+    Read a FITS file as a sunpy Map (a Map is passed through unchanged).
+
+    I/O errors are retryable (`FitsReadError`), files which cannot be parsed
+    ("Empty or corrupt FITS file", unsupported file type) are not (`FitsFormatError`).
+    """
+    if isinstance(fits_file, GenericMap):
+        return fits_file
     try:
-        aia_map = Map(fits_file)
+        return Map(fits_file)
     except Exception as e:
-        print(f"failed to open file: {fits_file} -> {e}")
-        return None, None
+        if _is_io_error(e):
+            raise FitsReadError(f"failed to read file: {fits_file} -> {e}") from e
+        raise FitsFormatError(f"failed to open file: {fits_file} -> {e}") from e
+
+
+def product_info(aia_map):
+    """
+    (bin, crop_lon, prodtype) of a reduced level 1.5 product written by
+    `calibration/products.py`; (1, None, None) for an image without the
+    product keywords (full resolution).
+
+    """
+    n_bin = int(aia_map.meta.get('prodbin', 1))
+    crop_lon = float(aia_map.meta.get('prodcrop', 0.0)) or None
+    return n_bin, crop_lon, aia_map.meta.get('prodtype')
+
 
-    hek_client = hek.HEKClient()
+def check_product(aia_map, lon, product=None):
+    """
+    Raise `ProductMismatchError` if the image is cropped narrower than `lon`,
+    or if it is not the product described by `product` (the `product.json`
+    of its directory, see `calibration/products.py`).  Images without the
+    product keywords are only accepted as full resolution float64 images.
+
+    P_CH of a binned image is sum(1/mean) x bin², which is not the
+    full resolution sum(1/pixel): by Jensen's inequality the mean of 1/x
+    over a superpixel is >= 1/mean, so binned P_CH is biased low where the
+    pixels of a superpixel differ (CH boundaries, noisy dark pixels).
+    Compare P_CH only between images of the same product.
+
+    반환: bin factor of the image (P_CH is scaled by bin²)
+    """
+    n_bin, crop_lon, prodtype = product_info(aia_map)
+    if product is not None:
+        expected_crop = float(product["crop_lon"]) if product.get("crop_lon") else None
+        expected_type = f"{product['dtype']}/{product['compress']}"
+        if prodtype is None and expected_type == "float64/none":
+            prodtype = expected_type                # written before the product keywords
+        if (n_bin, crop_lon, prodtype) != (int(product["bin"]), expected_crop, expected_type):
+            raise ProductMismatchError(
+                f"image is bin={n_bin}, crop_lon={crop_lon}, type={prodtype}, but product.json "
+                f"says bin={product['bin']}, crop_lon={expected_crop}, type={expected_type}")
+    if crop_lon is not None and lon > crop_lon:
+        raise ProductMismatchError(f"image is cropped to |lon| <= {crop_lon}, "
+                                   f"but the index needs |lon| <= {lon}")
+    return n_bin
+
+
+def reciprocal_floor(aia_map):
+    """
+    Smallest |pixel value| (DN/s) used by P_CH.
+
+    RICE compression quantizes float data, so dark pixels near zero come back
+    as small multiples of the quantization step and their reciprocals would
+    dominate the sum; those pixels are dropped below `RICE_MIN_DN`.  Lossless
+    images keep every non-zero pixel, as the original P_CH did.
+    """
+    prodtype = aia_map.meta.get('prodtype') or ""
+    return RICE_MIN_DN if prodtype.endswith("/rice") else 0.0
+
+
+def get_ch_geometry(aia_map, hek_store=None):
+    """
+    HEK 검색으로 ±2 h 이내의 SPoCA CH 이벤트를 찾아 하나의 geometry로 합칩니다.
+
+    hek_store: optional `hek_cache.HEKStore`; the events (and their repaired
+               geometries) are read from the local store instead of HEK.
+
+    반환: merged (shapely geometry, helioprojective arcsec)
+    """
     start_time = aia_map.date - TimeDelta(2*u.hour)
     end_time = aia_map.date + TimeDelta(2*u.hour)
 
-    responses = hek_client.search(a.Time(start_time, end_time),
-                              a.hek.CH,
-                              a.hek.FRM.Name == 'SPoCA')        # segmentation model: SPoCA
-    
-    geom_list = []
-    for response in responses:
-        if np.abs(response['hgc_y']) > 80.0:
-            continue
-        g = wkt.loads(response['hpc_boundcc'])
-        if not g.is_valid:
-            g = g.buffer(0)
-        geom_list.append(g)
+    if hek_store is not None:
+        try:
+            geom_list = hek_store.geometries(start_time, end_time)
+        except HEKCacheMiss:
+            raise
+        except Exception as e:
+            raise HEKQueryError(f"HEK store lookup failed: {e}") from e
+    else:
+        try:
+            hek_client = hek.HEKClient()
+            responses = hek_client.search(a.Time(start_time, end_time),
+                                      a.hek.CH,
+                                      a.hek.FRM.Name == 'SPoCA')        # segmentation model: SPoCA
+        except Exception as e:
+            raise HEKQueryError(f"HEK search failed: {e}") from e
+
+        try:
+            geom_list = []
+            for response in responses:
+                if np.abs(response['hgc_y']) > 80.0:
+                    continue
+                g = wkt.loads(response['hpc_boundcc'])
+                if not g.is_valid:
+                    g = g.buffer(0)
+                geom_list.append(g)
+        except Exception as e:
+            raise DegenerateGeometryError(f"invalid CH boundary: {e}") from e
 
     # Merge all coronal hole areas from the responses
-    merged = unary_union(geom_list)
+    try:
+        return unary_union(geom_list)
+    except Exception as e:
+        raise DegenerateGeometryError(f"failed to merge CH polygons: {e}") from e
 
-    ny, nx = aia_map.data.shape
-    y_idx, x_idx = np.indices((ny, nx))
 
-    # Convert pixel coordinates to physical units
-    xq = x_idx * u.pixel
-    yq = y_idx * u.pixel
+def central_slice(aia_map, merged, lon_max=7.5, grid_cache=None, bbox=True):
+    """
+    Pixels of the widest central meridian slice |lon| <= lon_max.
 
-    # Convert pixel coordinates to world coordinates
-    hpc_coords = aia_map.pixel_to_world(xq, yq)
+    The grids are evaluated once on the band of `lon_max` (see `get_A_CH`);
+    narrower slices are masks of the same arrays.
 
-    x_world = hpc_coords.Tx.value
-    y_world = hpc_coords.Ty.value
+    반환: (|lon|, lat, in_ch) 1-D arrays over the slice pixels
+    """
+    window = central_band_window(aia_map, lon_max) if bbox else None
+    if grid_cache is not None:
+        # shared float32 grids of (Tx, Ty, lon, lat) for this observer geometry
+        x_world, y_world, lon_deg, lat_deg = grid_cache.get(aia_map, window=window)
+    else:
+        x_world, y_world, lon_deg, lat_deg = compute_grids(aia_map, window=window)
 
-    # Convert world coordinates to heliographic coordinates
-    hgs_coords = hpc_coords.transform_to(frames.HeliographicStonyhurst)
+    abs_lon = np.abs(lon_deg)
+    widest = abs_lon <= lon_max
 
-    lon_deg = hgs_coords.lon.to(u.deg).value
-    central_mask = (np.abs(lon_deg) <= lon)         # mask of central merdional slice
-    ch_mask = sv.contains(merged, x_world, y_world) # mask of coronal hole area
+    # coronal hole membership is only needed for the pixels of the slice
+    try:
+        in_ch = sv.contains(merged, x_world[widest], y_world[widest])
+    except Exception as e:
+        raise DegenerateGeometryError(f"CH membership test failed: {e}") from e
 
-    inside_slice = central_mask                     # mask of central merdional slice
-    inside_ch_in_slice = ch_mask & inside_slice     # mask of coronal hole area & central merdional slice
+    return abs_lon[widest], lat_deg[widest], in_ch
 
-    n_slice = inside_slice.sum()                    # count of meridional slice pixels
-    n_ch_in_slice = inside_ch_in_slice.sum()        # count of overlap pixels
 
-    A_CH = n_ch_in_slice / n_slice
+def A_CH_from_slice(abs_lon, in_ch, lon):
+    """
+    Fraction of CH pixels in the ±lon slice.
 
-    return aia_map.date, A_CH
+    """
+    central_mask = (abs_lon <= lon)                 # mask of central merdional slice
+    n_slice = central_mask.sum()                    # count of meridional slice pixels
+    if n_slice == 0:
+        raise DegenerateGeometryError(f"empty central meridian slice (lon={lon})")
+    n_ch_in_slice = (in_ch & central_mask).sum()    # count of overlap pixels
+    return n_ch_in_slice / n_slice
 
 
-# P_CH parameter
-def get_P_CH(fits_file, lon=10, lat=30):
+def theta_from_slice(abs_lon, lat, in_ch, lon):
     """
-    주어진 FITS 파일을 읽어 selected region 내의 모든 pixel values의 역수의 합을 계산합니다.
-    
-    반환: (aia_map.date, P_CH)
+    Mean Stonyhurst latitude of the CH pixels in the ±lon slice, weighted by
+    projected (pixel) area, as A_CH is.  NaN when the slice has no CH pixel.
+
     """
-    try:
-        aia_map = Map(fits_file)
-    except Exception as e:
-        print(f"failed to open file: {fits_file} -> {e}")
-        return None, None
-    
-    n_lon = int(4 * lon + 1)
-    n_lat = int(4 * lat + 1)
-    
-    lon_vals = np.linspace(-lon, lon, n_lon) * u.deg
-    lat_vals = np.linspace(-lat, lat, n_lat) * u.deg
-
-    # upper_boundary: latitude +30 degree
-    upper_boundary_hgs = SkyCoord(lon=lon_vals,
-                                lat=lat*u.deg,
-                                frame=frames.HeliographicStonyhurst,
-                                obstime=aia_map.date,
-                                observer='earth')
-
-    # lower_boundary: latitude -30 degree
-    lower_boundary_hgs = SkyCoord(lon=lon_vals,
-                                lat=-lat*u.deg,
-                                frame=frames.HeliographicStonyhurst,
-                                obstime=aia_map.date,
-                                observer='earth')
-
-    # left_boundary: longitude -7.5 degree
-    left_boundary_hgs = SkyCoord(lon=-lon*u.deg,
-                                lat=lat_vals,
-                                frame=frames.HeliographicStonyhurst,
-                                obstime=aia_map.date,
-                                observer='earth')
-
-    # right_boundary: longitude +7.5 degree
-    right_boundary_hgs = SkyCoord(lon=lon*u.deg,
-                                lat=lat_vals,
-                                frame=frames.HeliographicStonyhurst,
-                                obstime=aia_map.date,
-                                observer='earth')
-
-    upper_boundary_hpc = upper_boundary_hgs.transform_to(aia_map.coordinate_frame)
-    lower_boundary_hpc = lower_boundary_hgs.transform_to(aia_map.coordinate_frame)
-    left_boundary_hpc = left_boundary_hgs.transform_to(aia_map.coordinate_frame)
-    right_boundary_hpc = right_boundary_hgs.transform_to(aia_map.coordinate_frame)
-
-    upper_pix = aia_map.world_to_pixel(upper_boundary_hpc)
-    lower_pix = aia_map.world_to_pixel(lower_boundary_hpc)
-    left_pix = aia_map.world_to_pixel(left_boundary_hpc)
-    right_pix = aia_map.world_to_pixel(right_boundary_hpc)
-
-    xs = np.concatenate([
-        np.array(upper_pix.x),
-        np.array(right_pix.x),
-        np.array(lower_pix.x)[::-1],
-        np.array(left_pix.x)[::-1]
-    ])
-    ys = np.concatenate([
-        np.array(upper_pix.y),
-        np.array(right_pix.y),
-        np.array(lower_pix.y)[::-1],
-        np.array(left_pix.y)[::-1]
-    ])
-
-    vertices = np.vstack((xs, ys)).T   # shape (N_vertices, 2)
-    poly = Path(vertices)
+    ch_in_slice = in_ch & (abs_lon <= lon)
+    if not ch_in_slice.any():
+        return np.nan
+    return float(np.mean(lat[ch_in_slice], dtype=np.float64))
 
-    ny, nx = aia_map.data.shape
 
+def compute_A_CH(aia_map, merged, lons=(7.5,), grid_cache=None, bbox=True):
+    """
+    A_CH for each half-width in `lons` from one set of coordinate grids.
+
+    반환: list of A_CH, in the order of `lons`
+    """
+    abs_lon, _, in_ch = central_slice(aia_map, merged, max(lons), grid_cache, bbox)
+    return [A_CH_from_slice(abs_lon, in_ch, lon) for lon in lons]
+
+
+def project_box_boundaries(aia_map, boxes):
+    """
+    Project the boundaries of several lon/lat boxes into pixel space at once.
+
+    Boxes with the same `lon` share their left/right meridians: the meridians
+    are sampled once up to the largest `lat` (0.5° steps, as in `get_P_CH`)
+    and sliced for the nested boxes.  All points go through a single
+    `transform_to` and `world_to_pixel`.
+
+    boxes: iterable of (lon, lat)
+    반환: dict {(lon, lat): (xs, ys)} of the closed polygon vertices
+    """
+    boxes = list(dict.fromkeys(boxes))
+    lon_groups = {}
+    for lon, lat in boxes:
+        lon_groups[lon] = max(lat, lon_groups.get(lon, lat))
+
+    seg_lon, seg_lat, segments = [], [], {}
+    n = 0
+
+    def add(key, lon_vals, lat_vals):
+        nonlocal n
+        lon_vals, lat_vals = np.broadcast_arrays(lon_vals, lat_vals)
+        seg_lon.append(lon_vals)
+        seg_lat.append(lat_vals)
+        segments[key] = slice(n, n + lon_vals.size)
+        n += lon_vals.size
+
+    # left/right meridians, once per lon
+    for lon, lat in lon_groups.items():
+        lat_vals = np.linspace(-lat, lat, int(4 * lat + 1))
+        add(("left", lon), -lon, lat_vals)
+        add(("right", lon), lon, lat_vals)
+        segments[("lat", lon)] = lat_vals
+
+    # upper/lower parallels, once per box
+    for lon, lat in boxes:
+        lon_vals = np.linspace(-lon, lon, int(4 * lon + 1))
+        add(("upper", lon, lat), lon_vals, lat)
+        add(("lower", lon, lat), lon_vals, -lat)
+
+    boundary_hgs = SkyCoord(lon=np.concatenate(seg_lon) * u.deg,
+                            lat=np.concatenate(seg_lat) * u.deg,
+                            frame=frames.HeliographicStonyhurst,
+                            obstime=aia_map.date,
+                            observer='earth')
+    boundary_pix = aia_map.world_to_pixel(boundary_hgs.transform_to(aia_map.coordinate_frame))
+    px = np.array(boundary_pix.x)
+    py = np.array(boundary_pix.y)
+
+    polygons = {}
+    for lon, lat in boxes:
+        # nested box: part of the shared meridians within ±lat
+        side = np.abs(segments[("lat", lon)]) <= lat + 1e-9
+        upper = segments[("upper", lon, lat)]
+        lower = segments[("lower", lon, lat)]
+        left = segments[("left", lon)]
+        right = segments[("right", lon)]
+
+        xs = np.concatenate([px[upper], px[right][side], px[lower][::-1], px[left][side][::-1]])
+        ys = np.concatenate([py[upper], py[right][side], py[lower][::-1], py[left][side][::-1]])
+        polygons[(lon, lat)] = (xs, ys)
+    return polygons
+
+
+def _box_bounds(xs, ys, shape):
+    """
+    Integer pixel bounding box (y0, y1, x0, x1) of polygon vertices.
+
+    """
+    ny, nx = shape
     x0 = max(int(np.floor(xs.min())), 0)
     x1 = min(int(np.ceil (xs.max())) + 1, nx)
     y0 = max(int(np.floor(ys.min())), 0)
     y1 = min(int(np.ceil (ys.max())) + 1, ny)
+    return y0, y1, x0, x1
 
-    Xb, Yb = np.meshgrid(np.arange(x0, x1), np.arange(y0, y1))
-    points = np.vstack((Xb.ravel(), Yb.ravel())).T
-    mask_bb = poly.contains_points(points)
 
-    data_bb = aia_map.data[y0:y1, x0:x1].ravel()
-    valid = mask_bb & (data_bb != 0)
+def rasterize_polygon(xs, ys, bounds):
+    """
+    Scanline (even-odd) rasterization of a polygon on integer pixel centres.
 
-    b = data_bb[valid]
-    P_CH = np.sum(np.reciprocal(b))
+    For every edge the rows it crosses are expanded with `np.repeat`, the
+    crossing columns are accumulated with `np.bincount` and a cumulative sum
+    along each row fills the spans, so there is no per-point test and no
+    Python loop over rows or points.
 
-    return aia_map.date, P_CH
+    bounds: (y0, y1, x0, x1) pixel box to rasterize
+    반환: bool mask of shape (y1 - y0, x1 - x0)
+    """
+    y0, y1, x0, x1 = bounds
+    h, w = y1 - y0, x1 - x0
 
+    xa, ya = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    xb, yb = np.roll(xa, -1), np.roll(ya, -1)
 
-# theta parameter
-def get_theta(fits_file):
+    # rows r crossed by an edge: min(ya, yb) <= r < max(ya, yb)
+    r_start = np.ceil(np.minimum(ya, yb)).astype(np.int64)
+    r_stop = np.ceil(np.maximum(ya, yb)).astype(np.int64)
+    r_start = np.clip(r_start, y0, y1)
+    r_stop = np.clip(r_stop, y0, y1)
+    n_rows = np.maximum(r_stop - r_start, 0)
+
+    edge = np.repeat(np.arange(xa.size), n_rows)
+    if edge.size == 0:
+        return np.zeros((h, w), dtype=bool)
+    offset = np.arange(edge.size) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    rows = r_start[edge] + offset
+
+    x_cross = xa[edge] + (rows - ya[edge]) * (xb[edge] - xa[edge]) / (yb[edge] - ya[edge])
+
+    # first column strictly right of the crossing toggles inside/outside
+    cols = np.clip(np.floor(x_cross).astype(np.int64) + 1 - x0, 0, w)
+    toggles = np.bincount((rows - y0) * (w + 1) + cols, minlength=h * (w + 1))
+    toggles = toggles.reshape(h, w + 1)[:, :w]
+
+    return (np.cumsum(toggles, axis=1) & 1).astype(bool)
+
+
+# Pixel masks of P_CH boxes, keyed on the quantized observer geometry
+_MASK_CACHE = OrderedDict()
+_MASK_CACHE_SIZE = 64
+
+
+def box_masks(aia_map, boxes, reuse_masks=False):
+    """
+    Pixel bounds and mask of every (lon, lat) box.
+
+    reuse_masks: reuse the masks of an earlier frame whose observer geometry
+                 is equal within `coord_cache.DEFAULT_TOLERANCE`
+                 (boundary shifts well below a pixel).
+
+    반환: dict {(lon, lat): ((y0, y1, x0, x1), mask)}
+    """
+    boxes = list(dict.fromkeys(boxes))
+    key = geometry_key(aia_map) if reuse_masks else None
+
+    result = {}
+    for box in boxes:
+        cached = _MASK_CACHE.get((key, box)) if key is not None else None
+        if cached is not None:
+            _MASK_CACHE.move_to_end((key, box))
+            result[box] = cached
+
+    missing = [box for box in boxes if box not in result]
+    if missing:
+        polygons = project_box_boundaries(aia_map, missing)
+        for box in missing:
+            xs, ys = polygons[box]
+            bounds = _box_bounds(xs, ys, aia_map.data.shape)
+            result[box] = (bounds, rasterize_polygon(xs, ys, bounds))
+            if key is not None:
+                _MASK_CACHE[(key, box)] = result[box]
+                while len(_MASK_CACHE) > _MASK_CACHE_SIZE:
+                    _MASK_CACHE.popitem(last=False)
+    return result
+
+
+def compute_P_CH(aia_map, boxes, reuse_masks=False, min_dn=None):
+    """
+    P_CH for each (lon, lat) box of `boxes`, sharing the boundary projection
+    and the reciprocal image of the union bounding box.
+
+    min_dn: pixels with |value| <= min_dn are left out (default: `reciprocal_floor`,
+            i.e. only the zero pixels unless the image is RICE compressed)
+
+    반환: list of P_CH, in the order of `boxes` (not scaled by bin², see `check_product`)
+    """
+    boxes = list(boxes)
+    masks = box_masks(aia_map, boxes, reuse_masks)
+    if min_dn is None:
+        min_dn = reciprocal_floor(aia_map)
+
+    bounds = [b for b, _ in masks.values()]
+    uy0 = min(b[0] for b in bounds)
+    uy1 = max(b[1] for b in bounds)
+    ux0 = min(b[2] for b in bounds)
+    ux1 = max(b[3] for b in bounds)
+
+    # reciprocal of the union box, zero (and near-zero) pixels are excluded (as 0)
+    data_u = aia_map.data[uy0:uy1, ux0:ux1]
+    nonzero_u = (np.abs(data_u) > min_dn)
+    recip_u = np.zeros(data_u.shape, dtype=np.result_type(data_u.dtype, np.float32))
+    np.reciprocal(data_u, out=recip_u, where=nonzero_u)
+
+    P_CH = []
+    for box in boxes:
+        (y0, y1, x0, x1), mask_bb = masks[box]
+
+        sub = (slice(y0 - uy0, y1 - uy0), slice(x0 - ux0, x1 - ux0))
+        valid = mask_bb & nonzero_u[sub]
+
+        P_CH.append(np.sum(recip_u[sub][valid]))
+    return P_CH
+
+
+# Index names -> (kind, parameters)
+#   A_CH[_lon<L>]        : A_CH of the ±L° central meridian slice (default 7.5)
+#   P_CH<lat>[_lon<L>]   : P_CH of the ±L° x ±lat° box (default lon 10)
+#   THETA[_lon<L>]       : mean latitude of the CH pixels in the ±L° slice (default 7.5)
+# THETA is opt-in (--indices), so existing CH_Indics_<chan>.csv files keep their columns
+DEFAULT_INDICES = ("A_CH", "P_CH30", "P_CH90")
+
+_INDEX_PATTERN = re.compile(r"^(A_CH|P_CH|THETA)(\d+(?:\.\d+)?)?(?:_lon(\d+(?:\.\d+)?))?$")
+
+
+def parse_index(name):
+    """
+    Parse an index name such as 'A_CH', 'P_CH30', 'P_CH90_lon15' or 'THETA'.
+
+    반환: (kind, params)
+    """
+    match = _INDEX_PATTERN.match(name.strip())
+    if match is None:
+        raise ValueError(f"unknown CH index: {name!r}")
+    kind, lat, lon = match.groups()
+
+    if kind in ("A_CH", "THETA"):
+        if lat is not None:
+            raise ValueError(f"{kind} takes no latitude: {name!r}")
+        return kind, {"lon": float(lon) if lon else 7.5}
+    if lat is None:
+        raise ValueError(f"P_CH needs a latitude, e.g. 'P_CH30': {name!r}")
+    return kind, {"lon": float(lon) if lon else 10, "lat": float(lat)}
+
+
+def extract_indices(fits_file, indices=DEFAULT_INDICES, grid_cache=None, bbox=True,
+                    hek_store=None, reuse_masks=False, product=None):
+    """
+    Open `fits_file` once and compute every CH index in `indices`.
+
+    The map, the HEK geometry, the coordinate grids, the boundary projections
+    and the reciprocal image are shared between the indices, so adding a box
+    costs a slice of already computed arrays, not another file read.
+
+    product: settings of the `product.json` of the image directory, checked
+             against the header of the image (see `check_product`)
+
+    반환: (aia_map.date, list of values in the order of `indices`)
+    """
+    specs = [parse_index(name) for name in indices]
+    aia_map = open_map(fits_file)
+    n_bin = check_product(aia_map, max(params["lon"] for _, params in specs), product)
+
+    values = [None] * len(specs)
+
+    # A_CH and THETA share the HEK geometry and the slice grids
+    s_pos = [i for i, (kind, _) in enumerate(specs) if kind in ("A_CH", "THETA")]
+    if s_pos:
+        merged = get_ch_geometry(aia_map, hek_store)
+        lon_max = max(specs[i][1]["lon"] for i in s_pos)
+        abs_lon, lat, in_ch = central_slice(aia_map, merged, lon_max, grid_cache, bbox)
+        for i in s_pos:
+            kind, params = specs[i]
+            if kind == "A_CH":
+                values[i] = A_CH_from_slice(abs_lon, in_ch, params["lon"])
+            else:
+                values[i] = theta_from_slice(abs_lon, lat, in_ch, params["lon"])
+
+    p_pos = [i for i, (kind, _) in enumerate(specs) if kind == "P_CH"]
+    if p_pos:
+        boxes = [(specs[i][1]["lon"], specs[i][1]["lat"]) for i in p_pos]
+        for i, val in zip(p_pos, compute_P_CH(aia_map, boxes, reuse_masks)):
+            values[i] = val * n_bin**2
+
+    return aia_map.date, values
+
+
+# A_CH parameter
+def get_A_CH(fits_file, lon=7.5, grid_cache=None, bbox=True, hek_store=None):
+    """
+    주어진 FITS 파일을 읽어 HEK 검색으로 CH 이벤트를 찾고, 
+    내부 픽셀 수 및 ±7.5° slice 영역을 이용해 A_CH 값을 계산합니다.
+
+    grid_cache: optional `coord_cache.CoordGridCache`, reuses the coordinate
+                grids of frames with the same observer geometry.
+    bbox:       evaluate the masks only inside the pixel bounding box of the
+                ±lon band (see `central_band_window`).  Every pixel with
+                |lon| <= lon lies inside the box, so A_CH matches the
+                full-disk evaluation; the only differences come from the
+                float32 grids, |ΔA_CH| < 1e-5.
+    hek_store:  optional `hek_cache.HEKStore` with the CH events.
+    
+    반환: (aia_map.date, A_CH), raises `CHIndexError` on failure
+    """
+    aia_map = open_map(fits_file)
+    check_product(aia_map, lon)
+
+    merged = get_ch_geometry(aia_map, hek_store)
+    A_CH, = compute_A_CH(aia_map, merged, (lon,), grid_cache, bbox)
+
+    return aia_map.date, A_CH
+
+
+# P_CH parameter
+def get_P_CH(fits_file, lon=10, lat=30):
     """
+    주어진 FITS 파일을 읽어 selected region 내의 모든 pixel values의 역수의 합을 계산합니다.
     
+    반환: (aia_map.date, P_CH), raises `CHIndexError` on failure
+    """
+    aia_map = open_map(fits_file)
+    n_bin = check_product(aia_map, lon)
+
+    P_CH, = compute_P_CH(aia_map, [(lon, lat)])
+
+    return aia_map.date, P_CH * n_bin**2
+
+
+# theta parameter
+def get_theta(fits_files, lon=7.5, grid_cache=None, bbox=True, hek_store=None):
+    """
+    주어진 FITS 파일(들)의 ±lon slice 안 CH pixel들의 평균 위도(theta)를 계산합니다.
+
+    A list of files is processed as a batch: frames which share a slice grid
+    (same observer geometry, e.g. one `grid_cache` entry) are stacked and
+    their CH masks reduced with one matrix product against the latitudes.
+
+    반환: (aia_map.date, theta) for one file, a list of them for a list of files
     """
-    return
\ No newline at end of file
+    if isinstance(fits_files, (str, PathLike, GenericMap)):
+        return get_theta([fits_files], lon, grid_cache, bbox, hek_store)[0]
+
+    groups = OrderedDict()        # lat digest -> (lat, [(position, date, mask)])
+    for pos, fits_file in enumerate(fits_files):
+        aia_map = open_map(fits_file)
+        check_product(aia_map, lon)
+        merged = get_ch_geometry(aia_map, hek_store)
+        abs_lon, lat, in_ch = central_slice(aia_map, merged, lon, grid_cache, bbox)
+
+        # frames sharing a grid (e.g. the same `grid_cache` entry) have identical lat
+        key = hashlib.sha1(np.ascontiguousarray(lat).tobytes()).hexdigest()
+        if key not in groups:
+            groups[key] = (lat.astype(np.float64), [])
+        groups[key][1].append((pos, aia_map.date, in_ch))
+
+    results = [None] * len(fits_files)
+    for lat, frames in groups.values():
+        masks = np.stack([mask for _, _, mask in frames]).astype(np.float64)
+        n_ch = masks.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            theta = np.where(n_ch > 0, (masks @ lat) / n_ch, np.nan)
+        for (pos, date, _), value in zip(frames, theta):
+            results[pos] = (date, float(value))
+    return results
@@ -0,0 +1,23 @@
+"""
+The CH_Indices modules import each other as flat scripts (`from processing import ...`),
+so the tests put the module folder on sys.path.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture
+def fake_hek(monkeypatch):
+    """
+    Replace the HEK client with `synthetic.FakeHEK`, starting with no events.
+    """
+    from sunpy.net import hek
+    from synthetic import FakeHEK
+
+    FakeHEK.events, FakeHEK.queries = [], []
+    monkeypatch.setattr(hek, "HEKClient", FakeHEK)
+    return FakeHEK
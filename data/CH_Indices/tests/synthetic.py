@@ -0,0 +1,94 @@
+"""
+Synthetic SDO/AIA level 1 maps, pointing tables and HEK events for the tests.
+"""
+import numpy as np
+import astropy.units as u
+from astropy.time import Time
+from astropy.table import QTable
+from sunpy.map import Map
+
+
+def aia_map(n=512, date_obs="2016-01-01T00:00:00.000", t_obs=None, exptime=2.0,
+            cdelt=0.6 * 4096 / 512, crota2=0.0, shift=(0.0, 0.0), wavelnth=193, seed=0):
+    """
+    Full-frame AIA map (n x n) with a smooth disk plus noise.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:n, :n]
+    c = (n - 1) / 2
+    r = np.hypot(x - c, y - c) / (n * 0.4)
+    data = 1000 * np.exp(-r**2) + 50 * np.sin(x / 7.0) * np.cos(y / 11.0) + rng.normal(0, 5, (n, n))
+
+    t_obs = t_obs or (Time(date_obs) + exptime / 2 * u.s).isot
+    theta = np.deg2rad(crota2)
+    meta = {
+        "telescop": "SDO/AIA", "instrume": "AIA_3", "detector": "AIA",
+        "wavelnth": wavelnth, "waveunit": "angstrom", "bunit": "DN",
+        "date-obs": date_obs, "t_obs": t_obs, "exptime": exptime,
+        "ctype1": "HPLN-TAN", "ctype2": "HPLT-TAN", "cunit1": "arcsec", "cunit2": "arcsec",
+        "cdelt1": cdelt, "cdelt2": cdelt, "crval1": 0.0, "crval2": 0.0,
+        "crpix1": c + 1 + shift[0], "crpix2": c + 1 + shift[1],
+        "crota2": crota2,
+        "pc1_1": np.cos(theta), "pc1_2": -np.sin(theta),
+        "pc2_1": np.sin(theta), "pc2_2": np.cos(theta),
+        "naxis": 2, "naxis1": n, "naxis2": n,
+        "rsun_ref": 696000000.0, "rsun_obs": 975.0, "dsun_obs": 1.47e11,
+        "hgln_obs": 0.0, "hglt_obs": -3.0, "crln_obs": 100.0, "crlt_obs": -3.0,
+        "sat_rot": 0.0, "lvl_num": 1.0,
+    }
+    return Map(data, meta)
+
+
+def pointing_table(start="2016-01-01T00:00:00", n_rows=8, wavelnth=193, x0=255.5, imscale=0.6):
+    """
+    Master pointing table with 3 h intervals; row i has X0 = x0 + i (to tell the rows apart).
+    """
+    t_start = Time(start) + np.arange(n_rows) * 3 * u.hour
+    w = f"{wavelnth:03d}"
+    return QTable({
+        "T_START": t_start,
+        "T_STOP": t_start + 3 * u.hour,
+        f"A_{w}_X0": (x0 + np.arange(n_rows)) * u.pix,
+        f"A_{w}_Y0": np.full(n_rows, x0) * u.pix,
+        f"A_{w}_IMSCALE": np.full(n_rows, imscale) * u.arcsec / u.pix,
+        f"A_{w}_INSTROT": np.zeros(n_rows) * u.deg,
+    })
+
+
+def event(archivid, start, end, hgc_y=10.0, boundcc="POLYGON((0 0, 100 0, 100 100, 0 100, 0 0))"):
+    """
+    HEK CH event with the fields read by `hek_cache.HEKStore.fetch`.
+    """
+    return {"kb_archivid": archivid, "event_starttime": start, "event_endtime": end,
+            "hgc_y": hgc_y, "hpc_boundcc": boundcc}
+
+
+class FakeHEK:
+    """
+    HEK client answering from a fixed list of events, counting the queries.
+    """
+    events = []
+    queries = []
+
+    def search(self, time, *attrs):
+        start, end = time.start.isot[:19], time.end.isot[:19]
+        FakeHEK.queries.append((start, end))
+        return [e for e in FakeHEK.events
+                if e["event_starttime"] <= end and e["event_endtime"] >= start]
+
+
+def correction_table(wavelnth=193):
+    """
+    Degradation correction table with the launch epoch and one epoch covering 2015-2016.
+    """
+    t_start = Time(["2010-03-24T00:00:00", "2015-01-01T00:00:00"])
+    return QTable({
+        "WAVE_STR": [f"{wavelnth}_THIN"] * 2,
+        "DATE": t_start,
+        "T_START": t_start,
+        "T_STOP": Time(["2015-01-01T00:00:00", "2017-01-01T00:00:00"]),
+        "EFF_AREA": [2.0, 1.6] * u.cm**2,
+        "EFFA_P1": [0.0, 1e-4],
+        "EFFA_P2": [0.0, 0.0],
+        "EFFA_P3": [0.0, 0.0],
+    })
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+import coord_cache
+import synthetic
+from coord_cache import CoordGridCache, compute_grids
+
+
+def counting(monkeypatch):
+    calls = []
+
+    def compute(aia_map, window=None):
+        calls.append(window)
+        return compute_grids(aia_map, window)
+
+    monkeypatch.setattr(coord_cache, "compute_grids", compute)
+    return calls
+
+
+def test_hit_reuses_the_stored_grid(tmp_path, monkeypatch):
+    calls = counting(monkeypatch)
+    cache = CoordGridCache(tmp_path)
+    smap = synthetic.aia_map(n=64)
+
+    first = cache.get(smap)
+    # a sub-tolerance shift of the reference pixel maps to the same key
+    second = cache.get(synthetic.aia_map(n=64, shift=(0.01, 0.0), seed=1))
+
+    assert len(calls) == 1
+    assert isinstance(second, np.memmap)
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_array_equal(second, compute_grids(smap))
+    assert len(list(tmp_path.glob("grid_*.npy"))) == 1
+
+
+def test_miss_on_a_different_geometry_or_window(tmp_path, monkeypatch):
+    calls = counting(monkeypatch)
+    cache = CoordGridCache(tmp_path)
+
+    cache.get(synthetic.aia_map(n=64))
+    cache.get(synthetic.aia_map(n=64, shift=(0.5, 0.0)))
+    cache.get(synthetic.aia_map(n=64), window=(16, 48, 0, 64))
+
+    assert calls == [None, None, (16, 48, 0, 64)]
+    assert len(list(tmp_path.glob("grid_*.npy"))) == 3
+
+
+def test_least_recently_used_grid_is_evicted(tmp_path, monkeypatch):
+    calls = counting(monkeypatch)
+    maps = [synthetic.aia_map(n=64, shift=(i, 0.0)) for i in range(3)]
+
+    probe = CoordGridCache(tmp_path / "probe")
+    probe.get(maps[0])
+    cache = CoordGridCache(tmp_path / "grids", max_bytes=2 * probe.size())
+
+    a, b = (cache._path(coord_cache.geometry_key(m, cache.tolerance)) for m in maps[:2])
+    cache.get(maps[0])
+    cache.get(maps[1])
+    os.utime(a, (1, 1))
+    os.utime(b, (2, 2))
+    cache.get(maps[0])                  # hit: `a` becomes the most recently used
+
+    cache.get(maps[2])
+    assert a.exists() and not b.exists()
+    assert cache.size() <= cache.max_bytes
+    assert len(calls) == 4              # probe, three misses; the hit is not recomputed
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from file_index import FileIndex, TS_FMT
+
+
+PREFIX, SUFFIX = 'aia.lev1_5_euv_12s', 'image_lev1_5'
+
+
+def touch(directory, dt, chan=193, name=None):
+    name = name or f"{PREFIX}.{dt.strftime(TS_FMT)}.{chan}.{SUFFIX}.fits"
+    (directory / name).write_bytes(b"")
+    return directory / name
+
+
+def test_match_nearest_within_tolerance(tmp_path):
+    t0 = datetime(2016, 1, 1)
+    early = touch(tmp_path, t0 - timedelta(seconds=20))
+    late = touch(tmp_path, t0 + timedelta(seconds=20))
+    far = touch(tmp_path, t0 + timedelta(hours=12, seconds=59))
+    index = FileIndex(tmp_path, 193).refresh()
+
+    missing = tmp_path / f"{PREFIX}.filenotfound.fits"
+    assert index.match([t0]) == [early]                     # tie -> earlier file
+    assert index.match([t0 + timedelta(seconds=15)]) == [late]
+    assert index.match([t0 + timedelta(hours=12)]) == [far]
+    assert index.match([t0 + timedelta(hours=12)], tolerance=30) == [missing]
+    assert index.match([t0 + timedelta(hours=6)]) == [missing]
+    assert index.match([]) == []
+
+
+def test_match_sees_new_files_and_other_channels_are_ignored(tmp_path):
+    t0 = datetime(2016, 1, 1)
+    touch(tmp_path, t0, chan=211)
+    index_file = tmp_path / "index" / "193_2016.npz"
+    index = FileIndex(tmp_path, 193, index_file=index_file).load()
+    assert index.match([t0])[0].name.endswith("filenotfound.fits")
+
+    new = touch(tmp_path, t0 + timedelta(seconds=5))
+    assert FileIndex(tmp_path, 193, index_file=index_file).load().match([t0]) == [new]
@@ -0,0 +1,51 @@
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import get_parameters
+from file_index import TS_FMT
+
+
+def run(monkeypatch, tmp_path, channels, start, end):
+    tasks = []
+
+    def process_task(task):
+        tasks.append(task)
+        chan, dt, fpath = task
+        return chan, dt, fpath, [1.0, 2.0, 3.0], None
+
+    monkeypatch.setattr(get_parameters, "process_task", process_task)
+    monkeypatch.setattr(sys, "argv", [
+        "get_parameters.py", "--channel", ",".join(channels), "--start", start, "--end", end,
+        "--cadence", "12", "--base_dir", str(tmp_path / "euv"), "--save_dir", str(tmp_path / "out"),
+        "--hek_cache", str(tmp_path / "hek.sqlite"), "--cores", "1"])
+    get_parameters.main()
+    return tasks
+
+
+def test_flat_queue_covers_every_channel_and_year(tmp_path, monkeypatch):
+    channels = ["193", "211"]
+    dts = [datetime(2015, 12, 31, 0), datetime(2015, 12, 31, 12),
+           datetime(2016, 1, 1, 0), datetime(2016, 1, 1, 12)]
+
+    files = {}
+    for chan in channels:
+        for dt in dts:
+            source_dir = tmp_path / "euv" / chan / str(dt.year)
+            source_dir.mkdir(parents=True, exist_ok=True)
+            ts = (dt + timedelta(seconds=5)).strftime(TS_FMT)
+            fpath = source_dir / f"aia.lev1_5_euv_12s.{ts}.{chan}.image_lev1_5.fits"
+            fpath.write_bytes(b"")
+            files[(chan, dt)] = fpath
+
+    tasks = run(monkeypatch, tmp_path, channels, "2015-12-31", "2016-01-01T12:00:00")
+    assert {(chan, dt): fpath for chan, dt, fpath in tasks} == files
+    assert len(tasks) == len(files)
+
+    for chan in channels:
+        table = pd.read_csv(tmp_path / "out" / chan / f"CH_Indics_{chan}.csv")
+        assert list(table["datetime"]) == [dt.strftime("%Y-%m-%dT%H:%M:%S") for dt in dts]
+
+    # every timestamp is checkpointed: the second run has nothing to do
+    assert run(monkeypatch, tmp_path, channels, "2015-12-31", "2016-01-01T12:00:00") == []
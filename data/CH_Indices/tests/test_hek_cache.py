@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from shapely import wkt
+
+from hek_cache import HEKStore, HEKCacheMiss
+from synthetic import event
+
+
+SQUARE = "POLYGON((0 0, 100 0, 100 100, 0 100, 0 0))"
+BOWTIE = "POLYGON((0 0, 100 100, 100 0, 0 100, 0 0))"       # invalid, repaired by buffer(0)
+
+
+def test_longer_event_fetched_by_another_process(tmp_path, fake_hek):
+    db = tmp_path / "hek.sqlite"
+    fake_hek.events = [event("short", "2016-01-01T05:00:00", "2016-01-01T06:00:00"),
+                       event("long", "2016-01-01T00:00:00", "2016-01-01T10:00:00")]
+    stale = HEKStore(db)
+    stale.fetch("2016-01-01T04:00:00", "2016-01-01T07:00:00")
+    # the first lookup bounds the scan by the 10 h event
+    assert [e[0] for e in stale.events("2016-01-01T05:00:00", "2016-01-01T05:30:00")] \
+        == ["long", "short"]
+
+    fake_hek.events.append(event("longer", "2015-12-31T20:00:00", "2016-01-01T09:00:00"))
+    other = HEKStore(db)
+    other.fetch("2016-01-01T07:00:00", "2016-01-01T12:00:00")
+
+    window = ("2016-01-01T08:00:00", "2016-01-01T08:30:00")
+    assert stale.covered(*window)
+    assert [e[0] for e in stale.events(*window)] == ["longer", "long"]
+    assert [e[0] for e in HEKStore(db).events(*window)] == ["longer", "long"]
+
+
+def test_prefetch_covers_the_range_and_skips_fetched_blocks(tmp_path, fake_hek):
+    store = HEKStore(tmp_path / "hek.sqlite")
+    store.prefetch("2016-01-01", "2016-01-02")
+    assert len(fake_hek.queries) == 2                           # one padded block per day
+    centres = pd.date_range("2016-01-01", "2016-01-02 23:00", freq="h")
+    assert all(store.covered(t - pd.Timedelta(hours=2), t + pd.Timedelta(hours=2)) for t in centres)
+    assert not store.covered("2016-01-03T00:00:00", "2016-01-03T03:00:00")
+
+    store.prefetch("2016-01-01", "2016-01-03")
+    assert fake_hek.queries[2:] == [("2016-01-02T22:00:00", "2016-01-04T02:00:00")]
+
+    store.events("2016-01-02T10:00:00", "2016-01-02T14:00:00")    # covered: no query
+    assert len(fake_hek.queries) == 3
+
+
+def test_offline_store_raises_on_an_uncached_window(tmp_path, fake_hek):
+    HEKStore(tmp_path / "hek.sqlite").fetch("2016-01-01T00:00:00", "2016-01-01T06:00:00")
+    offline = HEKStore(tmp_path / "hek.sqlite", offline=True)
+
+    assert offline.events("2016-01-01T01:00:00", "2016-01-01T05:00:00") == []
+    with pytest.raises(HEKCacheMiss):
+        offline.events("2016-01-01T05:00:00", "2016-01-01T07:00:00")
+    with pytest.raises(HEKCacheMiss):
+        HEKStore(tmp_path / "empty.sqlite", offline=True).geometries("2016-01-01", "2016-01-02")
+    assert len(fake_hek.queries) == 1
+
+
+def test_offline_replay_matches_the_online_lookup(tmp_path, monkeypatch, fake_hek):
+    fake_hek.events = [event("a", "2016-01-01T01:00:00", "2016-01-01T03:00:00"),
+                       event("bowtie", "2016-01-01T02:00:00", "2016-01-01T04:00:00", boundcc=BOWTIE),
+                       event("polar", "2016-01-01T02:00:00", "2016-01-01T05:00:00", hgc_y=-85.0),
+                       event("later", "2016-01-01T08:00:00", "2016-01-01T09:00:00")]
+    window = ("2016-01-01T00:00:00", "2016-01-01T04:00:00")
+    online = HEKStore(tmp_path / "hek.sqlite")
+    events = online.events(*window)
+    geoms = online.geometries(*window)
+
+    monkeypatch.setattr(fake_hek, "search", lambda *args: pytest.fail("offline store queried HEK"))
+    offline = HEKStore(tmp_path / "hek.sqlite", offline=True)
+    assert offline.events(*window) == events
+    assert [e[0] for e in events] == ["a", "bowtie", "polar"]
+
+    replayed = offline.geometries(*window)
+    assert len(replayed) == 2                                   # |hgc_y| > 80 is skipped
+    assert [g.wkt for g in replayed] == [g.wkt for g in geoms]
+    assert all(g.is_valid for g in replayed)
+    assert replayed[1].equals(wkt.loads(BOWTIE).buffer(0))      # repaired as get_A_CH did
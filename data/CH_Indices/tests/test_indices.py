@@ -0,0 +1,14 @@
+from processing import DEFAULT_INDICES, parse_index
+from writer import ResultWriter
+
+
+def test_default_indices_keep_the_existing_csv_schema(tmp_path):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    save_file.write_text("datetime,A_CH,P_CH30,P_CH90\n2012-01-01T00:00:00,1.0,2.0,3.0\n")
+    writer = ResultWriter(save_file, DEFAULT_INDICES)      # raises on a header mismatch
+    writer.close()
+
+
+def test_theta_is_opt_in():
+    assert "THETA" not in DEFAULT_INDICES
+    assert parse_index("THETA")[0] == "THETA"
@@ -0,0 +1,61 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+import synthetic
+from get_parameters import get_parameter, Level1Options
+from hek_cache import HEKStore
+from processing import extract_indices
+from calibration.products import product_settings
+from calibration.table_cache import CalibrationTables, _write_ecsv
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "calibration"))
+import run_convert_to_level1_5         # noqa: E402  (imports its siblings as flat scripts)
+
+
+CH = Polygon([(-200, -600), (150, -650), (100, 200), (-150, 150)])
+
+
+@pytest.fixture
+def tables(tmp_path):
+    (tmp_path / "tables").mkdir()
+    tables = CalibrationTables(tmp_path / "tables", offline=True)
+    start, end = tables._block(datetime(2016, 1, 1))
+    _write_ecsv(synthetic.pointing_table(start="2016-01-01T00:00:00", x0=2047.5),
+                tables._pointing_path(start, end))
+    _write_ecsv(synthetic.correction_table(),
+                tables.cache_dir / f"correction_{tables.correction_source}.ecsv")
+    return tables
+
+
+def test_fused_level1_path_matches_conversion_then_extraction(tmp_path, tables, fake_hek):
+    fake_hek.events = [synthetic.event("ch", "2015-12-31T23:00:00", "2016-01-01T01:00:00",
+                                       boundcc=CH.wkt)]
+    hek_store = HEKStore(tmp_path / "hek.sqlite")
+    level1_file = tmp_path / "193" / "2016" / "aia.lev1_euv_12s.2016-01-01T000000Z.193.image_lev1.fits"
+    level1_file.parent.mkdir(parents=True)
+    synthetic.aia_map(n=4096, cdelt=0.6, crota2=0.1, shift=(1.5, -2.0)).save(level1_file)
+    indices = ("A_CH", "P_CH30", "P_CH90", "THETA")
+
+    level1 = Level1Options(tables, tmp_path / "fused")
+    fused, failure = get_parameter(level1_file, indices, hek_store=hek_store, level1=level1)
+    assert failure is None
+
+    level1_5_file = tmp_path / "lev1_5.fits"
+    run_convert_to_level1_5.init_worker(tables)
+    run_convert_to_level1_5.process_and_save(str(level1_file), str(level1_5_file))
+    _, separate = extract_indices(level1_5_file, indices, hek_store=hek_store,
+                                  product=product_settings())
+
+    assert 0 < separate[0] < 1 and np.isfinite(separate[3])
+    assert fused == pytest.approx(separate, rel=1e-9)
+    _, (raw,) = extract_indices(level1_file, ("P_CH30",), product=product_settings())
+    assert fused[1] != pytest.approx(raw, rel=0.01)            # the indices come from the level 1.5 image
+    # the level 1.5 image saved by the fused run is the converted image
+    saved = tmp_path / "fused" / "193" / "2016" / level1_file.name.replace("lev1", "lev1_5")
+    _, resaved = extract_indices(saved, indices, hek_store=hek_store, product=product_settings())
+    assert resaved == pytest.approx(separate, rel=1e-9)
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from calibration.manifest import ConversionManifest, list_inputs, output_name, FITS_BLOCK
+
+
+NAMES = [f"aia.lev1_euv_12s.2016-01-01T{h:02d}0000Z.193.image_lev1.fits" for h in range(4)]
+
+
+def convert_all(tmp_path):
+    source, destination = tmp_path / "lev1", tmp_path / "lev1_5"
+    source.mkdir()
+    destination.mkdir()
+    for name in NAMES:
+        (source / name).write_bytes(b"x" * FITS_BLOCK)
+    inputs = list_inputs(source, datetime(2016, 1, 1), datetime(2016, 1, 2))
+
+    manifest = ConversionManifest(tmp_path / "manifest.sqlite")
+    for name in manifest.todo(source, inputs):
+        out = destination / output_name(name)
+        out.write_bytes(b"y" * 2 * FITS_BLOCK)
+        manifest.record(source / name, out)
+    return manifest, source, destination, inputs
+
+
+def test_verify_requeues_deleted_and_truncated_outputs(tmp_path):
+    manifest, source, destination, inputs = convert_all(tmp_path)
+    assert manifest.todo(source, inputs) == []
+    assert manifest.verify(source, inputs) == 0
+
+    (destination / output_name(NAMES[1])).unlink()
+    with open(destination / output_name(NAMES[2]), "r+b") as f:
+        f.truncate(FITS_BLOCK + 100)                  # interrupted write
+
+    assert manifest.verify(source, inputs) == 2
+    assert manifest.todo(source, inputs) == [NAMES[1], NAMES[2]]
+    manifest.close()
+
+
+def test_verify_requeues_changed_inputs(tmp_path):
+    manifest, source, destination, _ = convert_all(tmp_path)
+    (source / NAMES[3]).write_bytes(b"z" * 2 * FITS_BLOCK)
+    inputs = list_inputs(source, datetime(2016, 1, 1), datetime(2016, 1, 2))
+
+    assert manifest.verify(source, inputs) == 1
+    assert manifest.todo(source, inputs) == [NAMES[3]]
+    manifest.close()
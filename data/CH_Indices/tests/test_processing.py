@@ -0,0 +1,97 @@
+import errno
+
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+from shapely.ops import unary_union
+
+import processing
+import synthetic
+from coord_cache import CoordGridCache
+from hek_cache import HEKStore
+from processing import (open_map, central_band_window, compute_A_CH, extract_indices,
+                        get_A_CH, get_P_CH, get_theta, FitsReadError, FitsFormatError)
+
+
+# two CH polygons (helioprojective arcsec) crossing the central meridian
+CH = unary_union([Polygon([(-150, -700), (120, -700), (60, -200), (-90, -250)]),
+                  Polygon([(-40, 100), (300, 150), (200, 600), (-60, 500)])])
+
+
+@pytest.mark.parametrize("content", [b"", b"SIMPLE  = hello", bytes(range(256)) * 20])
+def test_open_map_corrupt_file_is_not_retryable(tmp_path, content):
+    path = tmp_path / "broken.fits"
+    path.write_bytes(content)
+    with pytest.raises(FitsFormatError) as info:
+        open_map(path)
+    assert info.value.reason == "file_invalid"
+    assert not info.value.retryable
+
+
+@pytest.mark.parametrize("error", [OSError(errno.EIO, "Input/output error"),
+                                   PermissionError(errno.EACCES, "Permission denied"),
+                                   TimeoutError("timed out")])
+def test_open_map_io_error_is_retryable(monkeypatch, error):
+    def failing_map(path):
+        try:
+            raise error
+        except Exception as e:                  # sunpy wraps read errors in a plain OSError
+            raise OSError(f"Failed to read {path}") from e
+
+    monkeypatch.setattr(processing, "Map", failing_map)
+    with pytest.raises(FitsReadError) as info:
+        open_map("aia.fits")
+    assert info.value.reason == "file_read"
+    assert info.value.retryable
+
+
+@pytest.mark.parametrize("crota2", [0.0, 12.0])
+def test_bbox_A_CH_matches_the_full_disk(tmp_path, crota2):
+    smap = synthetic.aia_map(n=256, cdelt=9.6, crota2=crota2)
+    lons = (2.5, 7.5, 15.0)
+    y0, y1, x0, x1 = central_band_window(smap, max(lons))
+    assert (y1 - y0) * (x1 - x0) < smap.data.size / 2
+
+    full = compute_A_CH(smap, CH, lons, bbox=False)
+    assert 0 < min(full) and max(full) < 1
+    assert compute_A_CH(smap, CH, lons, bbox=True) == pytest.approx(full, abs=1e-5)
+    cache = CoordGridCache(tmp_path)
+    assert compute_A_CH(smap, CH, lons, cache, bbox=True) == pytest.approx(full, abs=1e-5)
+
+
+def counting(monkeypatch, module, name):
+    calls = []
+    func = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(name)
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, wrapper)
+    return calls
+
+
+def test_extract_indices_shares_its_intermediates(tmp_path, monkeypatch, fake_hek):
+    fake_hek.events = [synthetic.event(f"ch{i}", "2015-12-31T23:00:00", "2016-01-01T01:00:00",
+                                       boundcc=g.wkt) for i, g in enumerate(CH.geoms)]
+    fits_file = tmp_path / "aia.fits"
+    synthetic.aia_map(n=256, cdelt=9.6).save(fits_file)
+    hek_store = HEKStore(tmp_path / "hek.sqlite")
+
+    indices = ("A_CH", "P_CH30", "P_CH90", "THETA", "A_CH_lon15", "P_CH60_lon15")
+    expected = [get_A_CH(fits_file, hek_store=hek_store)[1],
+                get_P_CH(fits_file, 10, 30)[1],
+                get_P_CH(fits_file, 10, 90)[1],
+                get_theta(fits_file, hek_store=hek_store)[1],
+                get_A_CH(fits_file, 15, hek_store=hek_store)[1],
+                get_P_CH(fits_file, 15, 60)[1]]
+    assert 0 < expected[0] < 1 and np.isfinite(expected[3])
+
+    calls = [counting(monkeypatch, processing, name)
+             for name in ("open_map", "get_ch_geometry", "compute_grids", "project_box_boundaries")]
+    date, values = extract_indices(fits_file, indices, hek_store=hek_store)
+
+    assert [len(c) for c in calls] == [1, 1, 1, 1]
+    assert len(fake_hek.queries) == 1                   # the store answers the later lookups
+    assert date == open_map(fits_file).date
+    assert values == pytest.approx(expected, rel=1e-12)
@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+import pytest
+
+from processing import check_product, compute_P_CH, ProductMismatchError, RICE_MIN_DN
+from calibration.products import make_product, product_settings, read_provenance, write_provenance
+from synthetic import aia_map
+
+
+def test_default_product_provenance_is_written_and_checked(tmp_path):
+    write_provenance(tmp_path, product_settings())
+    assert read_provenance(tmp_path)["bin"] == 1
+    assert json.loads((tmp_path / "product.json").read_text())["dtype"] == "float64"
+
+    write_provenance(tmp_path, product_settings())              # same product: accepted
+    with pytest.raises(ValueError):
+        write_provenance(tmp_path, product_settings(bin=2))
+
+
+def test_check_product_against_provenance():
+    full = aia_map(n=256)
+    binned = make_product(full, bin=2)
+
+    assert check_product(full, 10, product_settings()) == 1          # no product keywords
+    assert check_product(make_product(full), 10, product_settings()) == 1
+    assert check_product(binned, 10, product_settings(bin=2)) == 2
+    with pytest.raises(ProductMismatchError):
+        check_product(binned, 10, product_settings())
+    with pytest.raises(ProductMismatchError):
+        check_product(full, 10, product_settings(bin=2))
+
+
+def test_compressed_product_drops_near_zero_pixels():
+    smap = aia_map(n=256)
+    data = smap.data.copy()
+    data[126:130, 126:130] = RICE_MIN_DN / 100                  # quantized dark pixels at disk centre
+    rice = make_product(smap._new_instance(data, smap.meta.copy()), compress="rice")
+    lossless = make_product(smap._new_instance(data, smap.meta.copy()))
+
+    P_rice, = compute_P_CH(rice, [(10, 30)])
+    P_lossless, = compute_P_CH(lossless, [(10, 30)])
+    P_floor, = compute_P_CH(lossless, [(10, 30)], min_dn=RICE_MIN_DN)
+
+    assert P_lossless > 16 * 100 / RICE_MIN_DN                   # the reciprocals dominate the sum
+    assert P_rice == pytest.approx(P_floor)
+    assert P_rice == pytest.approx(P_lossless - 16 * 100 / RICE_MIN_DN, rel=1e-4)
+    assert np.isfinite(P_rice)
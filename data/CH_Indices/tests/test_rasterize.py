@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from matplotlib.path import Path
+
+from processing import rasterize_polygon, box_masks, project_box_boundaries, _box_bounds
+from synthetic import aia_map
+
+
+def contains_points(xs, ys, bounds):
+    """
+    Mask of the original P_CH code: matplotlib point-in-polygon on the pixel centres.
+    """
+    y0, y1, x0, x1 = bounds
+    Xb, Yb = np.meshgrid(np.arange(x0, x1), np.arange(y0, y1))
+    points = np.vstack((Xb.ravel(), Yb.ravel())).T
+    return Path(np.vstack((xs, ys)).T).contains_points(points).reshape(Xb.shape)
+
+
+def random_polygon(rng, n_vertices, shape):
+    """
+    Star-shaped (simple) polygon with random radii, partly outside the image.
+    """
+    ny, nx = shape
+    angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+    radii = rng.uniform(5, 40, n_vertices)
+    cx, cy = rng.uniform(0, nx), rng.uniform(0, ny)
+    return cx + radii * np.cos(angles), cy + radii * np.sin(angles)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_rasterize_polygon_matches_contains_points(seed):
+    rng = np.random.default_rng(seed)
+    shape = (64, 80)
+    xs, ys = random_polygon(rng, rng.integers(3, 40), shape)
+    bounds = _box_bounds(xs, ys, shape)
+
+    mask = rasterize_polygon(xs, ys, bounds)
+    assert mask.shape == (bounds[1] - bounds[0], bounds[3] - bounds[2])
+    np.testing.assert_array_equal(mask, contains_points(xs, ys, bounds))
+
+
+def test_box_masks_match_contains_points():
+    smap = aia_map(n=256)
+    boxes = [(10, 30), (10, 90), (15, 60)]
+    polygons = project_box_boundaries(smap, boxes)
+
+    masks = box_masks(smap, boxes)
+    for box in boxes:
+        bounds, mask = masks[box]
+        xs, ys = polygons[box]
+        assert bounds == _box_bounds(xs, ys, smap.data.shape)
+        np.testing.assert_array_equal(mask, contains_points(xs, ys, bounds))
+        assert mask.any()
@@ -0,0 +1,57 @@
+import os
+import time
+
+from calibration import scheduler as scheduler_module
+from calibration.scheduler import MemoryAwareScheduler
+
+
+def crash_on_two(task):
+    if task == 2:
+        os._exit(1)                 # like a worker killed by the OOM killer
+    time.sleep(0.05)
+    return task * 10
+
+
+def test_broken_pool_fails_in_flight_tasks_and_restarts(tmp_path):
+    log_file = tmp_path / "log.csv"
+    with MemoryAwareScheduler(2, task_gb=0.001, log_file=log_file) as scheduler:
+        results = {task: (result, error) for task, result, error
+                   in scheduler.run(crash_on_two, range(8))}
+        assert scheduler.cap == 2                   # recovered after the break
+
+    assert sorted(results) == list(range(8))
+    assert "BrokenProcessPool" in results[2][1]
+    failed = {task for task, (_, error) in results.items() if error is not None}
+    assert failed <= {1, 2, 3}                  # only the tasks in flight with task 2
+    for task in set(range(8)) - failed:
+        assert results[task] == (task * 10, None)
+    assert len(log_file.read_text().splitlines()) == 1 + 8
+
+
+def test_limit_follows_the_available_memory(monkeypatch):
+    gb = 1024**3
+    available, rss = [8 * gb], [0]
+    monkeypatch.setattr(scheduler_module, "available_memory", lambda: available[0])
+    with MemoryAwareScheduler(8, mem_fraction=0.5, task_gb=1) as scheduler:
+        monkeypatch.setattr(scheduler, "workers_rss", lambda: rss[0])
+        assert scheduler.limit == 4
+        available[0] = 2 * gb                   # other processes took memory
+        assert scheduler.limit == 1
+        scheduler.in_flight = 2                 # started, but nothing allocated yet
+        assert scheduler.limit == 1
+        rss[0] = 2 * gb                         # the tasks in flight hold their memory
+        assert scheduler.limit == 3
+
+
+def test_cap_after_a_broken_pool_recovers():
+    with MemoryAwareScheduler(4, task_gb=0.001) as scheduler:
+        scheduler._restart(0)                   # broken with nothing in flight
+        assert scheduler.cap == 4
+        scheduler._restart(3)
+        assert scheduler.cap == 2
+        assert scheduler.limit <= 2
+
+        for task, _, error in scheduler.run(int, range(8)):
+            assert error is None
+        assert scheduler.cap == 4
+        assert scheduler.executor._max_workers == 4
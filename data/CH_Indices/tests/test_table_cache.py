@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pytest
+
+import synthetic
+from calibration.table_cache import CalibrationTables, _write_ecsv
+from calibration.convert_to_level1_5 import Pointing_correction
+
+
+@pytest.fixture
+def tables(tmp_path):
+    tables = CalibrationTables(tmp_path, offline=True)
+    start, end = tables._block(datetime(2016, 1, 1, 3))
+    block = synthetic.pointing_table(start="2016-01-01T00:00:00")
+    _write_ecsv(block, tables._pointing_path(start, end))
+    return tables
+
+
+def test_pointing_table_keeps_the_neighbouring_rows(tables):
+    rows = tables.pointing_table("2016-01-01T02:59:59.5")
+    assert [t[:13] for t in rows["T_START"].isot] == ["2016-01-01T00", "2016-01-01T03"]
+
+
+def test_pointing_uses_t_obs_at_a_slot_boundary(tables):
+    # DATE-OBS just before the 03:00 boundary, T_OBS (DATE-OBS + exptime / 2) just after it
+    aia_map = synthetic.aia_map(n=4096, cdelt=0.6, date_obs="2016-01-01T02:59:59.500", exptime=2.0)
+    corrected = Pointing_correction(aia_map, tables)
+    assert corrected.meta["x0_mp"] == pytest.approx(255.5 + 1)     # row of 03:00-06:00
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from writer import ResultWriter
+
+
+T0 = datetime(2016, 1, 1)
+
+
+def times(n):
+    return [T0 + timedelta(hours=12 * i) for i in range(n)]
+
+
+def test_resume_from_checkpoint(tmp_path):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    with ResultWriter(save_file, ["A_CH", "P_CH30"], batch_size=2) as writer:
+        for dt in times(3):
+            writer.write(dt, [1.0, 2.0])
+
+    writer = ResultWriter(save_file, ["A_CH", "P_CH30"])
+    assert writer.completed() == set(times(3))
+    writer.close()
+
+
+def test_unflushed_rows_and_partial_line_are_not_completed(tmp_path):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    writer = ResultWriter(save_file, ["A_CH"], batch_size=2)
+    for dt in times(3):
+        writer.write(dt, [1.0])                 # the third row stays in the buffer
+    with open(save_file, "a") as f:
+        f.write("2016-01-02T12:00:00,0.")        # crash in the middle of a line
+
+    resumed = ResultWriter(save_file, ["A_CH"])
+    assert resumed.completed() == set(times(2))
+    assert save_file.read_text().endswith("\n")
+    resumed.close()
+
+
+def test_header_mismatch_is_an_error(tmp_path):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    ResultWriter(save_file, ["A_CH", "P_CH30"]).close()
+    with pytest.raises(ValueError):
+        ResultWriter(save_file, ["A_CH", "P_CH30", "THETA"])
+
+
+def test_close_sorts_and_deduplicates(tmp_path):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    t = times(3)
+    with ResultWriter(save_file, ["A_CH"], batch_size=1) as writer:
+        writer.write(t[2], [3.0])
+        writer.write(t[0], [1.0])
+        writer.write(t[1], [0.0])
+        writer.write(t[1], [2.0])               # re-processed: the last row wins
+
+    lines = save_file.read_text().splitlines()
+    assert lines == ["datetime,A_CH",
+                     "2016-01-01T00:00:00,1.0",
+                     "2016-01-01T12:00:00,2.0",
+                     "2016-01-02T00:00:00,3.0"]
+
+
+def test_csv_without_checkpoint_is_migrated(tmp_path):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    save_file.write_text("datetime,A_CH\n2016-01-01T00:00:00,1.0\n2016-01-01T12:00:00,nan\n")
+    writer = ResultWriter(save_file, ["A_CH"])
+    assert writer.completed() == set(times(2))
+    writer.close()
+
+
+def test_rows_written_but_not_checkpointed_are_deduplicated(tmp_path, monkeypatch):
+    save_file = tmp_path / "CH_Indics_193.csv"
+    t = times(4)
+    writer = ResultWriter(save_file, ["A_CH"], batch_size=2)
+    writer.write(t[0], [1.0])
+    writer.write(t[1], [2.0])
+
+    import writer as writer_module
+    append = writer_module._fsync_append
+
+    def crash_before_checkpoint(path, text):
+        if path == writer.checkpoint_file:
+            raise KeyboardInterrupt                 # killed between the two appends
+        append(path, text)
+
+    monkeypatch.setattr(writer_module, "_fsync_append", crash_before_checkpoint)
+    writer.write(t[2], [5.0])
+    with pytest.raises(KeyboardInterrupt):
+        writer.write(t[3], [5.0])
+    monkeypatch.setattr(writer_module, "_fsync_append", append)
+
+    with ResultWriter(save_file, ["A_CH"], batch_size=2) as resumed:
+        todo = [dt for dt in t if dt not in resumed.completed()]
+        assert todo == t[2:]
+        for dt in todo:
+            resumed.write(dt, [7.0])
+
+    lines = save_file.read_text().splitlines()
+    assert lines == ["datetime,A_CH",
+                     "2016-01-01T00:00:00,1.0",
+                     "2016-01-01T12:00:00,2.0",
+                     "2016-01-02T00:00:00,7.0",
+                     "2016-01-02T12:00:00,7.0"]
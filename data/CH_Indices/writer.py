@@ -0,0 +1,211 @@
+"""
+Buffered, crash-safe writer for CH index results.
+
+Rows are buffered and appended to the CSV in batches; every batch is
+flushed with `fsync` before its timestamps are appended to a sidecar
+checkpoint (`<save_file>.done`).  Resuming therefore depends on the set of
+completed timestamps, not on the last CSV line, and results may arrive in
+any order (`imap_unordered`).
+
+On close the CSV is sorted by datetime and de-duplicated (last row wins)
+if rows were written out of order or a timestamp was re-processed.
+Optionally every batch is also written as a Parquet part file.
+
+"""
+
+import os
+from pathlib import Path
+from datetime import datetime
+
+import pandas as pd
+
+
+TIME_FMT = '%Y-%m-%dT%H:%M:%S'
+
+
+def _fsync_append(path: Path, text: str):
+    with open(path, 'a') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _repair_tail(path: Path):
+    """
+    Drop a partially written last line (file not ending with a newline).
+
+    """
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data.endswith(b'\n'):
+            return
+        f.truncate(data.rfind(b'\n') + 1)
+
+
+class ResultWriter:
+    """
+    Append rows of (datetime, values) to `save_file` in fsync'ed batches.
+
+    columns:     index names, the CSV header is 'datetime,<columns>'
+    batch_size:  rows buffered before a flush
+    parquet_dir: optional folder for Parquet part files of the same rows
+
+    """
+
+    def __init__(self, save_file, columns, batch_size=64, parquet_dir=None):
+        self.save_file = Path(save_file)
+        self.checkpoint_file = self.save_file.with_name(self.save_file.name + ".done")
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.parquet_dir = Path(parquet_dir) if parquet_dir is not None else None
+
+        self._rows = []
+        self._last = None
+        self._needs_sort = False
+        self._completed = None
+        self._open()
+
+    @property
+    def header(self) -> str:
+        return ",".join(["datetime", *self.columns]) + "\n"
+
+    def _open(self):
+        self.save_file.parent.mkdir(parents=True, exist_ok=True)
+        if not self.save_file.exists() or self.save_file.stat().st_size == 0:
+            # Initialize file with header if empty or new
+            self.save_file.write_text(self.header)
+        else:
+            with open(self.save_file) as f:
+                existing = f.readline()
+            if existing.strip() != self.header.strip():
+                raise ValueError(f"{self.save_file} has columns '{existing.strip()}', "
+                                 f"but the requested columns are '{self.header.strip()}'")
+        _repair_tail(self.save_file)
+        _repair_tail(self.checkpoint_file)
+
+        if not self.checkpoint_file.exists():
+            # migrate a CSV written before checkpoints existed
+            done = [line.split(',', 1)[0] for line in self._data_lines()]
+            _fsync_append(self.checkpoint_file, "".join(f"{t}\n" for t in done))
+
+        self._completed = self._read_checkpoint()
+        if self._completed:
+            self._last = max(self._completed)
+
+        # rows appended before a crash but never checkpointed are processed again,
+        # so the CSV is de-duplicated on close
+        written = {line.split(',', 1)[0] for line in self._data_lines()}
+        if not written <= self._completed:
+            self._needs_sort = True
+
+    def _data_lines(self):
+        with open(self.save_file) as f:
+            lines = f.read().splitlines()
+        return [line for line in lines[1:] if line]
+
+    def _read_checkpoint(self):
+        completed = set()
+        with open(self.checkpoint_file) as f:
+            for line in f:
+                line = line.strip()
+                try:
+                    datetime.strptime(line, TIME_FMT)
+                except ValueError:
+                    continue
+                completed.add(line)
+        return completed
+
+    def completed(self):
+        """
+        Set of datetimes (as datetime objects) already written and checkpointed.
+
+        """
+        return {datetime.strptime(t, TIME_FMT) for t in self._completed}
+
+    def write(self, dt: datetime, values):
+        """
+        Buffer one result row; flushes when the batch is full.
+        Always uses `dt` as the timestamp for consistency.
+
+        """
+        time_str = dt.strftime(TIME_FMT)
+        if (self._last is not None and time_str <= self._last) or time_str in self._completed:
+            self._needs_sort = True
+        self._last = max(time_str, self._last) if self._last is not None else time_str
+
+        self._rows.append((time_str, list(values)))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows (fsync), then checkpoint their timestamps.
+
+        """
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+
+        lines = "".join(",".join([t, *(f"{v}" for v in values)]) + "\n" for t, values in rows)
+        _fsync_append(self.save_file, lines)
+
+        if self.parquet_dir is not None:
+            self._write_parquet(rows)
+
+        _fsync_append(self.checkpoint_file, "".join(f"{t}\n" for t, _ in rows))
+        self._completed.update(t for t, _ in rows)
+
+    def _write_parquet(self, rows):
+        self.parquet_dir.mkdir(parents=True, exist_ok=True)
+        df = pd.DataFrame([values for _, values in rows], columns=self.columns, dtype="float64")
+        df.insert(0, "datetime", pd.to_datetime([t for t, _ in rows], format=TIME_FMT))
+
+        part = self.parquet_dir / f"part-{rows[0][0].replace(':', '')}-{os.getpid()}-{len(rows)}.parquet"
+        tmp = part.with_name(part.name + ".tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, part)
+
+    def close(self):
+        """
+        Flush and, if needed, rewrite the CSV sorted by datetime without duplicates.
+
+        """
+        self.flush()
+        if not self._needs_sort:
+            return
+
+        rows = {}
+        for line in self._data_lines():
+            rows[line.split(',', 1)[0]] = line              # last row wins
+        text = self.header + "".join(rows[t] + "\n" for t in sorted(rows))
+
+        tmp = self.save_file.with_name(self.save_file.name + ".tmp")
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.save_file)
+        self._needs_sort = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_parquet_results(parquet_dir) -> pd.DataFrame:
+    """
+    Read all Parquet parts of a result folder, sorted and de-duplicated.
+
+    """
+    parts = sorted(Path(parquet_dir).glob("part-*.parquet"), key=lambda p: p.stat().st_mtime)
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+    return (df.drop_duplicates("datetime", keep="last")
+              .sort_values("datetime")
+              .reset_index(drop=True))
@@ -1,25 +1,184 @@
 """
-Extract mag_Indics values and save to CSV.
+Extract mag_Indics values and save to CSV / Parquet.
+
+Every WSA output (source-surface radius, magnetogram provider, ...) is read
+in its own process; all of them are binned onto one shared timeline and
+written as one wide Parquet table keyed by datetime, with the columns
+`<column>_<label>` of every input (e.g. `expansion_factor_R5_0`).
+
+Inputs are given as glob patterns (--inputs) or as a manifest (--manifest),
+a CSV with the columns `label,path`.  Without either, the two legacy files
+(R5_0 and R21_5) under --base_path are processed.
+
+By default the parcels are binned with the legacy 12 h windows.  Any of
+--cadence / --half_width / --agg / --method switches to `bin_parcels`;
+several cadences (e.g. --cadence 1h,6h,12h) are binned from one read of each
+file and written as `<output stem>_<cadence>.parquet`
+(with --csv also as `mag_indices_<label>_<cadence>.csv`).
+
+Usage:
+  python get_parameters.py \
+    --inputs "E:/Research/SR/input/mag_Indices/*/PREDSOLARWIND/*.dat" \
+    --start "2012-01-01" \
+    --end "2024-12-31 12:00" \
+    --output "E:/Research/SR/input/mag_Indices/mag_indices.parquet" \
+    --cores 4
 
 """
 
 import os
+import glob
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from processing import (get_mag_indices, get_mag_products, make_timeline, format_times,
+                        MAG_COLUMNS)
+
+
+LEGACY_INPUTS = {
+    "R5_0":  r"R5_0\PREDSOLARWIND\GONGZfield_line1R000_R5.0.dat",
+    "R21_5": r"R21_5\PREDSOLARWIND\GONGZfield_line1R000.dat",
+}
+
+def label_inputs(paths):
+    """
+    Label of every input: the first directory below their common folder
+    (e.g. 'R5_0'), or the relative path when those are not unique.
+    반환: dict {label: path}
+    """
+    paths = [Path(p) for p in paths]
+    if len(paths) == 1:
+        return {paths[0].stem: paths[0]}
+    base = Path(os.path.commonpath([p.parent for p in paths]))
+    rel = [p.relative_to(base) for p in paths]
+
+    labels = [r.parts[0] if len(r.parts) > 1 else r.stem for r in rel]
+    if len(set(labels)) < len(labels):
+        labels = ["_".join(r.with_suffix("").parts) for r in rel]
+    return {label.replace(".", "_"): p for label, p in zip(labels, paths)}
 
-from processing import get_mag_indices
+def read_manifest(manifest_file):
+    """
+    Manifest CSV with the columns `label,path`.
+    반환: dict {label: path}
+    """
+    df = pd.read_csv(manifest_file, dtype=str)
+    return {row.label.strip(): Path(row.path.strip()) for row in df.itertuples()}
+
+def process_input(label, dat_file, timeline, cache_dir=None):
+    """
+    Mag indices of one WSA output on the shared timeline.
+    """
+    return label, get_mag_indices(dat_file, cache_dir, timeline, as_strings=False)
+
+def process_binned(label, dat_file, binnings, start, end, cache_dir=None):
+    """
+    Binned products of one WSA output (one read for every cadence).
+    """
+    return label, get_mag_products(dat_file, binnings, start, end, cache_dir)
+
+def to_wide(results, timeline):
+    """
+    One table keyed by datetime with the columns `<column>_<label>`.
+    """
+    wide = timeline.set_index("datetime")
+    for label, mag_df in results:
+        mag_df = mag_df.set_index("datetime")[MAG_COLUMNS]
+        wide = wide.join(mag_df.add_suffix(f"_{label}"))
+    return wide.reset_index()
 
 def main():
-    base_path = "E:\Research\SR\input\mag_Indices"
-    R5_0_file_path  = "\R5_0\PREDSOLARWIND\GONGZfield_line1R000_R5.0.dat"
-    R21_5_file_path = "\R21_5\PREDSOLARWIND\GONGZfield_line1R000.dat"
+    parser = argparse.ArgumentParser(
+        description="Extract the mag_Indics values from WSA outputs."
+    )
+    parser.add_argument("--inputs", type=str, default=None,
+                        help="glob pattern(s) of WSA .dat files, separated by ','")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="CSV with the columns 'label,path' of the WSA .dat files")
+    parser.add_argument("--base_path", type=str, default=r"E:\Research\SR\input\mag_Indices",
+                        help="folder of the legacy inputs and the default outputs")
+    parser.add_argument("--start", type=str, default="2012-01-01",
+                        help="first time of the timeline")
+    parser.add_argument("--end", type=str, default="2024-12-31 12:00",
+                        help="last time of the timeline")
+    parser.add_argument("--output", type=str, default=None,
+                        help="wide Parquet table (default: <base_path>/mag_indices.parquet)")
+    parser.add_argument("--csv", action="store_true",
+                        help="also save mag_indices_<label>.csv for every input "
+                             "(mag_indices_<label>_<cadence>.csv when binned)")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="folder of the parsed WSA Parquet cache (default: next to each file)")
+    parser.add_argument("--cores", type=int, default=4,
+                        help="number of processes")
+    parser.add_argument("--cadence", type=str, default=None,
+                        help="cadence(s) of the binned products, separated by ',' (e.g. 1h,6h,12h)")
+    parser.add_argument("--half_width", type=str, default=None,
+                        help="window half-width around every slot (default: cadence / 2)")
+    parser.add_argument("--agg", type=str, default="mean",
+                        choices=["mean", "median", "count", "weighted"],
+                        help="aggregation of the parcels of a slot")
+    parser.add_argument("--method", type=str, default=None, choices=["window", "all", "asof"],
+                        help="window: parcels within half_width, all: every parcel, "
+                             "asof: nearest parcel (default: legacy 12 h windows)")
+    args = parser.parse_args()
+
+    base_path = Path(args.base_path)
+    if args.manifest:
+        inputs = read_manifest(args.manifest)
+    elif args.inputs:
+        paths = sorted({p for pattern in args.inputs.split(",")
+                        for p in glob.glob(pattern.strip(), recursive=True)})
+        inputs = label_inputs(paths)
+    else:
+        inputs = {label: base_path / rel for label, rel in LEGACY_INPUTS.items()}
+        args.csv = True
+    if not inputs:
+        raise SystemExit("No WSA inputs found.")
+
+    output = Path(args.output) if args.output else base_path / "mag_indices.parquet"
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    if args.cadence or args.half_width or args.method or args.agg != "mean":
+        binnings = {cadence.strip(): dict(cadence=cadence.strip(), half_width=args.half_width,
+                                          agg=args.agg, method=args.method or "window")
+                    for cadence in (args.cadence or "12h").split(",")}
+        with ProcessPoolExecutor(max_workers=min(args.cores, len(inputs))) as executor:
+            futures = [executor.submit(process_binned, label, path, binnings,
+                                       args.start, args.end, args.cache_dir)
+                       for label, path in inputs.items()]
+            results = [future.result() for future in futures]
+
+        for name, binning in binnings.items():
+            timeline = make_timeline(args.start, args.end, binning["cadence"])
+            out = output.with_name(f"{output.stem}_{name}{output.suffix}")
+            to_wide([(label, products[name]) for label, products in results],
+                    timeline).to_parquet(out, index=False)
+            print(f"{len(results)} inputs -> {out}")
+
+            if args.csv:
+                for label, products in results:
+                    format_times(products[name]).to_csv(
+                        output.parent / f"mag_indices_{label}_{name}.csv", index=False)
+        return
+
+    # One timeline shared by every input
+    timeline = make_timeline(args.start, args.end)
 
-    R5_0_df  = get_mag_indices(base_path + R5_0_file_path)
-    R21_5_df = get_mag_indices(base_path + R21_5_file_path)
+    with ProcessPoolExecutor(max_workers=min(args.cores, len(inputs))) as executor:
+        futures = [executor.submit(process_input, label, path, timeline, args.cache_dir)
+                   for label, path in inputs.items()]
+        results = [future.result() for future in futures]
 
-    # Save the DataFrame to a CSV file
-    os.makedirs(base_path, exist_ok=True) 
+    # Save the wide table (and the per-input CSVs)
+    to_wide(results, timeline).to_parquet(output, index=False)
+    print(f"{len(results)} inputs -> {output}")
 
-    R5_0_df.to_csv(os.path.join(base_path, "mag_indices_R5_0.csv"),  index=False)
-    R21_5_df.to_csv(os.path.join(base_path, "mag_indices_R21_5.csv"), index=False)
+    if args.csv:
+        for label, mag_df in results:
+            format_times(mag_df).to_csv(output.parent / f"mag_indices_{label}.csv", index=False)
 
 if __name__ == "__main__":
     main()
@@ -29,4 +188,6 @@ if __name__ == "__main__":
 
 # conda activate venv
 # cd Research\SR_SWspeed\data\mag_Indices
-# python get_parameters.py
\ No newline at end of file
+# python get_parameters.py
+# python get_parameters.py --inputs "E:\Research\SR\input\mag_Indices\*\PREDSOLARWIND\*.dat" --start "2012-01-01" --end "2024-12-31 12:00" --cores 4
+# python get_parameters.py --inputs "E:\Research\SR\input\mag_Indices\*\PREDSOLARWIND\*.dat" --cadence 1h,6h,12h --agg median
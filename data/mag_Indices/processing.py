@@ -7,67 +7,311 @@ These are our function to calculate solar parameters:
 3. compute squashing_factor
 
 """
+import os
+import re
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
-from astropy.time import Time
+import erfa
+
+# Columns of the WSA field-line file used for the mag indices
+WSA_COLUMNS = {
+    "parcel_depart_time": "float64",    # JD - 2440000
+    "juldate":            "float64",    # JD - 2440000 (arrival)
+    "expansion_factor":   "float64",
+    "coronal_hole_dist":  "float64",
+    "squashing_factor":   "float64",
+}
+
+def read_wsa(dat_file, cache_dir=None) -> pd.DataFrame:
+    """
+    Read the columns of `WSA_COLUMNS` from a WSA .dat file.
+
+    Uses the C parser (whitespace separated, fixed dtypes, round-trip float
+    parsing so the values equal the python-engine result) and caches the
+    table as Parquet, keyed by the size and mtime of the .dat file.
+    cache_dir: folder of the Parquet cache (default: next to `dat_file`), False disables it
+    """
+    dat_file = Path(dat_file)
+    st = os.stat(dat_file)
+
+    cache = None
+    if cache_dir is not False:
+        cache_dir = Path(cache_dir) if cache_dir else dat_file.parent
+        cache = cache_dir / f"{dat_file.stem}.{st.st_size}_{st.st_mtime_ns}.parquet"
+        if cache.exists():
+            return pd.read_parquet(cache)
+
+    wsa_df = pd.read_csv(dat_file, comment='#', sep=r'\s+', engine='c',
+                         usecols=list(WSA_COLUMNS), dtype=WSA_COLUMNS,
+                         float_precision='round_trip')[list(WSA_COLUMNS)]
+
+    if cache is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_name(cache.name + ".tmp")
+        wsa_df.to_parquet(tmp, index=False)
+        os.replace(tmp, cache)
+        # drop the caches of older versions of the file
+        for old in cache_dir.glob(f"{dat_file.stem}.*_*.parquet"):
+            if old != cache and re.fullmatch(rf"{re.escape(dat_file.stem)}\.\d+_\d+\.parquet", old.name):
+                old.unlink(missing_ok=True)
+    return wsa_df
+
+# JD of 1970-01-01 12:00 (UTC), day 0 of datetime64
+JD_UNIX_NOON = 2440588
+DAY_US = 86_400_000_000
+
+def _leap_days():
+    """
+    Days (datetime64[D]) which end with a leap second, from the erfa table.
+    """
+    table = erfa.leap_seconds.get()
+    starts = np.array([f"{y:04d}-{m:02d}-01" for y, m in zip(table["year"], table["month"])],
+                      dtype="datetime64[D]")
+    # whole-second steps only (the drifting offsets before 1972 are not leap seconds)
+    step = np.diff(table["tai_utc"]) > 0.5
+    return starts[1:][step] - np.timedelta64(1, "D")
 
 def jd2dt(jd_series, bias=2440000.00):
     """
-    Convert Julian date to datetime.
+    Convert Julian date (UTC) to datetime64[us].
+
+    Reproduces `Time(jd, format="jd").to_datetime()` (erfa d2dtf: the day
+    fraction is rounded to the microsecond, days ending with a leap second
+    are 86401 s long) with vectorized integer datetime64 arithmetic,
+    instead of one Python datetime per row.
+    """
+    jd = np.asarray(jd_series, dtype=np.float64) + bias
+    valid = np.isfinite(jd)
+    jd = np.where(valid, jd, JD_UNIX_NOON)
+
+    # split into the noon JD of the civil day and the fraction since midnight
+    jd1 = np.round(jd)
+    fd = (jd - jd1) + 0.5
+    day = (jd1 - JD_UNIX_NOON).astype(np.int64)
+    carry = fd >= 1.0
+    day[carry] += 1
+    fd[carry] -= 1.0
+
+    leap = np.isin(day.astype("datetime64[D]"), _leap_days())
+    fd = np.where(leap, fd + fd / 86400.0, fd)
+    us = np.floor(1e6 * (86400.0 * fd) + 0.5).astype(np.int64)
+
+    day_len = np.where(leap, DAY_US + 1_000_000, DAY_US)
+    if np.any(valid & leap & (us >= DAY_US) & (us < day_len)):
+        raise ValueError("Time is within a leap second, which datetime does not support")
+    past = us >= day_len
+    day[past] += 1
+    us[past] -= day_len[past]
+
+    dt = day.astype("datetime64[D]") + us.astype("timedelta64[us]")
+    dt[~valid] = np.datetime64("NaT")
+    return dt
+
+def assign_12h(arrival, legacy_windows=True):
+    """
+    12 h timeline slot of every arrival time (NaT outside the windows).
+
+    legacy_windows: 11-12 h -> noon, 23-01 h -> 00 h of the *same* day
+                    (an arrival at 23:40 is assigned to the preceding midnight),
+                    as in the original CSVs.
     """
-    return Time(jd_series + bias, format="jd").to_datetime()
-    
-def get_mag_indices(dat_file) -> pd.DataFrame:
+    arrival = np.asarray(arrival, dtype="datetime64[us]")
+    midnight = arrival.astype("datetime64[D]").astype("datetime64[us]")
+    hr = (arrival - midnight) // np.timedelta64(1, "h")
+
+    mask_noon = (hr >= 11) & (hr <= 12)                  # 11‒13 h
+    mask_midnight = (hr >= 23) | (hr <= 1)               # 23‒01 h
+    slot = np.full(arrival.shape, np.datetime64("NaT"), dtype="datetime64[us]")
+    slot[mask_midnight] = midnight[mask_midnight]
+    slot[mask_noon] = midnight[mask_noon] + np.timedelta64(12, "h")
+    return slot
+
+MAG_COLUMNS = ["departure_time", "arrival_time",
+               "expansion_factor", "coronal_hole_dist", "squashing_factor"]
+
+def make_timeline(start="2012-01-01", end="2024-12-31 12:00", cadence="12h") -> pd.DataFrame:
     """
-    Get a WSA table from a file.
+    Output timeline (datetime64[us]) from `start` to `end` at `cadence`.
     """
-    jul_bias = 2440000.00
+    return pd.DataFrame({"datetime": pd.date_range(start, end, freq=cadence, unit="us")})
 
-    # Read the WSA data
-    wsa_df = pd.read_csv(dat_file, comment='#', sep=r'\s+', engine='python')
+def format_times(mag_df, columns=("datetime", "departure_time", "arrival_time")) -> pd.DataFrame:
+    """
+    Format datetime columns as 'YYYY-MM-DDTHH:MM:SS' strings (missing -> NaT).
+    """
+    mag_df = mag_df.copy()
+    for col in columns:
+        mag_df[col] = (
+            mag_df[col]
+            .dt.strftime("%Y-%m-%dT%H:%M:%S")
+            .fillna(pd.NaT)
+        )
+    return mag_df
+
+AGGREGATIONS = ("mean", "median", "count", "weighted")
+
+def _group_mean(idx, values, weights, n):
+    ok = ~np.isnan(values)
+    total = np.bincount(idx[ok], weights=values[ok] * weights[ok], minlength=n)
+    norm = np.bincount(idx[ok], weights=weights[ok], minlength=n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(norm > 0, total / norm, np.nan)
 
+def _group_median(idx, values, n):
+    ok = ~np.isnan(values)
+    idx, values = idx[ok], values[ok]
+    order = np.lexsort((values, idx))               # by slot, then by value
+    idx, values = idx[order], values[order]
+    counts = np.bincount(idx, minlength=n)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    has = counts > 0
+    lo = starts[has] + (counts[has] - 1) // 2
+    hi = starts[has] + counts[has] // 2
+    median = np.full(n, np.nan)
+    median[has] = 0.5 * (values[lo] + values[hi])
+    return median
+
+def bin_parcels(wsa_df, timeline, cadence="12h", half_width=None, agg="mean", method="window"):
+    """
+    Bin WSA parcels onto a regular `timeline` by arrival time.
+
+    Every parcel is mapped to its nearest slot with integer arithmetic on the
+    arrival times and aggregated with `np.bincount` over the slot index,
+    i.e. one O(N) pass per product (median sorts within the slots).
+
+    cadence:    spacing of `timeline` (e.g. '1h', '6h', '12h')
+    half_width: parcels with |arrival - slot| <= half_width are used (default cadence / 2)
+    agg:        mean | median | count | weighted (triangular weights 1 - |Δt| / half_width)
+    method:     window -> parcels within half_width of a slot
+                all    -> every parcel in its nearest slot (resample)
+                asof   -> the single nearest parcel within half_width (merge_asof)
+
+    반환: DataFrame of datetime, departure/arrival time of the first parcel
+          (nearest parcel for 'asof'), the aggregated columns and n_parcels
+    """
+    avg_cols = ["expansion_factor", "coronal_hole_dist", "squashing_factor"]
+    cad = pd.Timedelta(cadence).to_timedelta64().astype("timedelta64[us]").astype(np.int64)
+    hw = (pd.Timedelta(half_width).to_timedelta64().astype("timedelta64[us]").astype(np.int64)
+          if half_width is not None else cad // 2)
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"agg must be one of {AGGREGATIONS}: {agg!r}")
+    if method == "all":
+        hw = cad // 2
+    elif method not in ("window", "asof"):
+        raise ValueError(f"method must be 'window', 'all' or 'asof': {method!r}")
+    if hw > cad // 2:
+        raise ValueError("half_width must not exceed half of the cadence")
+
+    out = timeline[["datetime"]].copy()
+    if method == "asof":
+        parcels = (wsa_df[["arrival_time", "departure_time", *avg_cols]]
+                   .dropna(subset=["arrival_time"])
+                   .sort_values("arrival_time", kind="stable"))
+        parcels["arrival_key"] = parcels["arrival_time"].astype("datetime64[us]")
+        out = pd.merge_asof(out.astype({"datetime": "datetime64[us]"}), parcels,
+                            left_on="datetime", right_on="arrival_key",
+                            direction="nearest", tolerance=pd.Timedelta(hw, unit="us"))
+        out["n_parcels"] = out["arrival_key"].notna().astype(np.int64)
+        return out[["datetime", *MAG_COLUMNS, "n_parcels"]]
+
+    n = len(timeline)
+    t0 = timeline["datetime"].to_numpy().astype("datetime64[us]").astype(np.int64)[0]
+    arrival = wsa_df["arrival_time"].to_numpy().astype("datetime64[us]")
+    t = arrival.astype(np.int64)
+
+    idx = (t - t0 + cad // 2) // cad                # nearest slot
+    dt = t - (t0 + idx * cad)
+    keep = ~np.isnat(arrival) & (idx >= 0) & (idx < n) & (np.abs(dt) <= hw)
+    rows = np.flatnonzero(keep)
+    idx, dt = idx[keep], dt[keep]
+
+    weights = (1.0 - np.abs(dt) / hw if agg == "weighted" and hw > 0
+               else np.ones(idx.size))
+    for col in avg_cols:
+        values = wsa_df[col].to_numpy(dtype=np.float64)[rows]
+        if agg == "median":
+            out[col] = _group_median(idx, values, n)
+        elif agg == "count":
+            out[col] = np.bincount(idx[~np.isnan(values)], minlength=n)
+        else:
+            out[col] = _group_mean(idx, values, weights, n)
+
+    # departure / arrival of the first parcel (file order) of every slot
+    first = np.full(n, len(wsa_df), dtype=np.int64)
+    np.minimum.at(first, idx, rows)
+    has = first < len(wsa_df)
+    for col in ["departure_time", "arrival_time"]:
+        times = np.full(n, np.datetime64("NaT"), dtype="datetime64[us]")
+        times[has] = wsa_df[col].to_numpy().astype("datetime64[us]")[first[has]]
+        out[col] = times
+    out["n_parcels"] = np.bincount(idx, minlength=n)
+    return out[["datetime", *MAG_COLUMNS, "n_parcels"]]
+
+def read_parcels(dat_file, cache_dir=None) -> pd.DataFrame:
+    """
+    WSA table with the departure and arrival times as datetime64.
+    """
+    jul_bias = 2440000.00
+    wsa_df = read_wsa(dat_file, cache_dir)
     wsa_df["departure_time"] = jd2dt(wsa_df["parcel_depart_time"], jul_bias)
     wsa_df["arrival_time"]   = jd2dt(wsa_df["juldate"], jul_bias)
+    return wsa_df
+
+def get_mag_products(dat_file, binnings, start="2012-01-01", end="2024-12-31 12:00",
+                     cache_dir=None, as_strings=False):
+    """
+    Several binned products (e.g. 1 h, 6 h, 12 h) from one read of a WSA file.
+
+    binnings: dict {name: keyword arguments of `bin_parcels`}
+    반환: dict {name: DataFrame}
+    """
+    wsa_df = read_parcels(dat_file, cache_dir)
+    products = {}
+    for name, binning in binnings.items():
+        timeline = make_timeline(start, end, binning.get("cadence", "12h"))
+        mag_df = bin_parcels(wsa_df, timeline, **binning)
+        products[name] = format_times(mag_df) if as_strings else mag_df
+    return products
+
+def get_mag_indices(dat_file, cache_dir=None, timeline=None, as_strings=True,
+                    binning=None) -> pd.DataFrame:
+    """
+    Get a WSA table from a file.
+    cache_dir:  Parquet cache of the parsed file (see `read_wsa`)
+    timeline:   output timeline (see `make_timeline`), default 2012-01-01 to 2024-12-31 12:00
+    as_strings: format the times as strings (CSV output); False keeps datetime64
+    binning:    keyword arguments of `bin_parcels`; None keeps the legacy 12 h windows
+
+    All times stay datetime64 until the output strings are formatted.
+    """
+    # Read the WSA data
+    wsa_df = read_parcels(dat_file, cache_dir)
+
+    if binning is not None:
+        if timeline is None:
+            timeline = make_timeline(cadence=binning.get("cadence", "12h"))
+        mag_df = bin_parcels(wsa_df, timeline, **binning)
+        return format_times(mag_df) if as_strings else mag_df
 
     # set the time range to 12 hours 
-    hr = wsa_df["arrival_time"].dt.hour
-    mask_noon = hr.between(11, 12, inclusive='both')        # 11‒13 h
-    mask_midnight = (hr >= 23) | (hr <= 1)                  # 23‒01 h
-
-    midnight = wsa_df['arrival_time'].dt.floor('D')
-    masked_arrival_dt = np.select(condlist=[mask_noon, mask_midnight],
-                                  choicelist=[midnight + pd.Timedelta(hours=12), midnight],
-                                  default=pd.NaT)
-    wsa_df['masked_arrival_time'] = pd.to_datetime(masked_arrival_dt)\
-                                .strftime('%Y-%m-%dT%H:%M:%S')
-
-    # Create a timeline DataFrame with 12-hour intervals
-    # 2012-01-01 00:00:00 to 2024-12-31 12:00:00
-    timeline = pd.DataFrame(
-        {"datetime": pd.date_range("2012-01-01", "2024-12-31 12:00", freq="12h")
-                 .strftime('%Y-%m-%dT%H:%M:%S')}
-    )
+    wsa_df["masked_arrival_time"] = assign_12h(wsa_df["arrival_time"])
+
+    # Timeline with 12-hour intervals
+    if timeline is None:
+        timeline = make_timeline()
     # Merge the WSA data with the timeline
     merged = timeline.merge(wsa_df, left_on="datetime", right_on="masked_arrival_time", how="left")
 
     avg_cols   = ["expansion_factor", "coronal_hole_dist", "squashing_factor"]
     agg = {**{c: "mean" for c in avg_cols},
-           **{c: "first" for c in merged.columns.difference(avg_cols + ["datetime"])}}
+           **{c: "first" for c in ["departure_time", "arrival_time"]}}
 
     mag_df = (
         merged.groupby("datetime", as_index=False).agg(agg)
-              [["datetime", "departure_time", "arrival_time", *avg_cols]]
+              [["datetime", *MAG_COLUMNS]]
     )
 
-    mag_df[["departure_time", "arrival_time"]] = mag_df[
-        ["departure_time", "arrival_time"]
-    ].apply(pd.to_datetime, errors="coerce")
-
-    for col in ["departure_time", "arrival_time"]:
-        mag_df[col] = (
-            mag_df[col]
-            .dt.strftime("%Y-%m-%dT%H:%M:%S")
-            .fillna(pd.NaT)
-        )
-
-    return mag_df
+    # format the times only for the output
+    return format_times(mag_df) if as_strings else mag_df
@@ -0,0 +1,232 @@
+"""
+Catalogue of the equations of every PySR run in model/outputs.
+
+Every `<run id>/hall_of_fame.csv` (Complexity, Loss, Equation) is parsed into
+one columnar table
+
+    run_id, complexity, loss, equation, n_vars, var_<name> ...
+
+where the boolean `var_<name>` columns tell which variables an equation
+uses.  The table is kept sorted by (complexity, loss), so "complexity <= k"
+is a prefix of it, and saved as `catalogue.parquet` in the outputs folder
+together with `catalogue_runs.parquet` (size / mtime of each parsed hall of
+fame).  `update` only parses the runs which are new or changed since the
+last scan and drops the removed ones; the `.bak` copies of PySR are ignored.
+
+Queries such as "best loss at complexity <= 10 using A_CH_193" are boolean
+masks over the table, and `pareto_front` gives the global loss / complexity
+front across all runs.
+
+"""
+
+import os
+import re
+import fnmatch
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+OUTPUTS = Path(__file__).resolve().parent / "outputs"
+
+# Column types of the catalogue (without the var_<name> columns) and of the run list
+TABLE_DTYPES = {"run_id": "string", "complexity": "int64", "loss": "float64",
+                "equation": "string", "n_vars": "int64"}
+RUNS_DTYPES = {"run_id": "string", "size": "int64", "mtime_ns": "int64"}
+
+# Identifiers not followed by '(' are variables (the others are operators)
+_VARIABLE = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\b(?!\s*\()")
+
+
+def equation_variables(equation):
+    """
+    Set of the variable names of an equation string.
+    """
+    return set(_VARIABLE.findall(equation))
+
+def read_hall_of_fame(path, run_id):
+    """
+    One hall of fame as catalogue rows (without the variable columns).
+    """
+    df = pd.read_csv(path, dtype={"Complexity": "int64", "Loss": "float64", "Equation": str})
+    return pd.DataFrame({
+        "run_id": run_id,
+        "complexity": df["Complexity"].to_numpy(),
+        "loss": df["Loss"].to_numpy(),
+        "equation": df["Equation"].to_numpy(),
+    })
+
+def scan_runs(outputs):
+    """
+    Hall of fame files of the outputs folder.
+    반환: DataFrame of run_id, size, mtime_ns
+    """
+    rows = []
+    with os.scandir(outputs) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                st = os.stat(Path(entry.path) / "hall_of_fame.csv")
+            except FileNotFoundError:
+                continue
+            rows.append((entry.name, st.st_size, st.st_mtime_ns))
+    return pd.DataFrame(rows, columns=list(RUNS_DTYPES)).astype(RUNS_DTYPES)
+
+def _add_variables(table):
+    """
+    n_vars and the boolean var_<name> columns of the equations.
+    """
+    table = table[[c for c in table.columns if not c.startswith("var_") and c != "n_vars"]]
+    variables = [equation_variables(e) for e in table["equation"]]
+    names = sorted(set().union(*variables))
+    matrix = np.zeros((len(table), len(names)), dtype=bool)
+    column = {name: j for j, name in enumerate(names)}
+    for i, used in enumerate(variables):
+        matrix[i, [column[name] for name in used]] = True
+
+    table = table.assign(n_vars=matrix.sum(axis=1))
+    var_df = pd.DataFrame(matrix, columns=[f"var_{n}" for n in names], index=table.index)
+    return pd.concat([table, var_df], axis=1)
+
+class Catalogue:
+    """
+    Columnar table of every equation of every run in `outputs`.
+
+    """
+
+    def __init__(self, outputs=OUTPUTS):
+        self.outputs = Path(outputs)
+        self.path = self.outputs / "catalogue.parquet"
+        self.runs_path = self.outputs / "catalogue_runs.parquet"
+        if self.path.exists() and self.runs_path.exists():
+            self.table = pd.read_parquet(self.path)
+            self.runs = pd.read_parquet(self.runs_path)
+        else:
+            self.table = pd.DataFrame(columns=list(TABLE_DTYPES)).astype(TABLE_DTYPES)
+            self.runs = pd.DataFrame(columns=list(RUNS_DTYPES)).astype(RUNS_DTYPES)
+
+    def update(self):
+        """
+        Parse the new / changed runs, drop the removed ones and save.
+        반환: (number of parsed runs, number of dropped runs)
+        """
+        current = scan_runs(self.outputs)
+        known = self.runs.set_index("run_id")
+        changed = [row.run_id for row in current.itertuples()
+                   if row.run_id not in known.index
+                   or (known.at[row.run_id, "size"], known.at[row.run_id, "mtime_ns"])
+                      != (row.size, row.mtime_ns)]
+        removed = set(known.index) - set(current["run_id"])
+        if not changed and not removed:
+            return 0, 0
+
+        keep = ~self.table["run_id"].isin(set(changed) | removed)
+        parts = [self.table.loc[keep, ["run_id", "complexity", "loss", "equation"]]]
+        for rid in changed:
+            parts.append(read_hall_of_fame(self.outputs / rid / "hall_of_fame.csv", rid))
+        table = pd.concat(parts, ignore_index=True)
+        table = table.astype({k: v for k, v in TABLE_DTYPES.items() if k != "n_vars"})
+        table = table.sort_values(["complexity", "loss"], kind="stable").reset_index(drop=True)
+
+        self.table = _add_variables(table)
+        self.runs = current.sort_values("run_id").reset_index(drop=True)
+        self._save()
+        return len(changed), len(removed)
+
+    def _save(self):
+        for df, path in [(self.table, self.path), (self.runs, self.runs_path)]:
+            tmp = path.with_name(path.name + ".tmp")
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+
+    @property
+    def variables(self):
+        return [c[4:] for c in self.table.columns if c.startswith("var_")]
+
+    def _uses(self, pattern):
+        """
+        Rows using any variable matching `pattern` (fnmatch, or a name prefix).
+        """
+        names = [v for v in self.variables
+                 if fnmatch.fnmatchcase(v, pattern) or v.startswith(pattern)]
+        if not names:
+            return np.zeros(len(self.table), dtype=bool)
+        return self.table[[f"var_{n}" for n in names]].to_numpy().any(axis=1)
+
+    def query(self, max_complexity=None, uses=(), excludes=(), runs=None, top=10):
+        """
+        Lowest-loss equations matching every condition.
+
+        max_complexity: complexity <= max_complexity
+        uses:           each pattern must match a variable of the equation (e.g. 'A_CH_193')
+        excludes:       no variable may match these patterns
+        runs:           only these run ids
+        """
+        table = self.table
+        n = len(table)
+        if max_complexity is not None:       # the table is sorted by complexity
+            n = int(np.searchsorted(table["complexity"].to_numpy(), max_complexity, side="right"))
+        mask = np.ones(n, dtype=bool)
+        for pattern in uses:
+            mask &= self._uses(pattern)[:n]
+        for pattern in excludes:
+            mask &= ~self._uses(pattern)[:n]
+        if runs is not None:
+            mask &= table["run_id"].iloc[:n].isin(set(runs)).to_numpy()
+        hits = table.iloc[:n][mask]
+        return hits.nsmallest(top, "loss", keep="first")[["run_id", "complexity", "loss", "equation"]]
+
+    def pareto_front(self):
+        """
+        Equations with a lower loss than every equation of lower complexity (all runs).
+        """
+        table = self.table
+        best = table.groupby("complexity", sort=True)["loss"].idxmin()
+        front = table.loc[best.to_numpy()]
+        loss = front["loss"].to_numpy()
+        improves = np.ones(len(loss), dtype=bool)
+        improves[1:] = loss[1:] < np.minimum.accumulate(loss)[:-1]
+        return front[improves][["run_id", "complexity", "loss", "equation"]].reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalogue and query the PySR hall of fame files.")
+    parser.add_argument("--outputs", type=str, default=str(OUTPUTS),
+                        help="folder of the run directories")
+    parser.add_argument("--max_complexity", type=int, default=None,
+                        help="largest complexity of the listed equations")
+    parser.add_argument("--uses", type=str, default=None,
+                        help="variables (patterns) the equations must use, separated by ','")
+    parser.add_argument("--excludes", type=str, default=None,
+                        help="variables (patterns) the equations must not use, separated by ','")
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of listed equations")
+    parser.add_argument("--pareto", action="store_true",
+                        help="list the global Pareto front instead")
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.outputs)
+    parsed, dropped = catalogue.update()
+    print(f"{len(catalogue.runs)} runs, {len(catalogue.table)} equations "
+          f"({parsed} parsed, {dropped} dropped)")
+
+    split = lambda s: [p.strip() for p in s.split(",")] if s else []
+    with pd.option_context("display.max_colwidth", 120, "display.width", 200):
+        if args.pareto:
+            print(catalogue.pareto_front().to_string(index=False))
+        else:
+            print(catalogue.query(args.max_complexity, split(args.uses), split(args.excludes),
+                                  top=args.top).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\model
+# python catalogue.py --pareto
+# python catalogue.py --max_complexity 10 --uses A_CH_193 --top 5
@@ -0,0 +1,390 @@
+"""
+Score the discovered equations (hall_of_fame.csv) on the feature matrix.
+
+The notebook checked an equation by typing it in again, e.g.
+
+    (8.679697 / (modified_SR_df['D_ch_R5_0'] - 0.82108825)) + 503.1936
+
+on the unscaled features, although the model was fitted on
+`StandardScaler().transform(X_train)`.  Here the `Equation` strings are
+parsed once (`^` -> `**`, Python `ast`) into one DAG shared by all the
+equations of a batch: equal sub-expressions (same operator and operands,
+e.g. `A_CH_211_lag3 * P_CH30_211_lag3` or `0.53 ^ A_CH_193_lag4`) are
+evaluated once, constant sub-expressions are folded, and every node is a
+NumPy operation over a chunk of rows.  The arrays of a node are released
+after its last use, and the equations are evaluated in batches of
+`EQUATION_BATCH` so that the output buffer stays small for any number of
+equations.  Floating point errors (overflow, log of a negative number, ...)
+give inf / NaN without warnings; the non-finite predictions of every
+equation are counted (`invalid_<split>`) and left out of the metrics.
+
+The variables are scaled like the fit: with `scaler.json` of the run
+(written by run_experiments.py), or, for older runs, with a StandardScaler
+fitted on the first 80 % of the rows (train_test_split(shuffle=False)).
+
+RMSE, correlation and skill (1 - MSE / variance of the observations) are
+computed per equation on the train and validation rows.
+
+"""
+
+import ast
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from features import default_spec, load_features, INPUT_PATH, OUTPUT_PATH
+from catalogue import Catalogue, OUTPUTS, equation_variables
+
+
+# PySR operators (names in the equation strings)
+FUNCTIONS = {
+    "exp":    np.exp,
+    "log":    np.log,
+    "log10":  np.log10,
+    "log2":   np.log2,
+    "sqrt":   np.sqrt,
+    "inv":    np.reciprocal,
+    "neg":    np.negative,
+    "abs":    np.abs,
+    "square": np.square,
+    "cube":   lambda x: np.power(x, 3),
+    "sin":    np.sin,
+    "cos":    np.cos,
+    "tan":    np.tan,
+    "sinh":   np.sinh,
+    "cosh":   np.cosh,
+    "tanh":   np.tanh,
+}
+BINARY = {
+    ast.Add:  np.add,
+    ast.Sub:  np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div:  np.divide,
+    ast.Pow:  np.power,
+}
+
+CHUNK_ROWS = 4096        # rows per pass
+EQUATION_BATCH = 256     # equations per pass (memory: batch x rows x 8 bytes = 8 MB)
+
+
+class Program:
+    """
+    DAG of a batch of equations.
+
+    nodes: list of (op, args) in evaluation order; op is 'var' (args: name),
+           'const' (args: value) or a NumPy function (args: node ids)
+    roots: node id of every equation (None if it could not be parsed)
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.roots = []
+        self.errors = []
+        self._ids = {}
+        self._plans = {}
+
+    def _node(self, key, op, args):
+        node = self._ids.get(key)
+        if node is None:
+            node = self._ids[key] = len(self.nodes)
+            self.nodes.append((op, args))
+        return node
+
+    def _const(self, value):
+        value = float(value)
+        return self._node(("const", value), "const", value)
+
+    def _apply(self, name, func, args):
+        ops = [self.nodes[a] for a in args]
+        if all(op == "const" for op, _ in ops):          # fold constants
+            with np.errstate(all="ignore"):
+                return self._const(func(*[value for _, value in ops]))
+        return self._node((name, *args), func, args)
+
+    def _build(self, tree):
+        if isinstance(tree, ast.Expression):
+            return self._build(tree.body)
+        if isinstance(tree, ast.Constant) and isinstance(tree.value, (int, float)):
+            return self._const(tree.value)
+        if isinstance(tree, ast.Name):
+            return self._node(("var", tree.id), "var", tree.id)
+        if isinstance(tree, ast.UnaryOp) and isinstance(tree.op, (ast.USub, ast.UAdd)):
+            operand = self._build(tree.operand)
+            if isinstance(tree.op, ast.UAdd):
+                return operand
+            return self._apply("neg", np.negative, (operand,))
+        if isinstance(tree, ast.BinOp) and type(tree.op) in BINARY:
+            func = BINARY[type(tree.op)]
+            return self._apply(func.__name__, func, (self._build(tree.left), self._build(tree.right)))
+        if (isinstance(tree, ast.Call) and isinstance(tree.func, ast.Name)
+                and tree.func.id in FUNCTIONS and not tree.keywords):
+            args = tuple(self._build(a) for a in tree.args)
+            return self._apply(tree.func.id, FUNCTIONS[tree.func.id], args)
+        raise ValueError(f"unsupported expression: {ast.dump(tree)[:80]}")
+
+    def add(self, equation):
+        """
+        Add one equation string; 반환: its index in `roots`.
+        """
+        try:
+            tree = ast.parse(equation.replace("^", "**"), mode="eval")
+            root, error = self._build(tree), None
+        except (SyntaxError, ValueError) as e:
+            root, error = None, f"{type(e).__name__}: {e}"
+        self.roots.append(root)
+        self.errors.append(error)
+        return len(self.roots) - 1
+
+    @property
+    def variables(self):
+        return sorted({args for op, args in self.nodes if op == "var"})
+
+    def _plan(self, roots):
+        """
+        Nodes needed by `roots` in evaluation order, and the last use of each node.
+        """
+        plan = self._plans.get(roots)
+        if plan is None:
+            needed = {r for r in roots if r is not None}
+            for i in range(max(needed, default=-1), -1, -1):     # nodes are in evaluation order
+                op, args = self.nodes[i]
+                if i in needed and callable(op):
+                    needed.update(args)
+            order = sorted(needed)
+            last_use = {}
+            for i in order:
+                op, args = self.nodes[i]
+                if callable(op):
+                    for a in args:
+                        last_use[a] = i
+            plan = self._plans[roots] = (order, last_use)
+        return plan
+
+    def evaluate(self, columns, n_rows, equations=None):
+        """
+        Values of the equations on the rows of `columns` (dict name -> array).
+
+        equations: indices into `roots` (default: all); only their nodes are evaluated
+
+        반환: array (len(equations), n_rows), NaN for unparsed equations
+        """
+        roots = self.roots if equations is None else [self.roots[j] for j in equations]
+        order, last_use = self._plan(tuple(roots))
+        keep = {r for r in roots if r is not None}
+
+        out = np.full((len(roots), n_rows), np.nan)
+        values = {}
+        with np.errstate(all="ignore"):
+            for i in order:
+                op, args = self.nodes[i]
+                if op == "const":
+                    values[i] = args
+                elif op == "var":
+                    values[i] = columns[args]
+                else:
+                    values[i] = op(*[values[a] for a in args])
+                    for a in set(args):
+                        if last_use[a] == i and a not in keep:
+                            del values[a]
+            for j, root in enumerate(roots):
+                if root is not None:
+                    out[j] = values[root]       # broadcasts constant equations
+        return out
+
+def compile_equations(equations):
+    """
+    One `Program` of all the equation strings.
+    """
+    program = Program()
+    for equation in equations:
+        program.add(equation)
+    return program
+
+def fit_scaler(df, input_cols, test_size=0.2):
+    """
+    StandardScaler of the notebook: mean / std (ddof 0) of the first 80 % of the rows.
+    """
+    n_train = len(df) - int(np.ceil(test_size * len(df)))
+    X = df[input_cols].to_numpy(dtype=np.float64)[:n_train]
+    scale = X.std(axis=0)
+    return {
+        "input_cols": list(input_cols),
+        "mean": X.mean(axis=0).tolist(),
+        "scale": np.where(scale == 0, 1.0, scale).tolist(),
+        "n_train": n_train,
+        "n_val": len(df) - n_train,
+    }
+
+class _Stats:
+    """
+    Sums of the metrics of every equation, accumulated over chunks of rows.
+    """
+
+    def __init__(self, n):
+        self.sums = {k: np.zeros(n) for k in ("n", "invalid", "p", "pp", "y", "yy", "py", "ee")}
+
+    def add(self, pred, y, equations=slice(None)):
+        """
+        Add the predictions `pred` (equations x rows) of the equations `equations` (a slice).
+        """
+        valid = np.isfinite(pred)
+        p = np.where(valid, pred, 0.0)
+        yv = np.where(valid, y, 0.0)
+        s = {k: v[equations] for k, v in self.sums.items()}      # views
+        with np.errstate(all="ignore"):             # huge finite predictions overflow to inf
+            s["n"] += valid.sum(axis=1)
+            s["invalid"] += (~valid).sum(axis=1)
+            s["p"] += p.sum(axis=1)
+            s["pp"] += (p * p).sum(axis=1)
+            s["y"] += yv.sum(axis=1)
+            s["yy"] += (yv * yv).sum(axis=1)
+            s["py"] += (p * yv).sum(axis=1)
+            s["ee"] += ((p - yv) ** 2).sum(axis=1)
+
+    def metrics(self, suffix):
+        s = self.sums
+        with np.errstate(all="ignore"):
+            n = s["n"]
+            mse = s["ee"] / n
+            var_y = s["yy"] / n - (s["y"] / n) ** 2
+            var_p = s["pp"] / n - (s["p"] / n) ** 2
+            cov = s["py"] / n - (s["p"] / n) * (s["y"] / n)
+            var_p = np.where(var_p > 1e-12 * s["pp"] / n, var_p, np.nan)    # constant equations
+            return {
+                f"rmse_{suffix}": np.sqrt(mse),
+                f"r_{suffix}": cov / np.sqrt(var_p * var_y),
+                f"skill_{suffix}": 1.0 - mse / var_y,
+                f"invalid_{suffix}": s["invalid"].astype(np.int64),
+            }
+
+def score(program, df, target, scaler=None, chunk_rows=CHUNK_ROWS,
+          equation_batch=EQUATION_BATCH):
+    """
+    RMSE, correlation and skill of every equation of `program` on the train
+    and validation rows of the feature matrix `df`, evaluated in blocks of
+    `chunk_rows` rows x `equation_batch` equations.
+
+    scaler: dict of scaler.json (or `fit_scaler`), None -> unscaled features
+    """
+    n_val = scaler["n_val"] if scaler else int(np.ceil(0.2 * len(df)))
+    splits = {"train": (0, len(df) - n_val), "val": (len(df) - n_val, len(df))}
+
+    missing = [v for v in program.variables if v not in df.columns]
+    if missing:
+        raise KeyError(f"variables not in the feature matrix: {missing}")
+
+    columns = {v: df[v].to_numpy(dtype=np.float64) for v in program.variables}
+    if scaler:
+        index = {c: i for i, c in enumerate(scaler["input_cols"])}
+        for v in columns:
+            i = index[v]
+            columns[v] = (columns[v] - scaler["mean"][i]) / scaler["scale"][i]
+    y = df[target].to_numpy(dtype=np.float64)
+
+    n_eq = len(program.roots)
+    result = {}
+    for split, (lo, hi) in splits.items():
+        stats = _Stats(n_eq)
+        for start in range(lo, hi, chunk_rows):
+            stop = min(start + chunk_rows, hi)
+            chunk = {v: values[start:stop] for v, values in columns.items()}
+            for first in range(0, n_eq, equation_batch):
+                batch = range(first, min(first + equation_batch, n_eq))
+                stats.add(program.evaluate(chunk, stop - start, batch), y[start:stop],
+                          slice(batch.start, batch.stop))
+        result.update(stats.metrics(split))
+    return pd.DataFrame(result)
+
+def _run_setup(run_dir, default):
+    """
+    Feature spec and scaler of a run (None scaler: fit it like the notebook).
+    """
+    config_file, scaler_file = run_dir / "config.json", run_dir / "scaler.json"
+    spec = json.loads(config_file.read_text())["spec"] if config_file.exists() else default
+    scaler = json.loads(scaler_file.read_text()) if scaler_file.exists() else None
+    return spec, scaler
+
+def score_catalogue(table, outputs, default, cache_dir=None, scaled=True):
+    """
+    Scores of the catalogue rows `table`, one compiled batch per
+    (feature spec, scaler) of their runs.
+    """
+    outputs = Path(outputs)
+    groups = {}
+    for rid in table["run_id"].unique():
+        spec, scaler = _run_setup(outputs / rid, default)
+        key = (json.dumps(spec, sort_keys=True), json.dumps(scaler, sort_keys=True))
+        groups.setdefault(key, []).append(rid)
+
+    parts = []
+    for (spec_json, scaler_json), run_ids in groups.items():
+        spec, scaler = json.loads(spec_json), json.loads(scaler_json)
+        rows = table[table["run_id"].isin(run_ids)]
+        df = load_features(spec, cache_dir)
+        target = spec["target"]["column"]
+        if scaled and scaler is None:
+            scaler = fit_scaler(df, df.columns[2:].tolist())
+
+        # equations with other variable names (x1, ... of older runs) are skipped
+        available = set(df.columns)
+        rows = rows[[equation_variables(e) <= available for e in rows["equation"]]]
+        program = compile_equations(rows["equation"])
+
+        metrics = score(program, df, target, scaler if scaled else None)
+        metrics.index = rows.index
+        metrics["error"] = program.errors
+        parts.append(rows[["run_id", "complexity", "loss", "equation"]].join(metrics))
+    return pd.concat(parts).sort_values(["run_id", "complexity"]) if parts else pd.DataFrame()
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the hall of fame equations on the feature matrix.")
+    parser.add_argument("--outputs", type=str, default=str(OUTPUTS),
+                        help="folder of the run directories")
+    parser.add_argument("--input_path", type=str, default=INPUT_PATH,
+                        help="folder of the index CSVs (default spec)")
+    parser.add_argument("--output_path", type=str, default=OUTPUT_PATH,
+                        help="folder of omni2_2000-2024.lst (default spec)")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="folder of the feature matrix cache (default: <input_path>/features)")
+    parser.add_argument("--runs", type=str, default=None,
+                        help="run ids to score, separated by ',' (default: all)")
+    parser.add_argument("--max_complexity", type=int, default=None,
+                        help="largest complexity of the scored equations")
+    parser.add_argument("--raw", action="store_true",
+                        help="evaluate on the unscaled features")
+    parser.add_argument("--output", type=str, default=None,
+                        help="CSV of the scores (default: <outputs>/scores.csv)")
+    args = parser.parse_args()
+
+    catalogue = Catalogue(args.outputs)
+    catalogue.update()
+    table = catalogue.table
+    if args.runs:
+        table = table[table["run_id"].isin([r.strip() for r in args.runs.split(",")])]
+    if args.max_complexity is not None:
+        table = table[table["complexity"] <= args.max_complexity]
+
+    default = default_spec(args.input_path, args.output_path)
+    cache_dir = args.cache_dir or Path(args.input_path) / "features"
+    scores = score_catalogue(table, args.outputs, default, cache_dir, scaled=not args.raw)
+
+    output = Path(args.output) if args.output else Path(args.outputs) / "scores.csv"
+    scores.to_csv(output, index=False)
+    print(f"{len(scores)} equations of {scores['run_id'].nunique()} runs -> {output}")
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(scores.nsmallest(10, "rmse_val")[["run_id", "complexity", "rmse_val", "r_val",
+                                                "skill_val", "equation"]].to_string(index=False))
+
+if __name__ == "__main__":
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\model
+# python evaluate.py
+# python evaluate.py --runs 20250519_111947_Fi7j3w --max_complexity 15
@@ -0,0 +1,271 @@
+"""
+Feature matrix (SR_df) for the symbolic regression of the solar wind speed.
+
+The notebook built SR_df by placing `.shift(6/8/10)` columns of the index
+CSVs next to the OMNI speed, i.e. the rows were aligned by position.  Here
+the matrix is described by a declarative spec
+
+    {
+      "cadence": "12h", "start": "2012-01-01", "end": "2024-12-31 12:00",
+      "sources": {"omni": {"path": "<file>", "window": "12h"}, "CH_193": "<file>", ...},
+      "target":  {"source": "omni", "column": "speed"},
+      "features": [
+        {"source": "CH_193", "column": "A_CH", "name": "A_CH_193", "lags": [72, 96, 120]},
+        {"source": "mag_R5_0", "column": "expansion_factor", "name": "f_s_R5_0",
+         "lags": [72], "suffix": false},
+        ...
+      ],
+      "dropna": true, "limits": {"speed": 2000, "f_s_R5_0": 5000}
+    }
+
+Every source is joined by datetime onto one regular grid, and the lags (in
+hours, multiples of the cadence) of a column are taken from one strided
+view of it (`sliding_window_view`).  A feature `<name>_lag<days>` at time t
+holds the value of t - lag (e.g. A_CH_193_lag3p5 = 84 h before).
+
+A source is a file path (CSV, Parquet or OMNI .lst) or a dict with "path"
+and optionally "columns" (of a .lst file, default ["speed"]) and "window"
+(average an hourly source over the window around each grid time, see
+`omni.resample_omni`; default: the value at the grid time).
+
+The matrix is cached as Parquet, keyed by a hash of the spec and of the
+size / mtime of the input files.
+
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from omni import read_omni, resample_omni
+
+
+TIME_FMT = '%Y-%m-%dT%H:%M:%S'
+
+INPUT_PATH = r"E:\Research\SR\input"
+OUTPUT_PATH = r"E:\Research\SR\output"
+
+
+def default_spec(input_path=INPUT_PATH, output_path=OUTPUT_PATH):
+    """
+    The SR_df of SR_test.ipynb (lag3 / lag4 / lag5 of the CH indices).
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    features = []
+    for r in ["R5_0", "R21_5"]:
+        for column, name in [("expansion_factor", "f_s"), ("coronal_hole_dist", "D_ch"),
+                             ("squashing_factor", "Q")]:
+            features.append({"source": f"mag_{r}", "column": column, "name": f"{name}_{r}",
+                             "lags": [72], "suffix": False})
+    for wave in ["193", "211"]:
+        for column in ["A_CH", "P_CH30", "P_CH90"]:
+            features.append({"source": f"CH_{wave}", "column": column, "name": f"{column}_{wave}",
+                             "lags": [72, 96, 120]})
+    return {
+        "cadence": "12h",
+        "start": "2012-01-01",
+        "end": "2024-12-31 12:00",
+        "sources": {
+            "omni":      str(output_path / "omni2_2000-2024.lst"),
+            "mag_R5_0":  str(input_path / "mag_Indices" / "mag_indices_R5_0.csv"),
+            "mag_R21_5": str(input_path / "mag_Indices" / "mag_indices_R21_5.csv"),
+            "CH_193":    str(input_path / "CH_Indices" / "CH_Indics_193.csv"),
+            "CH_211":    str(input_path / "CH_Indices" / "CH_Indics_211.csv"),
+        },
+        "target": {"source": "omni", "column": "speed"},
+        "features": features,
+        "dropna": True,
+        "limits": {"speed": 2000, "f_s_R5_0": 5000},
+    }
+
+def lag_label(hours):
+    """
+    Lag in days as used in the column names: 72 -> '3', 84 -> '3p5'.
+    """
+    days = hours / 24
+    return f"{days:g}".replace(".", "p")
+
+def feature_names(feature):
+    """
+    Column names of the lags of one spec entry.
+    """
+    name = feature.get("name", feature["column"])
+    if not feature.get("suffix", True):
+        if len(feature["lags"]) != 1:
+            raise ValueError(f"'{name}': suffix=false needs exactly one lag")
+        return [name]
+    return [f"{name}_lag{lag_label(h)}" for h in feature["lags"]]
+
+def _stamp(path):
+    st = os.stat(path)
+    return [str(Path(path).resolve()), st.st_size, st.st_mtime_ns]
+
+def spec_key(spec):
+    """
+    Hash of the spec and of the size / mtime of its input files.
+    """
+    used = {spec["target"]["source"]} | {f["source"] for f in spec["features"]}
+    stamps = {name: _stamp(_source(spec, name)["path"]) for name in sorted(used)}
+    payload = json.dumps({"spec": spec, "inputs": stamps}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def _source(spec, name):
+    source = spec["sources"][name]
+    return {"path": source} if isinstance(source, str) else source
+
+@lru_cache(maxsize=None)
+def _read_source(path, size, mtime_ns, columns):
+    path = Path(path)
+    if path.suffix == ".lst":                   # OMNI: year, doy, hour, <columns>
+        return read_omni(path, columns)
+    elif path.suffix == ".parquet":
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df["datetime"] = pd.to_datetime(df["datetime"]).astype("datetime64[us]")
+    return df
+
+def read_source(path, columns=("speed",)):
+    """
+    Table of one source with a datetime64 'datetime' column (CSV, Parquet or OMNI .lst),
+    read once per process and file version.
+    """
+    st = os.stat(path)
+    return _read_source(str(path), st.st_size, st.st_mtime_ns, tuple(columns))
+
+def source_table(spec, name):
+    """
+    Table of the source `name` of a spec (window averaged if the source has a window).
+    """
+    source = _source(spec, name)
+    df = read_source(source["path"], source.get("columns", ["speed"]))
+    if source.get("window"):
+        df = resample_omni(df, spec["cadence"], source["window"], spec["start"], spec["end"])
+    return df
+
+def make_grid(start, end, cadence):
+    return pd.date_range(start, end, freq=cadence, unit="us")
+
+def on_grid(df, column, grid):
+    """
+    Values of `column` at the grid times (NaN where the source has no row).
+    Duplicated times keep the last row, like the CSV writer.
+    """
+    series = df.drop_duplicates("datetime", keep="last").set_index("datetime")[column]
+    return series.reindex(grid).to_numpy(dtype=np.float64)
+
+def lag_stack(values, lag_rows):
+    """
+    Columns values[i - lag] for every lag (in rows) from one strided view.
+    반환: array (len(values), len(lag_rows)), NaN before the start
+    """
+    max_lag = max(lag_rows)
+    padded = np.concatenate([np.full(max_lag, np.nan), values])
+    windows = sliding_window_view(padded, max_lag + 1)       # windows[i, max_lag - k] = values[i - k]
+    return windows[:, [max_lag - k for k in lag_rows]]
+
+def build_features(spec):
+    """
+    Feature matrix of a spec: datetime, target, then the lagged features.
+    """
+    cadence = pd.Timedelta(spec["cadence"])
+    grid = make_grid(spec["start"], spec["end"], cadence)
+    target = spec["target"]
+
+    columns = {"datetime": grid,
+               target["column"]: on_grid(source_table(spec, target["source"]),
+                                         target["column"], grid)}
+    for feature in spec["features"]:
+        lag_rows = []
+        for hours in feature["lags"]:
+            rows, rest = divmod(pd.Timedelta(hours=hours), cadence)
+            if rest:
+                raise ValueError(f"lag {hours} h of '{feature['column']}' "
+                                 f"is not a multiple of {spec['cadence']}")
+            lag_rows.append(int(rows))
+        values = on_grid(source_table(spec, feature["source"]), feature["column"], grid)
+        stack = lag_stack(values, lag_rows)
+        for i, name in enumerate(feature_names(feature)):
+            if name in columns:
+                raise ValueError(f"duplicate feature name '{name}'")
+            columns[name] = stack[:, i]
+
+    df = pd.DataFrame(columns)
+    if spec.get("dropna", True):
+        df = df.dropna(axis=0, how="any")
+    for column, limit in spec.get("limits", {}).items():
+        df = df[df[column] < limit]
+    return df.reset_index(drop=True)
+
+def load_features(spec, cache_dir=None):
+    """
+    Feature matrix of a spec, from the Parquet cache if the spec and the inputs are unchanged.
+    cache_dir: folder of the cache, None disables it
+    """
+    if cache_dir is None:
+        return build_features(spec)
+
+    cache = Path(cache_dir) / f"features_{spec_key(spec)}.parquet"
+    if cache.exists():
+        return pd.read_parquet(cache)
+
+    df = build_features(spec)
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_name(cache.name + ".tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, cache)
+    cache.with_suffix(".json").write_text(json.dumps(spec, indent=2))
+    return df
+
+def to_csv(df, save_file):
+    """
+    Save a feature matrix like the notebook's modified_SR_data.csv.
+    """
+    out = df.copy()
+    out["datetime"] = out["datetime"].dt.strftime(TIME_FMT)
+    out.to_csv(save_file, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the SR feature matrix from a spec.")
+    parser.add_argument("--spec", type=str, default=None,
+                        help="JSON spec (default: the SR_df of SR_test.ipynb)")
+    parser.add_argument("--input_path", type=str, default=INPUT_PATH,
+                        help="folder of the index CSVs (default spec)")
+    parser.add_argument("--output_path", type=str, default=OUTPUT_PATH,
+                        help="folder of omni2_2000-2024.lst (default spec)")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="folder of the Parquet cache (default: <input_path>/features)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="CSV of the matrix (default: <input_path>/modified_SR_data.csv)")
+    args = parser.parse_args()
+
+    if args.spec:
+        spec = json.loads(Path(args.spec).read_text())
+    else:
+        spec = default_spec(args.input_path, args.output_path)
+
+    cache_dir = args.cache_dir or Path(args.input_path) / "features"
+    df = load_features(spec, cache_dir)
+
+    output = Path(args.output) if args.output else Path(args.input_path) / "modified_SR_data.csv"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    to_csv(df, output)
+    print(f"{len(df)} rows x {df.shape[1] - 2} features -> {output}")
+
+if __name__ == "__main__":
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\model
+# python features.py
+# python features.py --spec lags.json --cache_dir "E:\Research\SR\input\features"
@@ -0,0 +1,161 @@
+"""
+OMNI2 hourly data (omni2_*.lst from OMNIWeb) as a cached columnar table.
+
+The notebook read the .lst file line by line, built a datetime and a string
+for every hour and kept the hours 0 and 12.  `read_omni` parses the whole
+file with the C parser, builds the times from year / DOY / hour in
+datetime64 and replaces the OMNI fill values (9999., 999.9, ...) by NaN.
+The hourly table is cached as Parquet next to the file (keyed by its size
+and mtime), so later loads only read the Parquet file.
+
+`resample_omni` puts the hourly series on a cadence grid, either as point
+samples (the notebook's hours 0 and 12) or as window averages.
+
+"""
+
+import os
+import re
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Fill values of the OMNI2 hourly variables (OMNIWeb column names in lower case)
+FILL_VALUES = {
+    "speed":        9999.,
+    "density":      999.9,
+    "temperature":  9999999.,
+    "b":            999.9,
+    "bx":           999.9,
+    "by":           999.9,
+    "bz":           999.9,
+    "pressure":     99.99,
+    "kp":           99,
+    "dst":          99999,
+}
+
+def read_omni(lst_file, columns=("speed",), cache_dir=None) -> pd.DataFrame:
+    """
+    Hourly OMNI2 table with the columns 'datetime' and `columns`.
+
+    lst_file:  OMNIWeb listing 'year doy hour <columns...>'
+    cache_dir: folder of the Parquet cache (default: next to `lst_file`), False disables it
+    """
+    lst_file = Path(lst_file)
+    st = os.stat(lst_file)
+    columns = list(columns)
+
+    cache = None
+    if cache_dir is not False:
+        cache_dir = Path(cache_dir) if cache_dir else lst_file.parent
+        tag = "-".join(columns)
+        cache = cache_dir / f"{lst_file.stem}.{tag}.{st.st_size}_{st.st_mtime_ns}.parquet"
+        if cache.exists():
+            return pd.read_parquet(cache)
+
+    dtypes = {"year": "int32", "doy": "int32", "hour": "int32", **{c: "float64" for c in columns}}
+    raw = pd.read_csv(lst_file, sep=r'\s+', header=None, engine='c',
+                      names=list(dtypes), dtype=dtypes)
+
+    # year / DOY / hour -> datetime64 without any python datetime
+    years = (raw["year"].to_numpy() - 1970).astype("datetime64[Y]")
+    times = (years.astype("datetime64[h]")
+             + (raw["doy"].to_numpy() - 1).astype("timedelta64[D]")
+             + raw["hour"].to_numpy().astype("timedelta64[h]"))
+
+    omni_df = pd.DataFrame({"datetime": times.astype("datetime64[us]")})
+    for column in columns:
+        values = raw[column].to_numpy()
+        fill = FILL_VALUES.get(column.lower())
+        if fill is not None:
+            values = np.where(values >= fill, np.nan, values)
+        omni_df[column] = values
+
+    if cache is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_name(cache.name + ".tmp")
+        omni_df.to_parquet(tmp, index=False)
+        os.replace(tmp, cache)
+        # drop the caches of older versions of the file
+        pattern = rf"{re.escape(lst_file.stem)}\.{re.escape(tag)}\.\d+_\d+\.parquet"
+        for old in cache_dir.glob(f"{lst_file.stem}.{tag}.*_*.parquet"):
+            if old != cache and re.fullmatch(pattern, old.name):
+                old.unlink(missing_ok=True)
+    return omni_df
+
+def resample_omni(omni_df, cadence="12h", window=None, start=None, end=None, min_count=1):
+    """
+    OMNI values on a regular grid of `cadence`.
+
+    window: None -> the hourly value at each grid time (point sample)
+            e.g. '12h' -> mean of the hours in [t - window/2, t + window/2)
+    min_count: fewest valid hours of a window mean (fewer -> NaN)
+
+    The means use cumulative sums over the hourly grid, O(N) for any window.
+    """
+    start = pd.Timestamp(start) if start is not None else omni_df["datetime"].iloc[0]
+    end = pd.Timestamp(end) if end is not None else omni_df["datetime"].iloc[-1]
+    grid = pd.date_range(start, end, freq=cadence, unit="us")
+    columns = [c for c in omni_df.columns if c != "datetime"]
+    hourly = omni_df.drop_duplicates("datetime", keep="last").set_index("datetime")[columns]
+
+    if window is None:
+        return hourly.reindex(grid).rename_axis("datetime").reset_index()
+
+    half = pd.Timedelta(window) / 2
+    hours = pd.date_range(start - half, end + half, freq="h", unit="us")
+    hourly = hourly.reindex(hours)
+    # window of grid time t: hours[lo:hi] with lo = t - half, hi = t + half
+    lo = hours.searchsorted(grid - half)
+    hi = hours.searchsorted(grid + half)
+
+    out = pd.DataFrame({"datetime": grid})
+    for column in columns:
+        values = hourly[column].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        total = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+        count = np.concatenate([[0], np.cumsum(valid)])
+        n = count[hi] - count[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[column] = np.where(n >= min_count, (total[hi] - total[lo]) / n, np.nan)
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and cache an OMNI2 hourly listing.")
+    parser.add_argument("--lst_file", type=str,
+                        default=r"E:\Research\SR\output\omni2_2000-2024.lst",
+                        help="OMNIWeb listing 'year doy hour <columns...>'")
+    parser.add_argument("--columns", type=str, default="speed",
+                        help="names of the data columns, separated by ','")
+    parser.add_argument("--cadence", type=str, default="12h",
+                        help="cadence of the output")
+    parser.add_argument("--window", type=str, default=None,
+                        help="window of the averages (default: point samples)")
+    parser.add_argument("--start", type=str, default="2012-01-01",
+                        help="first time of the output")
+    parser.add_argument("--end", type=str, default="2024-12-31 12:00",
+                        help="last time of the output")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Parquet file of the resampled series")
+    args = parser.parse_args()
+
+    omni_df = read_omni(args.lst_file, [c.strip() for c in args.columns.split(",")])
+    print(f"{len(omni_df)} hours: {omni_df['datetime'].iloc[0]} - {omni_df['datetime'].iloc[-1]}")
+
+    if args.output:
+        out = resample_omni(omni_df, args.cadence, args.window, args.start, args.end)
+        out.to_parquet(args.output, index=False)
+        print(f"{len(out)} rows -> {args.output}")
+
+if __name__ == "__main__":
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\model
+# python omni.py
+# python omni.py --cadence 12h --window 12h --output "E:\Research\SR\output\omni_speed_12h.parquet"
@@ -0,0 +1,290 @@
+"""
+Run a grid of PySR symbolic-regression experiments, resumably.
+
+A JSON config gives the feature spec, the base PySRRegressor settings and a
+grid of overrides; every combination of the grid values is one experiment:
+
+    {
+      "features": {"spec": "lags.json", "cache_dir": "E:/Research/SR/input/features"},
+      "base": {"niterations": 100, "population_size": 1000, "populations": 20,
+               "binary_operators": ["+", "-", "*", "/", "pow"],
+               "unary_operators": ["inv", "log", "exp", "sqrt"],
+               "maxsize": 30, "random_state": 0},
+      "grid": {
+        "inputs":          [["A_CH_193_*", "D_ch_R5_0"], ["*"]],
+        "lags":            [[72, 96, 120], [72]],
+        "unary_operators": [["inv", "log"], ["inv", "log", "exp", "sqrt"]],
+        "maxsize":         [20, 30]
+      }
+    }
+
+`inputs` are fnmatch patterns over the feature columns, `lags` (hours)
+replace the lags of every lag-suffixed feature of the spec, the other keys
+are PySRRegressor parameters.  The run id of an experiment is the hash of
+its resolved config, so the output directory `<outputs>/<run id>` of a
+config never changes:
+
+    config.json      the resolved config
+    scaler.json      StandardScaler mean / scale of the inputs (train split)
+    checkpoint.pkl   written by PySR, an interrupted run resumes from it
+    hall_of_fame.csv written by PySR
+
+PySR is fitted in chunks of `ITERATION_CHUNK` iterations (warm start), and
+`<outputs>/manifest.jsonl` gets a 'running' line with the completed
+iterations after every chunk, so a resumed run only does the remaining
+iterations.  Every finished (or failed) run gets a last line; runs whose
+last line is 'done' are skipped when the sweep is started again.
+
+"""
+
+import os
+import json
+import time
+import fnmatch
+import hashlib
+import argparse
+import itertools
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from features import default_spec, load_features, spec_key
+
+
+OUTPUTS = Path(__file__).resolve().parent / "outputs"
+
+BASE_SETTINGS = {
+    "niterations": 100,
+    "population_size": 1000,
+    "populations": 20,
+    "binary_operators": ["+", "-", "*", "/", "pow"],
+    "unary_operators": ["inv", "log", "exp", "sqrt"],
+    "maxsize": 30,
+    "select_k_features": 0,
+    "model_selection": "best",
+    "random_state": 0,
+}
+
+FEATURE_KEYS = ("inputs", "lags")       # grid keys handled here, not by PySR
+
+ITERATION_CHUNK = 10                    # iterations between two manifest progress lines
+
+
+def expand_grid(config):
+    """
+    Resolved configs of every combination of the grid values.
+    반환: list of dict {"spec", "inputs", "test_size", "pysr"}
+    """
+    features = config.get("features", {})
+    if features.get("spec"):
+        spec = json.loads(Path(features["spec"]).read_text())
+    else:
+        spec = default_spec(**{k: features[k] for k in ("input_path", "output_path")
+                               if k in features})
+    base = {**BASE_SETTINGS, **config.get("base", {})}
+    grid = config.get("grid", {})
+
+    configs = []
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        point = dict(zip(keys, values))
+        run_spec = json.loads(json.dumps(spec))
+        if "lags" in point:
+            for feature in run_spec["features"]:
+                if feature.get("suffix", True):
+                    feature["lags"] = list(point["lags"])
+        configs.append({
+            "spec": run_spec,
+            "inputs": list(point.get("inputs", ["*"])),
+            "test_size": config.get("test_size", 0.2),
+            "pysr": {**base, **{k: v for k, v in point.items() if k not in FEATURE_KEYS}},
+        })
+    return configs
+
+def config_hash(config):
+    """
+    Hash of a resolved config (key order does not matter).
+    """
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def run_id(config):
+    return config_hash(config)[:12]
+
+def select_inputs(columns, patterns):
+    """
+    Feature columns matching any of the fnmatch patterns, in matrix order.
+    """
+    selected = [c for c in columns if any(fnmatch.fnmatchcase(c, p) for p in patterns)]
+    if not selected:
+        raise ValueError(f"no feature matches {patterns}")
+    return selected
+
+def read_manifest(outputs):
+    """
+    Last manifest record of every run id.
+    """
+    path = Path(outputs) / "manifest.jsonl"
+    records = {}
+    if path.exists():
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["run_id"]] = record
+    return records
+
+def append_manifest(outputs, record):
+    with open(Path(outputs) / "manifest.jsonl", "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def completed_iterations(outputs, rid):
+    """
+    Iterations of a run recorded in the manifest (last progress line), 0 if none.
+    """
+    path = Path(outputs) / "manifest.jsonl"
+    done = 0
+    if path.exists():
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record["run_id"] == rid and "iterations" in record:
+                        done = record["iterations"]
+    return done
+
+def run_experiment(config, outputs, cache_dir=None, procs=None):
+    """
+    Fit one config (resuming from its checkpoint.pkl if it exists) in chunks of
+    `ITERATION_CHUNK` iterations, with a manifest progress line after each chunk.
+    반환: manifest record
+    """
+    from pysr import PySRRegressor
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    rid = run_id(config)
+    run_dir = Path(outputs) / rid
+    run_dir.mkdir(parents=True, exist_ok=True)
+    (run_dir / "config.json").write_text(json.dumps(config, indent=2))
+    started = datetime.now().isoformat(timespec='seconds')
+    t0 = time.perf_counter()
+
+    df = load_features(config["spec"], cache_dir)
+    input_cols = select_inputs(df.columns[2:].tolist(), config["inputs"])
+    target = config["spec"]["target"]["column"]
+
+    X_train, X_val, y_train, y_val = train_test_split(
+        df[input_cols], df[target], test_size=config["test_size"], shuffle=False,
+    )
+    scaler = StandardScaler().fit(X_train)
+    (run_dir / "scaler.json").write_text(json.dumps({
+        "input_cols": input_cols,
+        "mean": scaler.mean_.tolist(),
+        "scale": scaler.scale_.tolist(),
+        "n_train": len(X_train),
+        "n_val": len(X_val),
+    }, indent=2))
+
+    total = config["pysr"]["niterations"]
+    resumed = (run_dir / "checkpoint.pkl").exists()
+    if resumed:
+        model = PySRRegressor.from_file(run_directory=str(run_dir))
+        if procs is not None:
+            model.set_params(procs=procs)
+        done = min(completed_iterations(outputs, rid), total)
+    else:
+        settings = dict(config["pysr"])
+        if procs is not None:
+            settings["procs"] = procs
+        model = PySRRegressor(**settings, output_directory=str(Path(outputs)), run_id=rid)
+        done = 0
+
+    X = scaler.transform(X_train)
+    while done < total:
+        step = min(ITERATION_CHUNK, total - done)
+        model.set_params(niterations=step, warm_start=True)
+        model.fit(X, y_train, variable_names=input_cols)
+        done += step
+        append_manifest(outputs, {"run_id": rid, "status": "running", "iterations": done,
+                                  "time": datetime.now().isoformat(timespec='seconds')})
+    best = model.get_best()
+
+    return {
+        "run_id": rid,
+        "config_hash": config_hash(config),
+        "features_key": spec_key(config["spec"]),
+        "output_dir": str(run_dir),
+        "status": "done",
+        "resumed": resumed,
+        "iterations": done,
+        "started": started,
+        "duration_s": round(time.perf_counter() - t0, 1),
+        "n_inputs": len(input_cols),
+        "best_equation": str(best["equation"]),
+        "best_loss": float(best["loss"]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a grid of PySR experiments.")
+    parser.add_argument("--config", type=str, required=True,
+                        help="JSON config with 'features', 'base' and 'grid'")
+    parser.add_argument("--outputs", type=str, default=str(OUTPUTS),
+                        help="folder of the run directories and manifest.jsonl")
+    parser.add_argument("--cache_dir", type=str, default=None,
+                        help="folder of the feature matrix cache (default: from the config)")
+    parser.add_argument("--max_concurrent", type=int, default=2,
+                        help="number of runs at the same time")
+    parser.add_argument("--procs", type=int, default=None,
+                        help="PySR processes per run (default: cpu count // max_concurrent)")
+    parser.add_argument("--dry_run", action="store_true",
+                        help="only list the runs to do")
+    args = parser.parse_args()
+
+    config = json.loads(Path(args.config).read_text())
+    cache_dir = args.cache_dir or config.get("features", {}).get("cache_dir")
+    outputs = Path(args.outputs)
+    outputs.mkdir(parents=True, exist_ok=True)
+    procs = args.procs or max(1, (os.cpu_count() or 1) // args.max_concurrent)
+
+    configs = expand_grid(config)
+    done = {rid for rid, record in read_manifest(outputs).items() if record["status"] == "done"}
+    todo = [c for c in configs if run_id(c) not in done]
+    print(f"{len(configs)} configs, {len(configs) - len(todo)} done, {len(todo)} to run")
+    if args.dry_run:
+        for c in todo:
+            print(run_id(c), c["inputs"], {k: c["pysr"][k] for k in config.get("grid", {})
+                                           if k in c["pysr"]})
+        return
+
+    # Build every feature matrix once before the workers read the cache
+    if cache_dir is not None:
+        for spec in {json.dumps(c["spec"], sort_keys=True) for c in todo}:
+            load_features(json.loads(spec), cache_dir)
+
+    with ProcessPoolExecutor(max_workers=args.max_concurrent) as executor:
+        futures = {executor.submit(run_experiment, c, outputs, cache_dir, procs): c
+                   for c in todo}
+        for future in as_completed(futures):
+            c = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = {"run_id": run_id(c), "config_hash": config_hash(c),
+                          "output_dir": str(outputs / run_id(c)), "status": "error",
+                          "error": f"{type(e).__name__}: {e}"}
+            record["finished"] = datetime.now().isoformat(timespec='seconds')
+            append_manifest(outputs, record)
+            print(f"{record['run_id']}: {record['status']}"
+                  + (f" ({record['error']})" if record["status"] == "error" else ""))
+
+if __name__ == "__main__":
+    main()
+
+
+# To run this script, you can use the command line as follows:
+
+# conda activate venv
+# cd Research\SR_SWspeed\model
+# python run_experiments.py --config sweep.json --dry_run
+# python run_experiments.py --config sweep.json --max_concurrent 4 --procs 4
@@ -0,0 +1,8 @@
+"""
+The model modules import each other as flat scripts (`from features import ...`),
+so the tests put the module folder on sys.path.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
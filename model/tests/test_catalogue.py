@@ -0,0 +1,34 @@
+import pandas as pd
+
+from catalogue import Catalogue
+
+
+def write_hall_of_fame(outputs, rid, rows):
+    run_dir = outputs / rid
+    run_dir.mkdir(parents=True)
+    pd.DataFrame(rows, columns=["Complexity", "Loss", "Equation"]).to_csv(
+        run_dir / "hall_of_fame.csv", index=False)
+
+
+def test_update_and_query_on_a_new_directory(tmp_path):
+    catalogue = Catalogue(tmp_path)
+    assert catalogue.update() == (0, 0)
+    assert catalogue.query(max_complexity=10).empty
+    assert catalogue.pareto_front().empty
+
+    write_hall_of_fame(tmp_path, "run_a", [(1, 9.0, "A_CH_193_lag3"),
+                                           (5, 4.0, "A_CH_193_lag3 * exp(P_CH30_211_lag4)")])
+    write_hall_of_fame(tmp_path, "run_b", [(3, 5.0, "inv(D_ch_R5_0)"),
+                                           (12, 1.0, "A_CH_193_lag4 + D_ch_R5_0")])
+    assert catalogue.update() == (2, 0)
+    assert catalogue.table["loss"].dtype == "float64"
+    assert catalogue.table["complexity"].dtype == "int64"
+
+    best = catalogue.query(max_complexity=10, uses=["A_CH_193"], top=1)
+    assert best[["run_id", "complexity", "loss"]].values.tolist() == [["run_a", 5, 4.0]]
+    assert catalogue.query(excludes=["A_CH*"])["equation"].tolist() == ["inv(D_ch_R5_0)"]
+    assert catalogue.pareto_front()["loss"].tolist() == [9.0, 5.0, 4.0, 1.0]
+
+    reopened = Catalogue(tmp_path)
+    assert reopened.update() == (0, 0)
+    assert reopened.query(runs=["run_b"])["loss"].tolist() == [1.0, 5.0]
@@ -0,0 +1,61 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from evaluate import compile_equations, score
+
+
+EQUATIONS = [
+    "x1 * 2.0 + 1.0",
+    "inv(x1 - x1)",                     # division by zero everywhere
+    "log(x2)",                          # NaN for the negative rows
+    "exp(exp(x1 * 10.0))",              # overflow for the large rows
+    "x1 ^ 400.0",                       # finite values whose square overflows
+    "3.0",                              # constant
+    "foo((x1",                          # not parsed
+    "x1 * x2 + inv(x1 - x1) * 0.0",
+]
+
+
+def feature_matrix(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    x1 = rng.normal(0, 1, n)
+    x2 = rng.normal(0.5, 1, n)
+    return pd.DataFrame({"datetime": pd.date_range("2016-01-01", periods=n, freq="12h"),
+                         "speed": 400 + 50 * x1 + rng.normal(0, 5, n), "x1": x1, "x2": x2})
+
+
+def test_score_is_silent_and_counts_nonfinite_predictions():
+    df = feature_matrix()
+    program = compile_equations(EQUATIONS)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        scores = score(program, df, "speed", chunk_rows=128, equation_batch=3)
+
+    n_train, n_val = 800, 200
+    assert scores.loc[0, "invalid_train"] == 0
+    assert scores.loc[1, "invalid_train"] == n_train
+    assert scores.loc[2, "invalid_train"] == np.sum(df["x2"].to_numpy()[:n_train] <= 0)
+    assert 0 < scores.loc[3, "invalid_train"] < n_train
+    assert scores.loc[6, "invalid_val"] == n_val
+    assert scores.loc[7, "invalid_val"] == n_val
+    assert np.isnan(scores.loc[5, "r_train"])
+    assert scores["invalid_train"].dtype == np.int64
+
+
+@pytest.mark.parametrize("chunk_rows, equation_batch", [(1000, 1000), (64, 1), (100, 3)])
+def test_blocks_do_not_change_the_scores(chunk_rows, equation_batch):
+    df = feature_matrix()
+    program = compile_equations(EQUATIONS)
+    expected = score(program, df, "speed", chunk_rows=4096, equation_batch=len(EQUATIONS))
+    scores = score(program, df, "speed", chunk_rows=chunk_rows, equation_batch=equation_batch)
+    pd.testing.assert_frame_equal(scores, expected, rtol=1e-9)
+
+
+def test_evaluate_only_the_requested_equations():
+    program = compile_equations(["x1 + 1.0", "log(x1)", "x1 * x1"])
+    x1 = np.array([1.0, 4.0])
+    values = program.evaluate({"x1": x1}, 2, [2, 0])
+    np.testing.assert_array_equal(values, [x1 * x1, x1 + 1.0])
@@ -0,0 +1,12 @@
+from run_experiments import append_manifest, completed_iterations, read_manifest
+
+
+def test_completed_iterations_survive_an_error_record(tmp_path):
+    assert completed_iterations(tmp_path, "abc") == 0
+    for done in (10, 20):
+        append_manifest(tmp_path, {"run_id": "abc", "status": "running", "iterations": done})
+    append_manifest(tmp_path, {"run_id": "other", "status": "running", "iterations": 90})
+    append_manifest(tmp_path, {"run_id": "abc", "status": "error", "error": "killed"})
+
+    assert completed_iterations(tmp_path, "abc") == 20
+    assert read_manifest(tmp_path)["abc"]["status"] == "error"